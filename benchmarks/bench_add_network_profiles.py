@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+Benchmark adding network profiles one by one with add_network_profile()
+against add_network_profiles(), with a FakeWpaSupplicant served by a
+child process, as wpa_supplicant is. Run from the top directory with:
+
+    python -m benchmarks.bench_add_network_profiles
+"""
+
+import multiprocessing
+import os
+import tempfile
+import time
+
+from pywifi import const, _wifiutil_linux
+from pywifi.profile import Profile
+from pywifi.testing import FakeWpaSupplicant
+
+
+def make_profiles(count):
+
+    profiles = []
+    for i in range(count):
+        profile = Profile()
+        profile.ssid = 'testap{}'.format(i)
+        profile.akm.append(const.AKM_TYPE_WPA2PSK)
+        profile.key = 'passphrase{}'.format(i)
+        profiles.append(profile)
+
+    return profiles
+
+
+def bench(util, iface, add, count):
+
+    best = None
+    for _ in range(3):
+        util.remove_all_network_profiles(iface)
+        profiles = make_profiles(count)
+        start = time.time()
+        add(profiles)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def serve(ctrl_iface_dir, stop):
+
+    with FakeWpaSupplicant(ctrl_iface_dir=ctrl_iface_dir):
+        stop.wait()
+
+
+def main():
+
+    ctrl_iface_dir = tempfile.mkdtemp(prefix='pywifi_')
+    stop = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve,
+                                     args=(ctrl_iface_dir, stop))
+    server.start()
+    while not os.listdir(ctrl_iface_dir):
+        time.sleep(0.01)
+
+    _wifiutil_linux.CTRL_IFACE_DIR = ctrl_iface_dir
+    util = _wifiutil_linux.WifiUtil()
+    iface = util.interfaces()[0]
+
+    def add_serially(profiles):
+        for profile in profiles:
+            util.add_network_profile(iface, profile)
+
+    def add_in_bulk(profiles):
+        util.add_network_profiles(iface, profiles)
+
+    print('{:>9} {:>13} {:>13} {:>8}'.format(
+        'profiles', 'serial prof/s', 'bulk prof/s', 'speedup'))
+    for count in [10, 100, 500]:
+        serial = bench(util, iface, add_serially, count)
+        bulk = bench(util, iface, add_in_bulk, count)
+        print('{:>9} {:>13.0f} {:>13.0f} {:>7.1f}x'.format(
+            count, count / serial, count / bulk, serial / bulk))
+
+    stop.set()
+    server.join()
+    os.rmdir(ctrl_iface_dir)
+
+
+if __name__ == '__main__':
+    main()
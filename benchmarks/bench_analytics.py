@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+Benchmark the NumPy analytics against Python loops over ScanResults.
+
+A history of one scan per second of APs is analysed for the best mean
+signal of each frequency over the last minute. Run from the top
+directory with:
+
+    python -m benchmarks.bench_analytics
+"""
+
+import random
+import timeit
+
+from pywifi.analytics import ScanFrame, best_signal, interference_scores
+from pywifi.profile import ScanResult
+
+FREQS = [2412 + 5 * i for i in range(13)] + [5180 + 20 * i for i in range(8)]
+SCANS = 600
+WINDOW = 60
+
+
+def make_history(count):
+
+    rand = random.Random(0)
+    freqs = [rand.choice(FREQS) for _ in range(count)]
+    history = []
+    for t in range(SCANS):
+        history.append((t, [ScanResult('00:11:22:33:{:02x}:{:02x}'.format(
+            i // 256, i % 256), 'ap{}'.format(i), freqs[i],
+            rand.randint(-90, -40)) for i in range(count)]))
+
+    return history
+
+
+def loop_best_signal(history):
+
+    sums = {}
+    latest = history[-1][0]
+    for timestamp, bsses in history:
+        if timestamp < latest - WINDOW:
+            continue
+        for bss in bsses:
+            total = sums.setdefault(bss.bssid, [bss.freq, 0, 0])
+            total[0] = bss.freq
+            total[1] += bss.signal
+            total[2] += 1
+
+    best = {}
+    for freq, total, count in sums.values():
+        best[freq] = max(best.get(freq, -1000), total / float(count))
+
+    return best
+
+
+def main():
+
+    print('{:>6} {:>8} {:>12} {:>12} {:>8} {:>14}'.format(
+        'APs', 'rows', 'loop ms', 'numpy ms', 'speedup', 'interf. ms'))
+
+    for count in [100, 300, 1000]:
+        history = make_history(count)
+        frame = ScanFrame()
+        for timestamp, bsses in history:
+            frame.append(bsses, timestamp)
+        frame.columns()
+
+        loop = min(timeit.repeat(lambda: loop_best_signal(history),
+                                 number=3, repeat=3)) / 3
+        vectorised = min(timeit.repeat(
+            lambda: best_signal(frame, window=WINDOW),
+            number=3, repeat=3)) / 3
+        interference = min(timeit.repeat(
+            lambda: interference_scores(frame, window=WINDOW),
+            number=3, repeat=3)) / 3
+
+        print('{:>6} {:>8} {:>12.2f} {:>12.2f} {:>7.1f}x {:>14.2f}'.format(
+            count, len(frame), loop * 1e3, vectorised * 1e3,
+            loop / vectorised, interference * 1e3))
+
+
+if __name__ == '__main__':
+    main()
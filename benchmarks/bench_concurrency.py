@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+Benchmark the requests to one control socket shared by threads, with a
+FakeWpaSupplicant served by a child process, as wpa_supplicant is.
+
+Every reply is checked against its cmd, so a reply taken by another
+thread is reported as a mix-up. Run from the top directory with:
+
+    python -m benchmarks.bench_concurrency
+"""
+
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from pywifi import _wifiutil_linux
+from pywifi.testing import FakeWpaSupplicant
+
+NETWORKS = 32
+REQUESTS = 4000
+
+
+def serve(ctrl_iface_dir, stop):
+
+    with FakeWpaSupplicant(ctrl_iface_dir=ctrl_iface_dir) as wpas:
+        for i in range(NETWORKS):
+            wpas.add_network('testap{}'.format(i))
+        stop.wait()
+
+
+def worker(util, iface, n, number, mixups):
+
+    for i in range(number):
+        network_id = (n + i) % NETWORKS
+        reply = util._send_cmd_to_wpas(
+            iface['name'], 'GET_NETWORK {} ssid'.format(network_id), True)
+        if reply != '"testap{}"'.format(network_id):
+            mixups.append(reply)
+
+
+def main():
+
+    ctrl_iface_dir = tempfile.mkdtemp(prefix='pywifi_')
+    stop = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve,
+                                     args=(ctrl_iface_dir, stop))
+    server.start()
+    while not os.listdir(ctrl_iface_dir):
+        time.sleep(0.01)
+
+    _wifiutil_linux.CTRL_IFACE_DIR = ctrl_iface_dir
+    util = _wifiutil_linux.WifiUtil()
+    iface = util.interfaces()[0]
+
+    print('{:>8} {:>12} {:>8}'.format('threads', 'requests/s', 'mix-ups'))
+    for count in [1, 2, 4, 8, 16, 32]:
+        mixups = []
+        threads = [threading.Thread(
+            target=worker, args=(util, iface, n, REQUESTS // count, mixups))
+            for n in range(count)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+        print('{:>8} {:>12.0f} {:>8}'.format(
+            count, REQUESTS // count * count / elapsed, len(mixups)))
+
+    stop.set()
+    server.join()
+    os.rmdir(ctrl_iface_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+Benchmark WifiUtil.network_profiles() against a FakeWpaSupplicant served
+by a child process, as wpa_supplicant is.
+
+The pipelined retrieval is compared with the one-cmd-per-round-trip
+retrieval (PIPELINE_DEPTH = 1). The fake handles one command at a time
+like wpa_supplicant, so with a latency per command pipelining only saves
+the round trips between the commands. Run from the top directory with:
+
+    python -m benchmarks.bench_network_profiles
+"""
+
+import multiprocessing
+import os
+import tempfile
+import time
+import timeit
+
+from pywifi import _wifiutil_linux
+from pywifi.testing import FakeWpaSupplicant
+
+
+# The seconds wpa_supplicant takes to handle a command.
+LATENCIES = [0, 0.0002]
+
+
+def bench(util, iface, depth, number):
+
+    _wifiutil_linux.PIPELINE_DEPTH = depth
+    # network_profiles() answers from its cache after the first call, so
+    # the uncached retrieval is measured.
+    return min(timeit.repeat(
+        lambda: util._list_network_profiles(iface['name']),
+        number=number, repeat=3)) / number
+
+
+def serve(ctrl_iface_dir, count, latency, stop):
+
+    with FakeWpaSupplicant(ctrl_iface_dir=ctrl_iface_dir,
+                           latency=latency) as wpas:
+        for i in range(count):
+            wpas.add_network('testap{}'.format(i),
+                             key_mgmt='WPA-PSK', proto='RSN')
+        stop.wait()
+
+
+def main():
+
+    default_depth = _wifiutil_linux.PIPELINE_DEPTH
+    print('{:>10} {:>9} {:>16} {:>16} {:>8}'.format(
+        'latency us', 'networks', 'serial prof/s', 'pipelined prof/s',
+        'speedup'))
+
+    for latency, count in [(latency, count) for latency in LATENCIES
+                           for count in [10, 100, 500]]:
+        ctrl_iface_dir = tempfile.mkdtemp(prefix='pywifi_')
+        stop = multiprocessing.Event()
+        server = multiprocessing.Process(
+            target=serve, args=(ctrl_iface_dir, count, latency, stop))
+        server.start()
+        while not os.listdir(ctrl_iface_dir):
+            time.sleep(0.01)
+
+        _wifiutil_linux.CTRL_IFACE_DIR = ctrl_iface_dir
+        util = _wifiutil_linux.WifiUtil()
+        iface = util.interfaces()[0]
+        number = max(1, 1000 // count)
+
+        serial = bench(util, iface, 1, number)
+        pipelined = bench(util, iface, default_depth, number)
+        _wifiutil_linux.PIPELINE_DEPTH = default_depth
+        # The next server listens on another socket.
+        _wifiutil_linux._close_connections()
+
+        stop.set()
+        server.join()
+        os.rmdir(ctrl_iface_dir)
+
+        print('{:>10.0f} {:>9} {:>16.0f} {:>16.0f} {:>7.1f}x'.format(
+            latency * 1e6, count, count / serial, count / pipelined, serial / pipelined))
+
+
+if __name__ == '__main__':
+    main()
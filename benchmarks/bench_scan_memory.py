@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+Measure the memory taken by a scan history of Profile and ScanResult.
+
+Run from the top directory with:
+
+    python -m benchmarks.bench_scan_memory
+"""
+
+import tracemalloc
+
+from pywifi import const
+from pywifi.profile import Profile, ScanResult, akm_to_mask
+
+
+def make_profile(i):
+
+    bss = Profile()
+    bss.bssid = '00:11:22:33:{:02x}:{:02x}'.format(i // 256 % 256, i % 256)
+    bss.ssid = 'ap{}'.format(i % 1000)
+    bss.freq = 2412
+    bss.signal = -40 - i % 50
+    bss.akm = [const.AKM_TYPE_WPA2PSK]
+    bss.cipher = const.CIPHER_TYPE_CCMP
+
+    return bss
+
+
+def make_scan_result(i):
+
+    return ScanResult('00:11:22:33:{:02x}:{:02x}'.format(i // 256 % 256,
+                                                        i % 256),
+                      'ap{}'.format(i % 1000), 2412, -40 - i % 50,
+                      akm_to_mask([const.AKM_TYPE_WPA2PSK]),
+                      const.CIPHER_TYPE_CCMP)
+
+
+def measure(factory, count):
+    """Return the bytes per record of count records made by factory."""
+
+    tracemalloc.start()
+    records = [factory(i) for i in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+
+    return size / count
+
+
+def main():
+
+    print('{:>8} {:>14} {:>14} {:>8}'.format(
+        'records', 'Profile B/rec', 'ScanResult B/rec', 'ratio'))
+
+    for count in [1000, 10000, 100000]:
+        profile = measure(make_profile, count)
+        scan_result = measure(make_scan_result, count)
+        print('{:>8} {:>14.0f} {:>16.0f} {:>7.2f}x'.format(
+            count, profile, scan_result, profile / scan_result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+Benchmark the SCAN_RESULTS parser against the previous str based one.
+
+Run from the top directory with:
+
+    python -m benchmarks.bench_scan_parse
+"""
+
+import timeit
+
+from pywifi import _wifiutil_linux
+from pywifi.const import *
+from pywifi.profile import Profile
+
+
+FLAGS = [
+    '[WPA2-PSK-CCMP][WPS][ESS]',
+    '[WPA-PSK-CCMP+TKIP][WPA2-PSK-CCMP+TKIP][ESS]',
+    '[WPA2-EAP-CCMP][ESS]',
+    '[ESS]',
+]
+
+
+def scan_results_reply(count):
+    """Build a SCAN_RESULTS reply with count BSSes."""
+
+    reply = 'bssid / frequency / signal level / flags / ssid\n'
+    for i in range(count):
+        reply += '00:11:22:33:{:02x}:{:02x}\t{}\t{}\t{}\tap{}\n'.format(
+            i // 256, i % 256, 2412 + i % 13 * 5, -40 - i % 50,
+            FLAGS[i % len(FLAGS)], i)
+
+    return reply.encode('utf-8')
+
+
+def legacy_parse_scan_results(reply):
+    """The str based parser used before."""
+
+    bsses = []
+    bsses_summary = bytes(reply).decode('utf-8')[:-1].split('\n')
+    if len(bsses_summary) == 1:
+        return bsses
+
+    for l in bsses_summary[1:]:
+        values = l.split('\t')
+        bss = Profile()
+        bss.bssid = values[0]
+        bss.freq = int(values[1])
+        bss.signal = int(values[2])
+        bss.ssid = values[4]
+        bss.akm = []
+        if 'WPA-PSK' in values[3]:
+            bss.akm.append(AKM_TYPE_WPAPSK)
+        if 'WPA2-PSK' in values[3]:
+            bss.akm.append(AKM_TYPE_WPA2PSK)
+        if 'WPA-EAP' in values[3]:
+            bss.akm.append(AKM_TYPE_WPA)
+        if 'WPA2-EAP' in values[3]:
+            bss.akm.append(AKM_TYPE_WPA2)
+
+        bss.auth = AUTH_ALG_OPEN
+
+        bsses.append(bss)
+
+    return bsses
+
+
+def bench(func, reply, number):
+
+    return min(timeit.repeat(lambda: func(reply),
+                             number=number, repeat=5)) / number
+
+
+def main():
+
+    print('{:>6} {:>12} {:>12} {:>8}'.format(
+        'bsses', 'legacy us', 'current us', 'speedup'))
+
+    for count in [10, 100, 1000]:
+        reply = memoryview(scan_results_reply(count))
+        number = max(10, 10000 // count)
+
+        legacy = bench(legacy_parse_scan_results, reply, number)
+        current = bench(_wifiutil_linux.parse_scan_results, reply, number)
+
+        print('{:>6} {:>12.1f} {:>12.1f} {:>7.2f}x'.format(
+            count, legacy * 1e6, current * 1e6, legacy / current))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+Benchmark ScanTable.ingest() and measure the memory of its entries.
+
+A survey of BSSes is ingested in scans of 100 BSSes with jittering
+signals, while the table holds up to capacity BSSes. Run from the top
+directory with:
+
+    python -m benchmarks.bench_scan_table
+"""
+
+import random
+import time
+import tracemalloc
+
+from pywifi import const
+from pywifi.profile import ScanResult, akm_to_mask
+from pywifi.scan import ScanTable
+
+SCAN_SIZE = 100
+SCANS = 2000
+
+
+def make_scan(rand, count):
+
+    scan = []
+    for i in rand.sample(range(count), SCAN_SIZE):
+        scan.append(ScanResult(
+            '00:11:{:02x}:{:02x}:{:02x}:{:02x}'.format(
+                i >> 24 & 255, i >> 16 & 255, i >> 8 & 255, i & 255),
+            'ap{}'.format(i), 2412 + i % 13 * 5, -40 - i % 50 +
+            rand.randint(-8, 8), akm_to_mask([const.AKM_TYPE_WPA2PSK]),
+            const.CIPHER_TYPE_CCMP))
+
+    return scan
+
+
+def main():
+
+    print('{:>8} {:>9} {:>10} {:>10} {:>9} {:>10}'.format(
+        'BSSes', 'capacity', 'ingests/s', 'us/BSS', 'changes', 'B/entry'))
+
+    rand = random.Random(0)
+    for count, capacity in [(1000, None), (10000, None), (50000, None),
+                            (50000, 10000)]:
+        scans = [make_scan(rand, count) for _ in range(SCANS)]
+
+        # Fill the table, so the memory of every entry is measured.
+        table = ScanTable(capacity=capacity)
+        tracemalloc.start()
+        for scan in scans:
+            table.ingest(scan, now=0)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        entries = len(table)
+
+        table = ScanTable(capacity=capacity)
+        changes = 0
+        start = time.time()
+        for now, scan in enumerate(scans):
+            batch = table.ingest(scan, now)
+            changes += len(batch.new) + len(batch.changed) + len(batch.gone)
+        elapsed = time.time() - start
+
+        print('{:>8} {:>9} {:>10.0f} {:>10.2f} {:>9} {:>10.0f}'.format(
+            count, capacity or '-', SCANS / elapsed,
+            elapsed / SCANS / SCAN_SIZE * 1e6, changes, size / entries))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+Benchmark the hot spots of the control path and export the results as
+JSON for regression tracking.
+
+Every case runs offline against a FakeWpaSupplicant served by a thread
+of this process. Run from the top directory with:
+
+    python -m benchmarks.suite [--json FILE] [--compare FILE] [--quick]
+                               [--latency SECONDS]
+
+Each result holds the name and the parameters of a case and the best
+time of a call over the repeats. --compare prints the change of each
+case against the JSON of an earlier run.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import pywifi
+from pywifi import _wifiutil_linux, const
+from pywifi.profile import Profile, ProfileIndex
+from pywifi.testing import FakeWpaSupplicant
+
+
+REPEAT = 5
+# The minimum time of a repeat, which sets the number of calls.
+MIN_TIME = 0.05
+
+FLAGS = [
+    '[WPA2-PSK-CCMP][WPS][ESS]',
+    '[WPA-PSK-CCMP+TKIP][WPA2-PSK-CCMP+TKIP][ESS]',
+    '[WPA2-EAP-CCMP][ESS]',
+    '[ESS]',
+]
+
+
+def measure(func, setup=None, number=None):
+    """Return the best time of a call to func and the number of calls.
+
+    setup is called before each repeat and is not timed. If number is
+    not given, it is chosen so that a repeat takes MIN_TIME.
+    """
+
+    if number is None:
+        if setup:
+            setup()
+        number = 1
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if elapsed < MIN_TIME:
+            number = int(MIN_TIME / max(elapsed, 1e-7)) + 1
+
+    best = None
+    for _ in range(REPEAT):
+        if setup:
+            setup()
+        start = time.time()
+        for _ in range(number):
+            func()
+        elapsed = (time.time() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, number
+
+
+def close_connections():
+    """Drop the pooled connections and the cached states."""
+
+    util = _wifiutil_linux.WifiUtil
+    for conns in (util._connections, util._monitors):
+        for conn in conns.values():
+            conn.close()
+        conns.clear()
+    util._profiles.clear()
+    util._states.clear()
+    util._last_bss_ids.clear()
+
+
+def set_bsses(wpas, count):
+
+    del wpas.bsses[:]
+    for i in range(count):
+        wpas.add_bss(bssid='00:11:{:02x}:{:02x}:{:02x}:{:02x}'.format(
+            i >> 24 & 0xff, i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff),
+            freq=2412 + i % 13 * 5, level=-40 - i % 50,
+            flags=FLAGS[i % len(FLAGS)], ssid='ap{}'.format(i))
+
+
+def set_networks(wpas, count):
+
+    wpas.networks.clear()
+    for i in range(count):
+        wpas.add_network('testap{}'.format(i), key_mgmt='WPA-PSK',
+                         proto='RSN')
+
+
+def make_profile(i):
+
+    profile = Profile()
+    profile.ssid = 'testap{}'.format(i)
+    profile.akm.append(const.AKM_TYPE_WPA2PSK)
+    profile.cipher = const.CIPHER_TYPE_CCMP
+    profile.key = 'passphrase{}'.format(i)
+
+    return profile
+
+
+def bench_scan_results(wpas, util, iface, sizes):
+
+    for count in sizes:
+        set_bsses(wpas, count)
+        reply = util._send_cmd_to_wpas_raw(iface['name'], 'SCAN_RESULTS')
+        reply = reply.tobytes()
+        yield 'parse_scan_results', {'bsses': count}, measure(
+            lambda: _wifiutil_linux.parse_scan_results(reply))
+        yield 'scan_results', {'bsses': count}, measure(
+            lambda: util.scan_results(iface))
+
+
+def bench_network_profiles(wpas, util, iface, sizes):
+
+    for count in sizes:
+        set_networks(wpas, count)
+        yield 'network_profiles', {'networks': count}, measure(
+            lambda: util._list_network_profiles(iface['name']))
+        util._profiles.pop(iface['name'], None)
+        yield 'network_profiles_cached', {'networks': count}, measure(
+            lambda: util.network_profiles(iface))
+
+
+def bench_add_network_profile(wpas, util, iface, sizes):
+
+    for count in sizes:
+        profiles = [make_profile(i) for i in range(count)]
+
+        def add():
+            for profile in profiles:
+                util.add_network_profile(iface, profile)
+
+        def add_bulk():
+            util.add_network_profiles(iface, profiles)
+
+        def clear():
+            util.remove_all_network_profiles(iface)
+
+        seconds, number = measure(add, clear, 1)
+        yield 'add_network_profile', {'profiles': count}, (
+            seconds / count, number * count)
+        seconds, number = measure(add_bulk, clear, 1)
+        yield 'add_network_profiles', {'profiles': count}, (
+            seconds / count, number * count)
+
+
+def bench_status(wpas, util, iface):
+
+    yield 'status', {}, measure(lambda: util.status(iface))
+
+    max_age = _wifiutil_linux.STATE_MAX_AGE
+    _wifiutil_linux.STATE_MAX_AGE = 0
+    try:
+        yield 'status_uncached', {}, measure(lambda: util.status(iface))
+    finally:
+        _wifiutil_linux.STATE_MAX_AGE = max_age
+
+
+def bench_profile_eq(sizes):
+
+    for count in sizes:
+        stored = [make_profile(i) for i in range(count)]
+        index = ProfileIndex(stored)
+        target = make_profile(count - 1)
+        yield 'profile_eq', {'profiles': count}, measure(
+            lambda: [profile for profile in stored if profile == target])
+        yield 'profile_index_find', {'profiles': count}, measure(
+            lambda: index.find(target))
+
+
+def bench_startup(wpas):
+
+    def start():
+        pywifi.PyWiFi().interfaces()
+
+    yield 'startup', {}, measure(start, close_connections)
+    yield 'startup_pooled', {}, measure(start)
+
+    # The import of a new interpreter, so that nothing is cached.
+    cmd = [sys.executable, '-c',
+           'import time; t = time.time(); import pywifi; '
+           'print(time.time() - t)']
+    seconds = min(float(subprocess.check_output(cmd))
+                  for _ in range(REPEAT))
+    yield 'import', {}, (seconds, 1)
+
+
+def run(quick=False, latency=0):
+
+    results = []
+    with FakeWpaSupplicant(bsses=[], latency=latency) as wpas:
+        _wifiutil_linux.CTRL_IFACE_DIR = wpas.ctrl_iface_dir
+        close_connections()
+        util = _wifiutil_linux.WifiUtil()
+        iface = util.interfaces()[0]
+
+        cases = [
+            bench_scan_results(wpas, util, iface,
+                               [10, 100] if quick else [10, 100, 500, 2000]),
+            bench_network_profiles(wpas, util, iface,
+                                   [10, 100] if quick else [10, 100, 500]),
+            bench_add_network_profile(wpas, util, iface,
+                                      [10] if quick else [10, 100]),
+            bench_status(wpas, util, iface),
+            bench_profile_eq([100] if quick else [10, 100, 1000]),
+            bench_startup(wpas),
+        ]
+        for case in cases:
+            for name, params, (seconds, number) in case:
+                result = {'name': name, 'params': params,
+                          'seconds': seconds, 'ops_per_sec': 1 / seconds,
+                          'number': number, 'repeat': REPEAT}
+                results.append(result)
+                report(result)
+
+        close_connections()
+
+    return results
+
+
+def label(result):
+
+    params = ','.join('{}={}'.format(name, value)
+                      for name, value in sorted(result['params'].items()))
+    return '{}[{}]'.format(result['name'], params) if params else\
+        result['name']
+
+
+def report(result, baseline=None):
+
+    line = '{:<40} {:>12.1f} us {:>12.0f} /s'.format(
+        label(result), result['seconds'] * 1e6, result['ops_per_sec'])
+    if baseline is not None:
+        line += ' {:>+7.1f}%'.format(
+            (result['seconds'] / baseline['seconds'] - 1) * 100)
+    print(line)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare',
+                        help='compare with the results in this file')
+    parser.add_argument('--quick', action='store_true',
+                        help='run the smaller cases only')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='the seconds wpa_supplicant takes per command')
+    args = parser.parse_args()
+
+    results = run(args.quick, args.latency)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baselines = dict((label(result), result)
+                             for result in json.load(f)['results'])
+        print('\nCompared with {} (time change):'.format(args.compare))
+        for result in results:
+            report(result, baselines.get(label(result)))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'implementation': platform.python_implementation(),
+                       'machine': platform.machine(),
+                       'time': time.time(),
+                       'latency': args.latency,
+                       'results': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
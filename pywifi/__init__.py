@@ -10,12 +10,14 @@ This library is made for manipulating wifi device on varient platforms.
 
 import logging
 
-from . import const 
-from .profile import Profile
+from . import const
+from .profile import BssResult, Profile, ProfileIndex, ScanResult
+from .scan import ScanBatch, ScanTable
 from .wifi import PyWiFi
 
 
 def set_loglevel(level=logging.NOTSET):
+    """Log the messages of pywifi at level to stderr."""
 
     format_pattern = "%(name)s %(asctime)s %(levelname)s %(message)s"
     logging.basicConfig(format=format_pattern)
@@ -23,4 +25,5 @@ def set_loglevel(level=logging.NOTSET):
     logger.setLevel(level)
 
 
-set_loglevel()
+# Logging is left to the application, see set_loglevel().
+logging.getLogger('pywifi').addHandler(logging.NullHandler())
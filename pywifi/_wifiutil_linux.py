@@ -3,17 +3,75 @@
 
 """Implementations of wifi functions of Linux."""
 
+import atexit
+import copy
+import errno
+import itertools
 import logging
 import socket
 import stat
+import string
 import os
+import threading
+import time
+from collections import OrderedDict
 
 from .const import *
-from .profile import Profile
+from .metrics import RESULT_ERROR, RESULT_FAIL, RESULT_OK, RESULT_TIMEOUT
+from .profile import BssResult, Profile, ProfileIndex, ScanResult,\
+    akm_to_mask, diff_profiles, key_digest
 
 CTRL_IFACE_DIR = '/var/run/wpa_supplicant'
 CTRL_IFACE_RETRY = 3
+# Seconds to wait for the reply of a cmd.
+CTRL_IFACE_TIMEOUT = 10
+# A connection idle for this many seconds is checked by PING before use.
+CTRL_IFACE_IDLE_TIME = 30
+PING_TIMEOUT = 1
+# The delay before reconnecting again, which doubles on each failure.
+RECONNECT_DELAY = 0.2
+# Sending to a wpa_s which has gone or been restarted fails with these.
+RECONNECT_ERRNOS = (errno.ECONNREFUSED, errno.ENOENT, errno.ENOTCONN,
+                    errno.ECONNRESET, errno.EPIPE)
 REPLY_SIZE = 4096
+SCAN_TIMEOUT = 10
+CONNECT_TIMEOUT = 30
+# A state known from events or STATUS is trusted for this many seconds,
+# as wpa_s reports only some state changes by events.
+STATE_MAX_AGE = 5
+CONNECT_EVENTS = ('CTRL-EVENT-CONNECTED', 'CTRL-EVENT-DISCONNECTED',
+                  'CTRL-EVENT-SSID-TEMP-DISABLED')
+# Max number of cmds in flight, which has to be lower than the datagram
+# queue length of the client socket (net.unix.max_dgram_qlen).
+PIPELINE_DEPTH = 8
+# Seconds the reader of a monitor waits for an event before checking
+# whether the monitor has been closed.
+MONITOR_POLL_TIME = 0.5
+# The pairwise ciphers of a network which does not set pairwise.
+DEFAULT_PAIRWISE = 'CCMP TKIP'
+
+# The observer of the round trips of the cmds, see set_observer().
+_observer = None
+
+# Define the fields of BSS cmd replies.
+BSS_MASK_ID = 1 << 0
+BSS_MASK_BSSID = 1 << 1
+BSS_MASK_FREQ = 1 << 2
+BSS_MASK_NOISE = 1 << 6
+BSS_MASK_LEVEL = 1 << 7
+BSS_MASK_AGE = 1 << 9
+BSS_MASK_IE = 1 << 10
+BSS_MASK_FLAGS = 1 << 11
+BSS_MASK_SSID = 1 << 12
+BSS_MASK_DELIM = 1 << 17
+BSS_MASK_DEFAULT = BSS_MASK_BSSID | BSS_MASK_FREQ | BSS_MASK_NOISE |\
+    BSS_MASK_LEVEL | BSS_MASK_AGE | BSS_MASK_IE | BSS_MASK_FLAGS |\
+    BSS_MASK_SSID
+
+# The wpa_states by their numbers in CTRL-EVENT-STATE-CHANGE events.
+WPA_STATES = ['DISCONNECTED', 'INTERFACE_DISABLED', 'INACTIVE', 'SCANNING',
+              'AUTHENTICATING', 'ASSOCIATING', 'ASSOCIATED', '4WAY_HANDSHAKE',
+              'GROUP_HANDSHAKE', 'COMPLETED']
 
 status_dict = {
     'completed': IFACE_CONNECTED,
@@ -52,194 +110,1261 @@ cipher_str_to_value = {
     'CCMP': CIPHER_TYPE_CCMP,
 }
 
+
+flags_to_akm_type = (
+    ('WPA-PSK', AKM_TYPE_WPAPSK),
+    ('WPA2-PSK', AKM_TYPE_WPA2PSK),
+    ('WPA-EAP', AKM_TYPE_WPA),
+    ('WPA2-EAP', AKM_TYPE_WPA2)
+)
+
+# The strongest cipher found in the flags is used.
+flags_to_cipher_type = (
+    ('CCMP', CIPHER_TYPE_CCMP),
+    ('TKIP', CIPHER_TYPE_TKIP),
+    ('WEP', CIPHER_TYPE_WEP)
+)
+
+FLAGS_CACHE_SIZE = 256
+_flags_cache = {}
+# The freqs and signals of the BSSes repeat, so their ints are shared.
+INT_CACHE_SIZE = 1024
+_int_cache = {}
+
+
+def parse_scan_results(reply):
+    """Parse the reply of SCAN_RESULTS cmd into a ScanResult list.
+
+    reply can be a str or any bytes-like object (e.g. a memoryview of the
+    receive buffer). The bytes are split into the fields of all the lines
+    at once, and only the bssid and ssid of each BSS are decoded.
+    """
+
+    if isinstance(reply, memoryview):
+        reply = reply.tobytes()
+    elif not isinstance(reply, bytes):
+        reply = bytes(reply) if isinstance(reply, bytearray) else\
+            reply.encode('utf-8')
+
+    # Skip the header, and the last line which is empty or is cut off if
+    # the reply is truncated.
+    data = reply[reply.find(b'\n') + 1:reply.rfind(b'\n')]
+    if not data:
+        return []
+
+    fields = data.replace(b'\n', b'\t').split(b'\t')
+    if len(fields) != (data.count(b'\n') + 1) * 5:
+        # Some lines do not have 5 fields, so skip them.
+        fields = []
+        for line in data.split(b'\n'):
+            values = line.split(b'\t')
+            if len(values) == 5:
+                fields.extend(values)
+
+    bsses = []
+    append = bsses.append
+    flags_cache = _flags_cache
+    int_cache = _int_cache
+    values = iter(fields)
+    for bssid, freq, signal, flags, ssid in zip(values, values, values,
+                                                values, values):
+        akm_mask, cipher = flags_cache.get(flags) or parse_flags(flags)
+        append(ScanResult(bssid.decode('utf-8'), ssid.decode('utf-8'),
+                          int_cache.get(freq) or _parse_int(freq),
+                          int_cache.get(signal) or _parse_int(signal),
+                          akm_mask, cipher))
+
+    return bsses
+
+
+def _parse_int(value):
+
+    if len(_int_cache) >= INT_CACHE_SIZE:
+        _int_cache.clear()
+    number = _int_cache[value] = int(value)
+
+    return number
+
+
+def parse_flags(flags):
+    """Get the akm bitmask and the cipher from the flags of a BSS.
+
+    flags can be a str or bytes. Most BSSes share a few flags, so the
+    results are cached by flags.
+    """
+
+    if flags in _flags_cache:
+        return _flags_cache[flags]
+
+    text = flags.decode('utf-8') if isinstance(flags, bytes) else flags
+    akm_mask = akm_to_mask(
+        akm for name, akm in flags_to_akm_type if name in text)
+    cipher = CIPHER_TYPE_NONE
+    for name, cipher_type in flags_to_cipher_type:
+        if name in text:
+            cipher = cipher_type
+            break
+
+    if len(_flags_cache) >= FLAGS_CACHE_SIZE:
+        _flags_cache.clear()
+    _flags_cache[flags] = (akm_mask, cipher)
+
+    return akm_mask, cipher
+
+
+def parse_bss(reply):
+    """Parse the reply of BSS cmd with BSS_MASK_DELIM into a BssResult list.
+
+    The BSS fields which are not in the reply are set to None. The
+    returned bool tells whether the last BSS of wpa_supplicant is
+    included in the reply.
+    """
+
+    bsses = []
+    for entry in reply.split('====\n'):
+        fields = dict(l.split('=', 1) for l in entry.split('\n') if '=' in l)
+        if 'id' not in fields:
+            continue
+
+        bss = BssResult(id=int(fields['id']))
+        bss.bssid = fields.get('bssid')
+        bss.ssid = fields.get('ssid')
+        bss.freq = int(fields['freq']) if 'freq' in fields else None
+        bss.signal = int(fields['level']) if 'level' in fields else None
+        bss.noise = int(fields['noise']) if 'noise' in fields else None
+        bss.age = int(fields['age']) if 'age' in fields else None
+        bss.ie = fields.get('ie')
+        bss.flags = fields.get('flags')
+        bss.akm_mask, bss.cipher = parse_flags(bss.flags or '')
+        bsses.append(bss)
+
+    return bsses, reply.endswith('####\n')
+
+
+def parse_network_list(reply):
+    """Parse the reply of LIST_NETWORKS cmd into (id, ssid) pairs."""
+
+    networks = []
+    network_summary = reply.split('\n')
+
+    for l in network_summary[1:-1]:
+        values = l.split('\t')
+        if len(values) > 1:
+            networks.append((values[0], values[1]))
+
+    return networks
+
+
+def parse_status(reply):
+    """Get the interface status from the reply of STATUS cmd."""
+
+    for l in reply.split('\n'):
+        if l.startswith('wpa_state='):
+            return status_dict[l[10:].lower()]
+
+
+def parse_status_fields(reply):
+    """Parse the reply of STATUS cmd into a dict of its fields."""
+
+    fields = {}
+    for l in reply.split('\n'):
+        name, sep, value = l.partition('=')
+        if sep:
+            fields[name] = value
+
+    return fields
+
+
+def parse_event_fields(event):
+    """Parse the name=value fields of an event into a dict."""
+
+    fields = {}
+    for field in event.split():
+        name, sep, value = field.strip('[]').partition('=')
+        if sep:
+            fields[name] = value
+
+    return fields
+
+
+def parse_connect_event(event, network_id):
+    """Get the (status, reason) of connecting to network_id from event.
+
+    None is returned if event does not tell the outcome.
+    """
+
+    fields = parse_event_fields(event)
+
+    if event.startswith('CTRL-EVENT-CONNECTED'):
+        if fields.get('id', network_id) != network_id:
+            return None
+        return CONNECT_SUCCEEDED, None
+
+    if event.startswith('CTRL-EVENT-SSID-TEMP-DISABLED'):
+        if fields.get('id') != network_id:
+            return None
+        return CONNECT_FAILED, fields.get('reason')
+
+    if event.startswith('CTRL-EVENT-DISCONNECTED'):
+        # Selecting a network leaves the current one first.
+        if fields.get('reason') == '3' and\
+                fields.get('locally_generated') == '1':
+            return None
+        return CONNECT_FAILED, int(fields.get('reason', 0))
+
+    return None
+
+
+def network_to_profile(network_id, ssid, key_mgmt, proto, pairwise):
+    """Build a Profile from the GET_NETWORK replies of a network.
+
+    None is returned if any of the replies is failed.
+    """
+
+    for reply in (ssid, key_mgmt, pairwise):
+        if reply.upper().startswith('FAIL'):
+            return None
+
+    network = Profile()
+    network.id = network_id
+    network.ssid = ssid[1:-1]
+
+    network.akm = []
+    if key_mgmt.upper() in ['WPA-PSK']:
+        if proto.upper() == 'RSN':
+            network.akm.append(AKM_TYPE_WPA2PSK)
+        else:
+            network.akm.append(AKM_TYPE_WPAPSK)
+    elif key_mgmt.upper() in ['WPA-EAP']:
+        if proto.upper() == 'RSN':
+            network.akm.append(AKM_TYPE_WPA2)
+        else:
+            network.akm.append(AKM_TYPE_WPA)
+    elif key_mgmt.upper() == 'NONE':
+        network.akm.append(AKM_TYPE_NONE)
+
+    # Assume the possible ciphers TKIP and CCMP
+    ciphers = pairwise.split(' ')
+    if len(ciphers) == 1:
+        network.cipher = cipher_str_to_value.get(
+            ciphers[0].upper(), CIPHER_TYPE_UNKNOWN)
+    elif 'CCMP' in ciphers:
+        network.cipher = CIPHER_TYPE_CCMP
+
+    return network
+
+
+def akm_to_key_mgmt_proto(akm):
+    """Get the key_mgmt and proto values of a network for akm."""
+
+    if akm in [AKM_TYPE_WPAPSK, AKM_TYPE_WPA2PSK]:
+        key_mgmt = 'WPA-PSK'
+    elif akm in [AKM_TYPE_WPA, AKM_TYPE_WPA2]:
+        key_mgmt = 'WPA-EAP'
+    else:
+        key_mgmt = 'NONE'
+
+    proto = ''
+    if akm in [AKM_TYPE_WPAPSK, AKM_TYPE_WPA]:
+        proto = 'WPA'
+    elif akm in [AKM_TYPE_WPA2PSK, AKM_TYPE_WPA2]:
+        proto = 'RSN'
+
+    return key_mgmt, proto
+
+
+def network_profile_cmds(network_id, params):
+    """Get the SET_NETWORK cmds for configuring params to a network."""
+
+    cmds = ['SET_NETWORK {} ssid \"{}\"'.format(network_id, params.ssid)]
+
+    key_mgmt, proto = akm_to_key_mgmt_proto(params.akm[-1])
+    cmds.append('SET_NETWORK {} key_mgmt {}'.format(network_id, key_mgmt))
+
+    if proto:
+        cmds.append('SET_NETWORK {} proto {}'.format(network_id, proto))
+
+    return cmds + network_key_cmds(network_id, params)
+
+
+def check_network_key(params):
+    """Raise ValueError if the network key of params is not a PSK."""
+
+    if params.akm[-1] not in [AKM_TYPE_WPAPSK, AKM_TYPE_WPA2PSK] or\
+            params.key_type != KEY_TYPE_NETWORKKEY:
+        return
+
+    key = params.key or ''
+    if len(key) != 64 or not all(c in string.hexdigits for c in key):
+        raise ValueError('A network key has 64 hex digits, '
+                         'got {!r}'.format(key))
+
+
+def network_key_cmds(network_id, params):
+    """Get the SET_NETWORK cmds for configuring the key of params."""
+
+    if params.akm[-1] not in [AKM_TYPE_WPAPSK, AKM_TYPE_WPA2PSK]:
+        return []
+
+    # A network key is the PSK in hex digits, which is not quoted, so it
+    # must not carry anything else into the cmd.
+    if params.key_type == KEY_TYPE_NETWORKKEY:
+        check_network_key(params)
+        return ['SET_NETWORK {} psk {}'.format(network_id, params.key)]
+
+    return ['SET_NETWORK {} psk \"{}\"'.format(network_id, params.key)]
+
+
+class _ProfileCache(object):
+    """The cached profiles of an iface, indexed for matching."""
+
+    def __init__(self, profiles):
+
+        self._profiles = OrderedDict(
+            (profile.id, profile) for profile in profiles)
+        self.index = ProfileIndex(profiles)
+        # The networks added by others, which have to be listed.
+        self.unknown_ids = set()
+        # The digests of the keys set by us, by network id.
+        self.key_digests = {}
+
+    def __contains__(self, network_id):
+
+        return network_id in self._profiles
+
+    def __iter__(self):
+
+        return iter(self._profiles.values())
+
+    def copies(self):
+        """Get copies of the profiles, which the callers may modify."""
+
+        profiles = []
+        for profile in self._profiles.values():
+            profile = copy.copy(profile)
+            profile.akm = list(profile.akm)
+            profiles.append(profile)
+
+        return profiles
+
+    def add(self, profile):
+
+        self._profiles[profile.id] = profile
+        self.index.add(profile)
+        self.unknown_ids.discard(profile.id)
+
+    def remove(self, network_id):
+
+        profile = self._profiles.pop(network_id, None)
+        if profile is not None:
+            self.index.remove(profile)
+        self.unknown_ids.discard(network_id)
+        self.key_digests.pop(network_id, None)
+
+    def set_key(self, network_id, params):
+        """Remember the key of params set to the network."""
+
+        digest = key_digest(params)
+        if digest is None:
+            self.key_digests.pop(network_id, None)
+        else:
+            self.key_digests[network_id] = digest
+
+    def key_changed(self, profile, params):
+        """Return whether the key of params is not the one last set."""
+
+        return self.key_digests.get(profile.id) != key_digest(params)
+
+    def apply(self, event):
+        """Apply a CTRL-EVENT-NETWORK-ADDED or -REMOVED event."""
+
+        network_id = event.split()[1]
+        if event.startswith('CTRL-EVENT-NETWORK-REMOVED'):
+            self.remove(network_id)
+        # The networks added by us are cached before or after their events.
+        elif network_id not in self._profiles:
+            self.unknown_ids.add(network_id)
+
+
+_sock_ids = itertools.count()
+
+
+def _remove_existed_sock(sock_file):
+
+    if os.path.exists(sock_file):
+        mode = os.stat(sock_file).st_mode
+        if stat.S_ISSOCK(mode):
+            os.remove(sock_file)
+
+
+def _observe_request(observer, iface, cmd, start, reply=None, error=None):
+    """Pass the round trip of cmd started at start to observer."""
+
+    if error is None:
+        received = len(reply)
+        result = RESULT_FAIL if reply[:4] == b'FAIL' else RESULT_OK
+    else:
+        received = 0
+        result = RESULT_TIMEOUT if isinstance(error, socket.timeout)\
+            else RESULT_ERROR
+
+    try:
+        observer.observe(iface, cmd.split(' ', 1)[0], time.time() - start,
+                         len(cmd.encode('utf-8')), received, result)
+    except Exception:
+        logging.getLogger('pywifi').exception(
+            "Observer of iface '%s' failed", iface)
+
+
+class CtrlConnection(object):
+    """CtrlConnection is a client socket of the control iface of wpa_s.
+
+    Each connection binds its own socket file named after the process,
+    so the connections of processes and PyWiFi objects do not clobber
+    each other. If wpa_s has been restarted, the connection is reopened
+    with backoff and on_reconnect is called.
+
+    A request holds the lock of the connection until its reply arrives,
+    so the connection can be shared by threads.
+    """
+
+    _logger = logging.getLogger('pywifi')
+
+    def __init__(self, iface, attach=False, on_reconnect=None):
+
+        self.iface = iface
+        self.ctrl_iface = '/'.join([CTRL_IFACE_DIR, iface])
+        self.sock = None
+        self.sock_file = None
+        self.lock = threading.RLock()
+        self._attach = attach
+        self._on_reconnect = on_reconnect
+        self._reconnected = False
+        # Replies are received into a buffer of each thread, so a reply
+        # is not overwritten by the requests of the other threads.
+        self._local = threading.local()
+        self._timeout = None
+        self._last_used = 0
+
+    def open(self):
+        """Open the socket and return whether wpa_s answers on it."""
+
+        with self.lock:
+            self.close()
+            self.sock_file = '{}/{}_{}_{}_{}'.format(
+                '/tmp', 'pywifi', self.iface, os.getpid(), next(_sock_ids))
+            _remove_existed_sock(self.sock_file)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(self.sock_file)
+
+            cmd, expected = (b'ATTACH', b'OK') if self._attach else\
+                (b'PING', b'PONG')
+            try:
+                self.sock.connect(self.ctrl_iface)
+                self.sock.send(cmd)
+                reply = self.recv(CTRL_IFACE_TIMEOUT).tobytes()
+            except socket.error as err:
+                self._logger.error("Connection to '%s' is broken: %s",
+                                   self.ctrl_iface, err)
+                reply = b''
+
+            if not reply.startswith(expected):
+                self._logger.error("Connect to sock '%s' failed!",
+                                   self.ctrl_iface)
+                self.close()
+                return False
+
+        self._logger.info("Connect to sock '%s' successfully!",
+                          self.ctrl_iface)
+
+        return True
+
+    def close(self):
+        """Close the socket and remove its socket file."""
+
+        with self.lock:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+                self._timeout = None
+
+            if self.sock_file is not None:
+                _remove_existed_sock(self.sock_file)
+                self.sock_file = None
+
+    def reconnect(self):
+        """Reopen the connection, backing off between the attempts."""
+
+        with self.lock:
+            delay = RECONNECT_DELAY
+            for retry in range(CTRL_IFACE_RETRY):
+                if retry:
+                    time.sleep(delay)
+                    delay *= 2
+
+                if self.open():
+                    self._reconnected = True
+                    return True
+
+        return False
+
+    def ping(self):
+        """Return whether wpa_s answers PING on the connection."""
+
+        with self.lock:
+            if self.sock is None:
+                return False
+
+            try:
+                self.sock.send(b'PING')
+                return self._recv_reply(PING_TIMEOUT).tobytes().startswith(
+                    b'PONG')
+            except socket.error:
+                return False
+
+    def request(self, cmd, timeout=CTRL_IFACE_TIMEOUT):
+        """Send cmd and return its reply.
+
+        The reply is a memoryview of the receive buffer of the thread,
+        which is valid until the next request of the thread.
+        socket.timeout is raised if the reply does not arrive within
+        timeout seconds.
+        """
+
+        # The observer is read once, so a request is either observed
+        # as a whole or costs nothing.
+        observer = _observer
+        start = None
+        try:
+            with self.lock:
+                self._check()
+                if observer is not None:
+                    start = time.time()
+                self._send(cmd)
+                reply = self._recv_reply(timeout)
+                if observer is not None:
+                    _observe_request(observer, self.iface, cmd, start, reply)
+                return reply
+        except socket.error as err:
+            if start is not None:
+                _observe_request(observer, self.iface, cmd, start, error=err)
+            raise
+        finally:
+            self._notify_reconnect()
+
+    def requests(self, cmds, timeout=CTRL_IFACE_TIMEOUT):
+        """Send cmds in a pipeline and return their replies in order."""
+
+        replies = []
+        sent = 0
+        observer = _observer
+        # The send times of the cmds, if observed.
+        starts = []
+        try:
+            with self.lock:
+                self._check()
+                while len(replies) < len(cmds):
+                    while sent < len(cmds) and\
+                            sent - len(replies) < PIPELINE_DEPTH:
+                        if observer is not None:
+                            starts.append(time.time())
+                        # Only reconnect while no reply is pending.
+                        self._send(cmds[sent], sent == len(replies))
+                        sent += 1
+
+                    reply = self._recv_reply(timeout).tobytes()
+                    if observer is not None:
+                        _observe_request(
+                            observer, self.iface, cmds[len(replies)],
+                            starts[len(replies)], reply)
+                    replies.append(reply.decode('utf-8'))
+        except socket.error as err:
+            if len(replies) < len(starts):
+                _observe_request(observer, self.iface, cmds[len(replies)],
+                                 starts[len(replies)], error=err)
+            raise
+        finally:
+            self._notify_reconnect()
+
+        return replies
+
+    def recv(self, timeout):
+        """Receive a datagram into the reusable buffer of the thread.
+
+        The size of the datagram is peeked first and the buffer grows to
+        fit it, so long replies are not truncated. The returned
+        memoryview is valid until the next call of the thread.
+        """
+
+        if timeout != self._timeout:
+            self.sock.settimeout(timeout)
+            self._timeout = timeout
+
+        buf = getattr(self._local, 'buf', None)
+        if buf is None:
+            buf = self._local.buf = bytearray(REPLY_SIZE)
+
+        size = self.sock.recv_into(buf, 0, socket.MSG_PEEK | socket.MSG_TRUNC)
+        if size > len(buf):
+            new_size = len(buf)
+            while new_size < size:
+                new_size *= 2
+            buf = self._local.buf = bytearray(new_size)
+
+        size = self.sock.recv_into(buf)
+        self._last_used = time.time()
+
+        return memoryview(buf)[:size]
+
+    def _recv_reply(self, timeout):
+
+        try:
+            return self.recv(timeout)
+        except socket.timeout:
+            # The late reply would be taken as the reply of the next cmd,
+            # so drop the socket and reopen it on the next request.
+            self._logger.error("Reply from sock '%s' timed out",
+                               self.ctrl_iface)
+            self.close()
+            raise
+
+    def _check(self):
+        """Reopen the connection if it is closed or wpa_s has gone."""
+
+        if self.sock is not None and (
+                time.time() - self._last_used < CTRL_IFACE_IDLE_TIME or
+                self.ping()):
+            return
+
+        self._reconnect_or_raise()
+
+    def _send(self, cmd, reconnect=True):
+
+        if 'psk' not in cmd:
+            self._logger.info("Send cmd '%s' to wpa_s", cmd)
+
+        try:
+            self.sock.send(bytearray(cmd, 'utf-8'))
+        except socket.error as err:
+            if not reconnect or err.errno not in RECONNECT_ERRNOS:
+                raise
+            # The cmd is not delivered to wpa_s, so it is safe to resend.
+            self._logger.info("Reconnect to sock '%s': %s",
+                              self.ctrl_iface, err)
+            self._reconnect_or_raise()
+            self.sock.send(bytearray(cmd, 'utf-8'))
+
+    def _reconnect_or_raise(self):
+
+        if not self.reconnect():
+            raise socket.error(
+                errno.ENOTCONN,
+                "Can't connect to '{}'".format(self.ctrl_iface))
+
+    def _notify_reconnect(self):
+
+        # on_reconnect is called without holding the lock, as it may wait
+        # for the locks of the other connections.
+        if self._reconnected:
+            self._reconnected = False
+            if self._on_reconnect is not None:
+                self._on_reconnect()
+
+
+class _EventWaiter(object):
+    """Collect the events starting with prefixes for a waiting thread."""
+
+    def __init__(self, prefixes):
+
+        self.prefixes = prefixes
+        self._events = []
+        self._cond = threading.Condition()
+
+    def put(self, event):
+
+        with self._cond:
+            self._events.append(event)
+            self._cond.notify()
+
+    def get(self, timeout):
+        """Get the next event, or None if none arrives within timeout."""
+
+        deadline = time.time() + timeout
+        with self._cond:
+            while not self._events:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+            return self._events.pop(0)
+
+
+class _Monitor(object):
+    """_Monitor reads the events of an iface in a daemon thread.
+
+    wpa_s sends the events to an ATTACHed socket whether it is read or
+    not, and an unread socket soon fills the send buffer of wpa_s, which
+    then fails to reply to all its clients. So a monitor is attached only
+    while its thread reads it. Each event is passed to
+    on_event(iface, event) and to the waiters of the threads, and
+    on_lost(monitor) is called if the socket fails.
+    """
+
+    _logger = logging.getLogger('pywifi')
+
+    def __init__(self, iface, on_event, on_lost):
+
+        self.iface = iface
+        self.conn = CtrlConnection(iface, attach=True)
+        self.closed = False
+        self._on_event = on_event
+        self._on_lost = on_lost
+        self._waiters = []
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Attach to wpa_s and start reading the events."""
+
+        if not self.conn.open():
+            return False
+
+        thread = threading.Thread(target=self._read,
+                                  name='pywifi-monitor-' + self.iface)
+        thread.daemon = True
+        thread.start()
+
+        return True
+
+    def close(self):
+        """Stop reading the events and detach from wpa_s."""
+
+        self.closed = True
+        conn = self.conn
+        with conn.lock:
+            if conn.sock is not None:
+                try:
+                    conn.sock.send(b'DETACH')
+                except socket.error:
+                    pass
+        conn.close()
+
+    def reconnect(self):
+        """Attach again, e.g. to a restarted wpa_s.
+
+        The reader is switched to a new connection, so no event is read
+        by the reader and the ATTACH of the new connection at once.
+        """
+
+        conn = CtrlConnection(self.iface, attach=True)
+        if not conn.reconnect():
+            return False
+
+        self.conn, old = conn, self.conn
+        old.close()
+        # Do not leave the new connection attached if closed meanwhile.
+        if self.closed:
+            conn.close()
+
+        return True
+
+    def wait_for(self, prefixes):
+        """Collect the events starting with prefixes from now on."""
+
+        waiter = _EventWaiter(prefixes)
+        with self._lock:
+            self._waiters.append(waiter)
+
+        return waiter
+
+    def stop_waiting(self, waiter):
+
+        with self._lock:
+            self._waiters.remove(waiter)
+
+    def _read(self):
+
+        while not self.closed:
+            conn = self.conn
+            try:
+                data = self._recv(conn)
+            except socket.timeout:
+                continue
+            except socket.error as err:
+                # The old socket of a reconnected monitor is closed.
+                if self.closed or conn is not self.conn:
+                    continue
+                self._logger.error("Monitor of iface '%s' is broken: %s",
+                                   self.iface, err)
+                self.close()
+                self._on_lost(self)
+                return
+
+            # Skip the reply of DETACH.
+            if not data.startswith(b'<'):
+                continue
+
+            event = data.decode('utf-8', 'replace')
+            event = event[event.find('>') + 1:]
+            try:
+                self._on_event(self.iface, event)
+            except Exception:
+                self._logger.exception("Event of iface '%s' failed",
+                                       self.iface)
+
+            with self._lock:
+                waiters = [waiter for waiter in self._waiters
+                           if event.startswith(waiter.prefixes)]
+            for waiter in waiters:
+                waiter.put(event)
+
+    def _recv(self, conn):
+
+        sock = conn.sock
+        if sock is None:
+            raise socket.error(errno.EBADF, 'Monitor socket is closed')
+
+        sock.settimeout(MONITOR_POLL_TIME)
+
+        return sock.recv(REPLY_SIZE)
+
+
+class _IfaceState(object):
+    """The state of an iface known from events or STATUS replies."""
+
+    def __init__(self, wpa_state, fields=None):
+
+        self.wpa_state = wpa_state
+        # The fields of STATUS reply, or None after the state changed.
+        self.fields = fields
+        self.updated = time.time()
+
+    def status(self):
+
+        if self.wpa_state is None:
+            return None
+
+        return status_dict[self.wpa_state.lower()]
+
+    def fresh(self, full=False):
+
+        return time.time() - self.updated < STATE_MAX_AGE and\
+            (not full or self.fields is not None)
+
+
 class WifiUtil():
     """WifiUtil implements the wifi functions in Linux."""
 
     _connections = {}
+    _monitors = {}
+    # The cached profiles of each iface, which are kept only while a
+    # monitor reads the added and removed networks.
+    _profiles = {}
+    # The network events read while the profiles of each iface are
+    # listed, which are applied to the new cache.
+    _listings = {}
+    _last_bss_ids = {}
+    # The states of each iface, which are updated by the events.
+    _states = {}
+    _status_callbacks = {}
+    # Guard the cached states, which are shared by the threads.
+    _lock = threading.RLock()
+    # Guard the opening of the connections of the pool.
+    _pool_lock = threading.RLock()
     _logger = logging.getLogger('pywifi')
 
-    def scan(self, obj):
-        """Trigger the wifi interface to scan."""
+    def scan(self, obj, wait=False, timeout=SCAN_TIMEOUT):
+        """Trigger the wifi interface to scan.
 
-        self._send_cmd_to_wpas(obj['name'], 'SCAN')
+        If wait is True, block until wpa_supplicant reports the end of
+        the scan and return True if the results are ready or False if
+        the scan failed or timed out.
+        """
+
+        if not wait:
+            self._send_cmd_to_wpas(obj['name'], 'SCAN')
+            return None
+
+        mon = self._attach_to_wpa_s(obj['name'])
+        if not mon:
+            return False
+
+        # Only the events from now on end this scan.
+        waiter = mon.wait_for(
+            ('CTRL-EVENT-SCAN-RESULTS', 'CTRL-EVENT-SCAN-FAILED'))
+        try:
+            reply = self._send_cmd_to_wpas(obj['name'], 'SCAN', True)
+            if reply.startswith('FAIL') and reply.strip() != 'FAIL-BUSY':
+                self._logger.error(
+                    "Unexpected resp '%s' for Command 'SCAN'", reply)
+                return False
+
+            event = self._wait_for_event(waiter, timeout)
+        finally:
+            mon.stop_waiting(waiter)
+
+        if event is None:
+            self._logger.error("Scan on iface '%s' timed out", obj['name'])
+            return False
+
+        return event.startswith('CTRL-EVENT-SCAN-RESULTS')
 
     def scan_results(self, obj):
         """Get the AP list after scanning."""
 
+        reply = self._send_cmd_to_wpas_raw(obj['name'], 'SCAN_RESULTS')
+
+        return parse_scan_results(reply)
+
+    def bss_results(self, obj, new_only=False, mask=BSS_MASK_DEFAULT):
+        """Get the BSS list of wpa_supplicant with the fields in mask.
+
+        If new_only is True, only the BSSes added since the last call are
+        returned.
+        """
+
         bsses = []
-        bsses_summary = self._send_cmd_to_wpas(obj['name'], 'SCAN_RESULTS', True)
-        bsses_summary = bsses_summary[:-1].split('\n')
-        if len(bsses_summary) == 1:
-            return bsses
-
-        for l in bsses_summary[1:]:
-            values = l.split('\t')
-            bss = Profile()
-            bss.bssid = values[0]
-            bss.freq = int(values[1])
-            bss.signal = int(values[2])
-            bss.ssid = values[4]
-            bss.akm = []
-            if 'WPA-PSK' in values[3]:
-                bss.akm.append(AKM_TYPE_WPAPSK)
-            if 'WPA2-PSK' in values[3]:
-                bss.akm.append(AKM_TYPE_WPA2PSK)
-            if 'WPA-EAP' in values[3]:
-                bss.akm.append(AKM_TYPE_WPA)
-            if 'WPA2-EAP' in values[3]:
-                bss.akm.append(AKM_TYPE_WPA2)
-
-            bss.auth = AUTH_ALG_OPEN
-
-            bsses.append(bss)
+        mask |= BSS_MASK_ID | BSS_MASK_DELIM
+        next_id = 0
+        if new_only:
+            next_id = self._last_bss_ids.get(obj['name'], -1) + 1
+
+        # A reply holds as many BSSes as the reply buffer of wpa_s fits,
+        # so keep asking for the rest until the last BSS is received.
+        while True:
+            reply = self._send_cmd_to_wpas(
+                obj['name'],
+                'BSS RANGE={}- MASK=0x{:x}'.format(next_id, mask),
+                True)
+            range_bsses, done = parse_bss(reply)
+            bsses.extend(range_bsses)
+            if done or not range_bsses:
+                break
+            next_id = range_bsses[-1].id + 1
 
-        return bsses
+        if bsses:
+            with self._lock:
+                self._last_bss_ids[obj['name']] = max(
+                    bsses[-1].id, self._last_bss_ids.get(obj['name'], -1))
 
-    def connect(self, obj, network):
-        """Connect to the specified AP."""
+        return bsses
 
+    def connect(self, obj, network, wait=False, timeout=CONNECT_TIMEOUT):
+        """Connect to the specified AP.
+
+        If wait is True, block until wpa_supplicant reports the outcome
+        and return (status, reason, elapsed), where reason is the reason
+        code of a disconnection or the reason of a temporarily disabled
+        network.
+        """
+
+        if not wait:
+            self._select_network(obj['name'], network)
+            return None
+
+        start = time.time()
+        mon = self._attach_to_wpa_s(obj['name'])
+        if not mon:
+            return CONNECT_FAILED, None, time.time() - start
+
+        # Only the events from now on tell the outcome.
+        waiter = mon.wait_for(CONNECT_EVENTS)
+        try:
+            status = parse_status_fields(
+                self._send_cmd_to_wpas(obj['name'], 'STATUS', True))
+            network_id = self._select_network(obj['name'], network)
+            if network_id is None:
+                return CONNECT_FAILED, None, time.time() - start
+
+            # Selecting the current network does not connect again.
+            if status.get('wpa_state') == 'COMPLETED' and\
+                    status.get('id') == network_id:
+                return CONNECT_SUCCEEDED, None, time.time() - start
+
+            while True:
+                event = self._wait_for_event(
+                    waiter, start + timeout - time.time())
+                if event is None:
+                    self._logger.error("Connect on iface '%s' timed out",
+                                       obj['name'])
+                    return CONNECT_TIMED_OUT, None, time.time() - start
+
+                outcome = parse_connect_event(event, network_id)
+                if outcome is not None:
+                    return outcome + (time.time() - start,)
+        finally:
+            mon.stop_waiting(waiter)
+
+    def _select_network(self, iface, network):
+        """Select the networks of the ssid of network.
+
+        Return the id of the selected network or None if it fails.
+        """
+
+        selected = None
         network_summary = self._send_cmd_to_wpas(
-            obj['name'],
+            iface,
             'LIST_NETWORKS',
             True)
-        network_summary = network_summary[:-1].split('\n')
-        if len(network_summary) == 1:
-            return networks
-
-        for l in network_summary[1:]:
-            values = l.split('\t')
-            if values[1] == network.ssid:
-                network_summary = self._send_cmd_to_wpas(
-                    obj['name'],
-                    'SELECT_NETWORK {}'.format(values[0]),
+
+        self._invalidate_state(iface)
+        for network_id, ssid in parse_network_list(network_summary):
+            if ssid == network.ssid:
+                reply = self._send_cmd_to_wpas(
+                    iface,
+                    'SELECT_NETWORK {}'.format(network_id),
                     True)
+                if reply.startswith('OK'):
+                    selected = network_id
+
+        return selected
 
     def disconnect(self, obj):
         """Disconnect to the specified AP."""
 
         self._send_cmd_to_wpas(obj['name'], 'DISCONNECT')
+        self._invalidate_state(obj['name'])
 
     def add_network_profile(self, obj, params):
         """Add an AP profile for connecting to afterward."""
 
+        params.process_akm()
+        check_network_key(params)
+
         network_id = self._send_cmd_to_wpas(obj['name'], 'ADD_NETWORK', True)
         network_id = network_id.strip()
 
-        params.process_akm()
+        if not network_id.isdigit():
+            self._logger.error("Add profile '%s' failed: '%s'",
+                               params.ssid, network_id)
+            return params
 
-        self._send_cmd_to_wpas(
-                obj['name'],
-                'SET_NETWORK {} ssid \"{}\"'.format(network_id, params.ssid))
+        for cmd in network_profile_cmds(network_id, params):
+            self._send_cmd_to_wpas(obj['name'], cmd)
 
-        key_mgmt = ''
-        if params.akm[-1] in [AKM_TYPE_WPAPSK, AKM_TYPE_WPA2PSK]:
-            key_mgmt = 'WPA-PSK'
-        elif params.akm[-1] in [AKM_TYPE_WPA, AKM_TYPE_WPA2]:
-            key_mgmt = 'WPA-EAP'
-        else:
-            key_mgmt = 'NONE'
-
-        if key_mgmt:
-            self._send_cmd_to_wpas(
-                    obj['name'],
-                    'SET_NETWORK {} key_mgmt {}'.format(
-                        network_id,
-                        key_mgmt))
-
-        proto = ''
-        if params.akm[-1] in [AKM_TYPE_WPAPSK, AKM_TYPE_WPA]:
-            proto = 'WPA'
-        elif params.akm[-1] in [AKM_TYPE_WPA2PSK, AKM_TYPE_WPA2]:
-            proto = 'RSN'
-
-        if proto:
-            self._send_cmd_to_wpas(
-                    obj['name'],
-                    'SET_NETWORK {} proto {}'.format(
-                        network_id,
-                        proto))
-
-        if params.akm[-1] in [AKM_TYPE_WPAPSK, AKM_TYPE_WPA2PSK]:
-            self._send_cmd_to_wpas(
-                    obj['name'],
-                    'SET_NETWORK {} psk \"{}\"'.format(network_id, params.key))
+        with self._lock:
+            profiles = self._profiles.get(obj['name'])
+            if profiles is not None:
+                key_mgmt, proto = akm_to_key_mgmt_proto(params.akm[-1])
+                profiles.add(network_to_profile(
+                    network_id, '"{}"'.format(params.ssid), key_mgmt, proto,
+                    DEFAULT_PAIRWISE))
+                profiles.set_key(network_id, params)
 
         return params
 
+    def add_network_profiles(self, obj, profiles, save_config=False):
+        """Add AP profiles in pipelines and return whether each is added.
+
+        The ADD_NETWORK cmds of all the profiles are pipelined, then all
+        their SET_NETWORK cmds. A network with a failed SET_NETWORK is
+        removed again. If save_config is True, the configuration is
+        saved once after adding the profiles.
+        """
+
+        iface = obj['name']
+        profiles = list(profiles)
+        for params in profiles:
+            params.process_akm()
+            check_network_key(params)
+
+        network_ids = [reply.strip() for reply in self._send_cmds_to_wpas(
+            iface, ['ADD_NETWORK'] * len(profiles))]
+        added = [network_id.isdigit() for network_id in network_ids]
+
+        cmds = []
+        owners = []
+        for i, params in enumerate(profiles):
+            if not added[i]:
+                self._logger.error("Add profile '%s' failed: '%s'",
+                                   params.ssid, network_ids[i])
+                continue
+            for cmd in network_profile_cmds(network_ids[i], params):
+                cmds.append(cmd)
+                owners.append(i)
+
+        failed = []
+        for i, cmd, reply in zip(owners, cmds,
+                                 self._send_cmds_to_wpas(iface, cmds)):
+            if reply != 'OK\n' and added[i]:
+                self._logger.error(
+                    "Unexpected resp '%s' for Command '%s'", reply, cmd)
+                added[i] = False
+                failed.append(i)
+
+        # Do not leave partially configured networks behind.
+        if failed:
+            self._send_cmds_to_wpas(
+                iface,
+                ['REMOVE_NETWORK {}'.format(network_ids[i]) for i in failed])
+
+        with self._lock:
+            cache = self._profiles.get(iface)
+            if cache is not None:
+                for i, params in enumerate(profiles):
+                    if added[i]:
+                        key_mgmt, proto = akm_to_key_mgmt_proto(
+                            params.akm[-1])
+                        cache.add(network_to_profile(
+                            network_ids[i], '"{}"'.format(params.ssid),
+                            key_mgmt, proto, DEFAULT_PAIRWISE))
+                        cache.set_key(network_ids[i], params)
+
+        if save_config:
+            self._send_cmd_to_wpas(iface, 'SAVE_CONFIG')
+
+        return added
+
+    def sync_network_profiles(self, obj, desired, save_config=False):
+        """Make the AP profiles the desired ones with the fewest cmds.
+
+        The stored networks of the ssid of a desired profile are updated
+        with SET_NETWORK instead of being removed and added again. The
+        stored keys cannot be read, so the key of a desired WPA-PSK
+        profile is set unless it is the key last set by pywifi. The
+        ciphers are not configured, so they are not compared. Return
+        (added, changed, removed, unchanged, failed), where removed are
+        the stored profiles, failed are the desired profiles which could
+        not be set and the stored profiles which could not be removed,
+        and the others are desired profiles.
+        """
+
+        iface = obj['name']
+        stored = self.network_profiles(obj)
+        with self._lock:
+            cache = self._profiles.get(iface)
+            key_changed = cache.key_changed if cache is not None else None
+            unchanged, changed, added, removed = diff_profiles(
+                stored, list(desired), key_changed, False)
+
+        cmds = ['REMOVE_NETWORK {}'.format(profile.id)
+                for profile in removed]
+        owners = [('remove', i) for i in range(len(removed))]
+        for i, (profile, params) in enumerate(changed):
+            if profile == params:
+                # Only the key differs.
+                profile_cmds = network_key_cmds(profile.id, params)
+            else:
+                # The ssid is kept.
+                profile_cmds = network_profile_cmds(profile.id, params)[1:]
+            for cmd in profile_cmds:
+                cmds.append(cmd)
+                owners.append(('change', i))
+
+        failed_removed = set()
+        failed_ids = set()
+        for (action, i), cmd, reply in zip(
+                owners, cmds, self._send_cmds_to_wpas(iface, cmds)):
+            if reply != 'OK\n':
+                self._logger.error(
+                    "Unexpected resp '%s' for Command '%s'", reply, cmd)
+                if action == 'remove':
+                    failed_removed.add(i)
+                else:
+                    failed_ids.add(i)
+
+        with self._lock:
+            cache = self._profiles.get(iface)
+            if cache is not None:
+                for i, profile in enumerate(removed):
+                    if i not in failed_removed:
+                        cache.remove(profile.id)
+                for i, (profile, params) in enumerate(changed):
+                    cache.remove(profile.id)
+                    if i in failed_ids:
+                        # Some of its cmds may have been applied.
+                        cache.unknown_ids.add(profile.id)
+                        continue
+                    key_mgmt, proto = akm_to_key_mgmt_proto(params.akm[-1])
+                    network = network_to_profile(
+                        profile.id, '"{}"'.format(params.ssid), key_mgmt,
+                        proto, DEFAULT_PAIRWISE)
+                    network.cipher = profile.cipher
+                    cache.add(network)
+                    cache.set_key(profile.id, params)
+        if removed or changed:
+            self._invalidate_state(iface)
+
+        failed = [profile for i, profile in enumerate(removed)
+                  if i in failed_removed]
+        removed = [profile for i, profile in enumerate(removed)
+                   if i not in failed_removed]
+        failed.extend(params for i, (_, params) in enumerate(changed)
+                      if i in failed_ids)
+        changed = [params for i, (_, params) in enumerate(changed)
+                   if i not in failed_ids]
+        results = self.add_network_profiles(obj, added)
+        failed.extend(params for params, ok in zip(added, results) if not ok)
+        added = [params for params, ok in zip(added, results) if ok]
+
+        if save_config and (added or changed or removed):
+            self._send_cmd_to_wpas(iface, 'SAVE_CONFIG')
+
+        return added, changed, removed, unchanged, failed
+
     def network_profiles(self, obj):
         """Get AP profiles."""
 
+        iface = obj['name']
+        mon = self._attach_to_wpa_s(iface)
+        # Without a monitor, the networks changed by others are unknown.
+        if not mon:
+            return self._list_network_profiles(iface)
+
+        events = []
+        with self._lock:
+            cache = self._profiles.get(iface)
+            if cache is not None and not cache.unknown_ids:
+                return cache.copies()
+            self._listings.setdefault(iface, []).append(events)
+
+        try:
+            networks = self._list_network_profiles(iface)
+        finally:
+            with self._lock:
+                self._listings[iface].remove(events)
+
+        with self._lock:
+            # None is read if the cache has to be dropped meanwhile.
+            if not mon.closed and None not in events:
+                cache = _ProfileCache(networks)
+                for event in events:
+                    cache.apply(event)
+                self._profiles[iface] = cache
+                return cache.copies()
+
+        return networks
+
+    def _list_network_profiles(self, iface):
+
         networks = []
-        network_ids = []
         network_summary = self._send_cmd_to_wpas(
-            obj['name'],
+            iface,
             'LIST_NETWORKS',
             True)
-        network_summary = network_summary[:-1].split('\n')
-        if len(network_summary) == 1:
-            return networks
-
-        for l in network_summary[1:]:
-            network_ids.append(l.split()[0])
+        network_ids = [network_id for network_id, _ in
+                       parse_network_list(network_summary)]
 
+        cmds = []
         for network_id in network_ids:
-            network = Profile()
-
-            network.id = network_id
-
-            ssid = self._send_cmd_to_wpas(
-                obj['name'],
-                'GET_NETWORK {} ssid'.format(network_id), True)
-            if ssid.upper().startswith('FAIL'):
-                continue
-            else:
-                network.ssid = ssid[1:-1]
-
-            key_mgmt = self._send_cmd_to_wpas(
-                obj['name'],
-                'GET_NETWORK {} key_mgmt'.format(network_id),
-                True)
-
-            network.akm = []
-            if key_mgmt.upper().startswith('FAIL'):
-                continue
-            else:
-                if key_mgmt.upper() in ['WPA-PSK']:
-                    proto = self._send_cmd_to_wpas(
-                        obj['name'],
-                        'GET_NETWORK {} proto'.format(network_id),
-                        True)
-
-                    if proto.upper() == 'RSN':
-                        network.akm.append(AKM_TYPE_WPA2PSK)
-                    else:
-                        network.akm.append(AKM_TYPE_WPAPSK)
-                elif key_mgmt.upper() in ['WPA-EAP']:
-                    proto = self._send_cmd_to_wpas(
-                        obj['name'],
-                        'GET_NETWORK {} proto'.format(network_id),
-                        True)
-
-                    if proto.upper() == 'RSN':
-                        network.akm.append(AKM_TYPE_WPA2)
-                    else:
-                        network.akm.append(AKM_TYPE_WPA)
-
-            ciphers = self._send_cmd_to_wpas(
-                obj['name'],
-                'GET_NETWORK {} pairwise'.format(network_id),
-                True).split(' ')
-
-            if ciphers[0].upper().startswith('FAIL'):
-                continue
-            else:
-                # Assume the possible ciphers TKIP and CCMP
-                if len(ciphers) == 1:
-                    network.cipher = cipher_str_to_value(ciphers[0].upper())
-                elif 'CCMP' in ciphers:
-                    network.cipher = CIPHER_TYPE_CCMP
-
-            networks.append(network)
+            for field in ('ssid', 'key_mgmt', 'pairwise'):
+                cmds.append('GET_NETWORK {} {}'.format(network_id, field))
+        replies = self._send_cmds_to_wpas(iface, cmds)
+
+        # proto is only needed to tell WPA from WPA2.
+        proto_ids = [network_id for i, network_id in enumerate(network_ids)
+                     if replies[i * 3 + 1].upper() in ['WPA-PSK', 'WPA-EAP']]
+        protos = dict(zip(proto_ids, self._send_cmds_to_wpas(
+            iface,
+            ['GET_NETWORK {} proto'.format(i) for i in proto_ids])))
+
+        for i, network_id in enumerate(network_ids):
+            ssid, key_mgmt, pairwise = replies[i * 3:i * 3 + 3]
+            network = network_to_profile(
+                network_id, ssid, key_mgmt, protos.get(network_id, ''),
+                pairwise)
+            if network:
+                networks.append(network)
 
         return networks
 
@@ -249,6 +1374,10 @@ class WifiUtil():
         network_id = -1
         profiles = self.network_profiles(obj)
 
+        with self._lock:
+            if obj['name'] in self._profiles:
+                profiles = self._profiles[obj['name']].index.find(params)
+
         for profile in profiles:
             if profile == params:
                 network_id = profile.id
@@ -256,23 +1385,58 @@ class WifiUtil():
         if network_id != -1:
             self._send_cmd_to_wpas(obj['name'],
                 'REMOVE_NETWORK {}'.format(network_id))
+            with self._lock:
+                if obj['name'] in self._profiles:
+                    self._profiles[obj['name']].remove(network_id)
+            self._invalidate_state(obj['name'])
 
     def remove_all_network_profiles(self, obj):
         """Remove all the AP profiles."""
 
         self._send_cmd_to_wpas(obj['name'], 'REMOVE_NETWORK all')
 
+        with self._lock:
+            if obj['name'] in self._profiles:
+                self._profiles[obj['name']] = _ProfileCache([])
+        self._invalidate_state(obj['name'])
+
     def status(self, obj):
         """Get the wifi interface status."""
 
-        reply = self._send_cmd_to_wpas(obj['name'], 'STATUS', True)
-        result = reply.split('\n')
+        return self._iface_state(obj['name']).status()
+
+    def status_info(self, obj):
+        """Get the fields of STATUS reply (e.g. bssid, ssid, freq)."""
+
+        return dict(self._iface_state(obj['name'], True).fields)
 
-        status = ''
-        for l in result:
-            if l.startswith('wpa_state='):
-                status = l[10:]
-                return status_dict[status.lower()]
+    def add_status_callback(self, obj, callback):
+        """Call callback(old, new) when the status of the iface changes.
+
+        The callbacks are called by the thread reading the events of the
+        iface, or by the thread which finds the change in status().
+        """
+
+        with self._lock:
+            self._status_callbacks.setdefault(obj['name'], []).append(
+                callback)
+        self._attach_to_wpa_s(obj['name'])
+
+    def remove_status_callback(self, obj, callback):
+        """Stop calling callback when the status of the iface changes."""
+
+        with self._lock:
+            self._status_callbacks.get(obj['name'], []).remove(callback)
+
+    def set_observer(self, observer):
+        """Pass the round trips of the cmds to observer (None to stop).
+
+        The connections are shared by the WifiUtil objects, so the cmds
+        of all the ifaces are observed.
+        """
+
+        global _observer
+        _observer = observer
 
     def interfaces(self):
         """Get the wifi interface lists."""
@@ -291,52 +1455,183 @@ class WifiUtil():
 
     def _connect_to_wpa_s(self, iface):
 
-        ctrl_iface = '/'.join([CTRL_IFACE_DIR, iface])
-        if ctrl_iface in self._connections:
-            self._logger.info(
-                "Connection for iface '%s' aleady existed!",
-                iface)
-
-        sock_file = '{}/{}_{}'.format('/tmp', 'pywifi', iface)
-        self._remove_existed_sock(sock_file)
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
-        sock.bind(sock_file)
-        sock.connect(ctrl_iface)
-
-        send_len = sock.send(b'PING')
-        retry = CTRL_IFACE_RETRY
-        while retry >= 0:
-            reply = sock.recv(REPLY_SIZE)
-            if reply == b'':
-                self._logger.error("Connection to '%s' is broken!", iface_ctrl)
-                break
+        with self._pool_lock:
+            conn = self._connections.get(iface)
+            if conn is not None:
+                if conn.ping():
+                    self._logger.info(
+                        "Connection for iface '%s' aleady existed!",
+                        iface)
+                    return
+                conn.close()
+
+            self._reset_iface(iface)
+            conn = CtrlConnection(
+                iface, on_reconnect=lambda: self._reset_iface(iface))
+            if conn.open():
+                self._connections[iface] = conn
+            else:
+                self._connections.pop(iface, None)
+
+    def _reset_iface(self, iface):
+        """Drop the states of iface which wpa_s may have lost."""
 
-            if reply.startswith(b'PONG'):
-                self._logger.info(
-                    "Connect to sock '%s' successfully!", ctrl_iface)
-                self._connections[iface] = {
-                    'sock': sock,
-                    'sock_file': sock_file,
-                    'ctrl_iface': ctrl_iface
-                }
-                break
-            retry -= 1
+        # Events are not sent to the monitor socket of a restarted wpa_s.
+        # The caches are dropped after attaching again, so none is built
+        # from the networks listed before.
+        with self._pool_lock:
+            mon = self._monitors.get(iface)
+            if mon is not None and not mon.reconnect():
+                mon.close()
+                del self._monitors[iface]
 
-    def _remove_existed_sock(self, sock_file):
+        self._drop_caches(iface)
+        with self._lock:
+            self._last_bss_ids.pop(iface, None)
+            self._states.pop(iface, None)
 
-        if os.path.exists(sock_file):
-            mode = os.stat(sock_file).st_mode
-            if stat.S_ISSOCK(mode):
-                os.remove(sock_file)
+    def _drop_caches(self, iface):
+        """Drop the cached profiles of iface, which may miss events."""
 
-    def _send_cmd_to_wpas(self, iface, cmd, get_reply=False):
+        with self._lock:
+            self._profiles.pop(iface, None)
+            for events in self._listings.get(iface, []):
+                events.append(None)
+
+    def _attach_to_wpa_s(self, iface):
+        """Start a monitor which reads the events of iface."""
+
+        with self._pool_lock:
+            if iface in self._monitors:
+                return self._monitors[iface]
 
-        if 'psk' not in cmd:
-            self._logger.info("Send cmd '%s' to wpa_s", cmd)
-        sock = self._connections[iface]['sock']
+            mon = _Monitor(iface, self._handle_event, self._monitor_lost)
+            if not mon.open():
+                return None
+
+            self._monitors[iface] = mon
+
+        return mon
+
+    def _monitor_lost(self, mon):
+
+        with self._pool_lock:
+            if self._monitors.get(mon.iface) is mon:
+                del self._monitors[mon.iface]
+
+        self._drop_caches(mon.iface)
+        self._invalidate_state(mon.iface)
 
-        sock.send(bytearray(cmd, 'utf-8'))
-        reply = sock.recv(REPLY_SIZE)
+    def _handle_event(self, iface, event):
+        """Keep the cached states of iface up to date with event."""
+
+        wpa_state = None
+        if event.startswith('CTRL-EVENT-STATE-CHANGE'):
+            state = parse_event_fields(event).get('state', '')
+            if state.isdigit() and int(state) < len(WPA_STATES):
+                wpa_state = WPA_STATES[int(state)]
+        elif event.startswith('CTRL-EVENT-CONNECTED'):
+            wpa_state = 'COMPLETED'
+        elif event.startswith('CTRL-EVENT-DISCONNECTED'):
+            wpa_state = 'DISCONNECTED'
+
+        if wpa_state is not None:
+            self._set_state(iface, _IfaceState(wpa_state))
+            return
+
+        if not event.startswith(('CTRL-EVENT-NETWORK-ADDED',
+                                 'CTRL-EVENT-NETWORK-REMOVED')):
+            return
+
+        with self._lock:
+            for events in self._listings.get(iface, []):
+                events.append(event)
+            profiles = self._profiles.get(iface)
+            if profiles is not None:
+                profiles.apply(event)
+
+    def _iface_state(self, iface, full=False):
+        """Get the state of iface, reading STATUS only if it is stale."""
+
+        # The monitor keeps the cached state up to date between the reads.
+        self._attach_to_wpa_s(iface)
+        with self._lock:
+            state = self._states.get(iface)
+            if state is not None and state.fresh(full):
+                return state
+
+        start = time.time()
+        state = self._read_state(iface)
+        cached = self._set_state(iface, state, start)
+        # An event read meanwhile tells the newer state, but no fields.
+        if full and cached.fields is None:
+            return state
+
+        return cached
+
+    def _read_state(self, iface):
+
+        fields = parse_status_fields(
+            self._send_cmd_to_wpas(iface, 'STATUS', True))
+
+        return _IfaceState(fields.get('wpa_state'), fields)
+
+    def _set_state(self, iface, state, since=None):
+        """Cache state and return the cached state.
+
+        If an event updated the state after since, the state is dropped.
+        """
+
+        with self._lock:
+            last = self._states.get(iface)
+            if since is not None and last is not None and\
+                    last.updated > since:
+                return last
+            self._states[iface] = state
+            callbacks = list(self._status_callbacks.get(iface, []))
+
+        if last is None or last.status() == state.status():
+            return state
+
+        for callback in callbacks:
+            try:
+                callback(last.status(), state.status())
+            except Exception:
+                self._logger.exception("Status callback of iface '%s' "
+                                       "failed", iface)
+
+        return state
+
+    def _invalidate_state(self, iface):
+        """Read STATUS next time, as a cmd may have changed the state."""
+
+        with self._lock:
+            state = self._states.get(iface)
+            if state is not None:
+                state.updated = 0
+
+    def _wait_for_event(self, waiter, timeout):
+        """Wait for the next event collected by waiter."""
+
+        event = waiter.get(timeout)
+        if event is not None:
+            self._logger.info("Get event '%s' from wpa_s", event.strip())
+
+        return event
+
+    def _send_cmds_to_wpas(self, iface, cmds):
+        """Send cmds in a pipeline and return their replies in order."""
+
+        return self._connections[iface].requests(cmds)
+
+    def _send_cmd_to_wpas_raw(self, iface, cmd):
+        """Send cmd and return the reply in the receive buffer."""
+
+        return self._connections[iface].request(cmd)
+
+    def _send_cmd_to_wpas(self, iface, cmd, get_reply=False):
+
+        reply = self._connections[iface].request(cmd).tobytes()
         if get_reply:
             return reply.decode('utf-8')
 
@@ -345,3 +1640,14 @@ class WifiUtil():
                 "Unexpected resp '%s' for Command '%s'",
                 reply.decode('utf-8'),
                 cmd)
+
+
+def _close_connections():
+
+    for conns in (WifiUtil._connections, WifiUtil._monitors):
+        for conn in conns.values():
+            conn.close()
+        conns.clear()
+
+
+atexit.register(_close_connections)
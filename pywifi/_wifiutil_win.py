@@ -5,6 +5,7 @@
 
 import re
 import platform
+import threading
 import time
 import logging
 from ctypes import *
@@ -12,7 +13,7 @@ from ctypes.wintypes import *
 from comtypes import GUID
 
 from .const import *
-from .profile import Profile
+from .profile import Profile, ScanResult, diff_profiles, key_digest
 
 
 if platform.release().lower() == 'xp':
@@ -34,6 +35,21 @@ if not "PWCHAR" in dir():
 ERROR_SUCCESS = 0
 WLAN_MAX_PHY_TYPE_NUMBER = 8
 DOT11_MAC_ADDRESS = c_ubyte * 6
+# Drivers have to complete a scan within 4 seconds.
+WLAN_SCAN_TIME = 4
+CONNECT_TIMEOUT = 30
+# The interval of polling the status while waiting for connecting.
+CONNECT_POLL_TIME = 0.1
+# The opcodes of WlanQueryInterface.
+WLAN_INTF_OPCODE_CURRENT_CONNECTION = 7
+WLAN_INTF_OPCODE_INTERFACE_STATE = 6
+# The notifications of the auto configuration module (ACM).
+WLAN_NOTIFICATION_SOURCE_ACM = 0x08
+WLAN_NOTIFICATION_ACM_SCAN_COMPLETE = 7
+WLAN_NOTIFICATION_ACM_SCAN_FAIL = 8
+WLAN_NOTIFICATION_ACM_CONNECTION_COMPLETE = 10
+WLAN_NOTIFICATION_ACM_CONNECTION_ATTEMPT_FAIL = 11
+WLAN_REASON_CODE_SUCCESS = 0
 
 
 native_wifi = windll.wlanapi
@@ -49,6 +65,38 @@ status_dict = [
     IFACE_CONNECTING
 ]
 
+# The wpa_states of wpa_supplicant closest to the WLAN_INTERFACE_STATEs.
+wpa_state_list = [
+    'INTERFACE_DISABLED',
+    'COMPLETED',
+    'COMPLETED',
+    'DISCONNECTED',
+    'DISCONNECTED',
+    'ASSOCIATING',
+    'ASSOCIATING',
+    'AUTHENTICATING'
+]
+
+# The key_mgmt of wpa_supplicant by DOT11_AUTH_ALGORITHM.
+key_mgmt_dict = {
+    1: 'NONE',
+    2: 'NONE',
+    3: 'WPA/IEEE 802.1X/EAP',
+    4: 'WPA-PSK',
+    6: 'WPA2/IEEE 802.1X/EAP',
+    7: 'WPA2-PSK'
+}
+
+# The ciphers of wpa_supplicant by DOT11_CIPHER_ALGORITHM.
+cipher_name_dict = {
+    0x00: 'NONE',
+    0x01: 'WEP-40',
+    0x02: 'TKIP',
+    0x04: 'CCMP',
+    0x05: 'WEP-104',
+    0x100: 'WEP'
+}
+
 auth_value_to_str_dict = {
     AUTH_ALG_OPEN: 'open',
     AUTH_ALG_SHARED: 'shared'
@@ -225,6 +273,41 @@ class WLAN_CONNECTION_PARAMETERS(Structure):
     ]
 
 
+class WLAN_ASSOCIATION_ATTRIBUTES(Structure):
+
+    _fields_ = [
+        ("dot11Ssid", DOT11_SSID),
+        ("dot11BssType", c_uint),
+        ("dot11Bssid", DOT11_MAC_ADDRESS),
+        ("dot11PhyType", c_uint),
+        ("uDot11PhyIndex", c_ulong),
+        ("wlanSignalQuality", c_ulong),
+        ("ulRxRate", c_ulong),
+        ("ulTxRate", c_ulong)
+    ]
+
+
+class WLAN_SECURITY_ATTRIBUTES(Structure):
+
+    _fields_ = [
+        ("bSecurityEnabled", BOOL),
+        ("bOneXEnabled", BOOL),
+        ("dot11AuthAlgorithm", c_uint),
+        ("dot11CipherAlgorithm", c_uint)
+    ]
+
+
+class WLAN_CONNECTION_ATTRIBUTES(Structure):
+
+    _fields_ = [
+        ("isState", c_uint),
+        ("wlanConnectionMode", c_uint),
+        ("strProfileName", c_wchar * 256),
+        ("wlanAssociationAttributes", WLAN_ASSOCIATION_ATTRIBUTES),
+        ("wlanSecurityAttributes", WLAN_SECURITY_ATTRIBUTES)
+    ]
+
+
 class WLAN_PROFILE_INFO(Structure):
 
     _fields_ = [
@@ -242,18 +325,120 @@ class WLAN_PROFILE_INFO_LIST(Structure):
     ]
 
 
+class WLAN_NOTIFICATION_DATA(Structure):
+
+    _fields_ = [
+        ("NotificationSource", DWORD),
+        ("NotificationCode", DWORD),
+        ("InterfaceGuid", GUID),
+        ("dwDataSize", DWORD),
+        ("pData", c_void_p)
+    ]
+
+
+class WLAN_CONNECTION_NOTIFICATION_DATA(Structure):
+
+    _fields_ = [
+        ("wlanConnectionMode", c_uint),
+        ("strProfileName", c_wchar * 256),
+        ("dot11Ssid", DOT11_SSID),
+        ("dot11BssType", c_uint),
+        ("bSecurityEnabled", BOOL),
+        ("wlanReasonCode", DWORD),
+        ("dwFlags", DWORD),
+        ("strProfileXml", c_wchar * 1)
+    ]
+
+
+WLAN_NOTIFICATION_CALLBACK = WINFUNCTYPE(
+    None, POINTER(WLAN_NOTIFICATION_DATA), c_void_p)
+
+
+class _NotificationWaiter(object):
+    """Collect the ACM notifications of codes on an iface for a thread."""
+
+    def __init__(self, guid, codes):
+
+        self.guid = guid
+        self.codes = codes
+        self._notifications = []
+        self._cond = threading.Condition()
+
+    def put(self, notification):
+
+        with self._cond:
+            self._notifications.append(notification)
+            self._cond.notify()
+
+    def get(self, timeout):
+        """Get the next (code, reason, profile name), or None on timeout."""
+
+        deadline = time.time() + timeout
+        with self._cond:
+            while not self._notifications:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+            return self._notifications.pop(0)
+
+
 class WifiUtil():
     """WifiUtil implements the wifi functions in Windows."""
 
     _nego_version = DWORD()
     _handle = HANDLE()
     _ifaces = pointer(WLAN_INTERFACE_INFO_LIST())
+    # The last status and the status callbacks of each iface.
+    _statuses = {}
+    _status_callbacks = {}
+    # The digests of the keys set by pywifi, by (iface name, ssid).
+    _key_digests = {}
+    # The registered WLAN_NOTIFICATION_CALLBACK, which has to be kept
+    # alive, and the threads waiting for notifications.
+    _notification_callback = None
+    _notification_waiters = []
+    _lock = threading.RLock()
     _logger = logging.getLogger('pywifi')
 
-    def scan(self, obj):
-        """Trigger the wifi interface to scan."""
+    def scan(self, obj, wait=False, timeout=WLAN_SCAN_TIME):
+        """Trigger the wifi interface to scan.
+
+        If wait is True, block until Windows notifies the end of the scan
+        and return True if the results are ready or False if the scan
+        failed or timed out. If the notifications cannot be registered,
+        wait for the time a driver may take to scan and return None, as
+        the outcome is unknown.
+        """
+
+        if not wait:
+            self._wlan_scan(self._handle, byref(obj['guid']))
+            return None
+
+        if not self._register_notifications():
+            self._wlan_scan(self._handle, byref(obj['guid']))
+            time.sleep(min(timeout, WLAN_SCAN_TIME))
+            return None
 
-        self._wlan_scan(self._handle, byref(obj['guid']))
+        waiter = self._wait_for(obj, (WLAN_NOTIFICATION_ACM_SCAN_COMPLETE,
+                                      WLAN_NOTIFICATION_ACM_SCAN_FAIL))
+        try:
+            ret = self._wlan_scan(self._handle, byref(obj['guid']))
+            if ret != ERROR_SUCCESS:
+                self._logger.error("Scan on iface '%s' failed: %d",
+                                   obj['name'], ret)
+                return False
+
+            notification = waiter.get(timeout)
+        finally:
+            self._stop_waiting(waiter)
+
+        if notification is None:
+            self._logger.error("Scan on iface '%s' timed out", obj['name'])
+            return False
+
+        return notification[0] == WLAN_NOTIFICATION_ACM_SCAN_COMPLETE
 
     def scan_results(self, obj):
         """Get the AP list after scanning."""
@@ -292,7 +477,7 @@ class WifiUtil():
                     auth_alg = [AUTH_ALG_OPEN]
 
                 for j in range(bss_list.contents.dwNumberOfItems):
-                    network = Profile()
+                    network = ScanResult()
 
                     network.ssid = ssid
 
@@ -308,8 +493,14 @@ class WifiUtil():
 
         return network_list
 
-    def connect(self, obj, params):
-        """Connect to the specified AP."""
+    def connect(self, obj, params, wait=False, timeout=CONNECT_TIMEOUT):
+        """Connect to the specified AP.
+
+        If wait is True, block until Windows notifies the outcome of the
+        connection or timeout seconds elapsed and return (status, reason,
+        elapsed). If the notifications cannot be registered, the status
+        is polled instead, so only a success is found before timeout.
+        """
 
         connect_params = WLAN_CONNECTION_PARAMETERS()
         connect_params.wlanConnectionMode = 0  # Profile
@@ -317,9 +508,55 @@ class WifiUtil():
         profile_name = create_unicode_buffer(params.ssid)
 
         connect_params.strProfile = profile_name.value
-        ret = self._wlan_connect(
-            self._handle, obj['guid'], byref(connect_params))
-        self._logger.debug('connect result: %d', ret)
+
+        waiter = None
+        if wait and self._register_notifications():
+            waiter = self._wait_for(
+                obj, (WLAN_NOTIFICATION_ACM_CONNECTION_COMPLETE,
+                      WLAN_NOTIFICATION_ACM_CONNECTION_ATTEMPT_FAIL))
+        try:
+            start = time.time()
+            ret = self._wlan_connect(
+                self._handle, obj['guid'], byref(connect_params))
+            self._logger.debug('connect result: %d', ret)
+
+            if not wait:
+                return None
+
+            if ret != ERROR_SUCCESS:
+                return CONNECT_FAILED, ret, time.time() - start
+
+            if waiter is not None:
+                return self._wait_for_connection(
+                    waiter, params.ssid, start, timeout)
+        finally:
+            if waiter is not None:
+                self._stop_waiting(waiter)
+
+        while time.time() - start < timeout:
+            if self.status(obj) == IFACE_CONNECTED:
+                return CONNECT_SUCCEEDED, None, time.time() - start
+            time.sleep(CONNECT_POLL_TIME)
+
+        return CONNECT_TIMED_OUT, None, time.time() - start
+
+    def _wait_for_connection(self, waiter, profile_name, start, timeout):
+        """Wait for the outcome of connecting with profile_name."""
+
+        while True:
+            notification = waiter.get(timeout - (time.time() - start))
+            if notification is None:
+                return CONNECT_TIMED_OUT, None, time.time() - start
+
+            code, reason, name = notification
+            # Skip the connections started by others meanwhile.
+            if name != profile_name:
+                continue
+            if code == WLAN_NOTIFICATION_ACM_CONNECTION_COMPLETE and\
+                    reason == WLAN_REASON_CODE_SUCCESS:
+                return CONNECT_SUCCEEDED, None, time.time() - start
+
+            return CONNECT_FAILED, reason, time.time() - start
 
     def disconnect(self, obj):
         """Disconnect to the specified AP."""
@@ -329,6 +566,53 @@ class WifiUtil():
     def add_network_profile(self, obj, params):
         """Add an AP profile for connecting to afterward."""
 
+        self._set_network_profile(obj, params)
+
+        return params
+
+    def add_network_profiles(self, obj, profiles, save_config=False):
+        """Add AP profiles and return whether each is added.
+
+        The profiles of Windows are always saved, so save_config is
+        ignored.
+        """
+
+        return [self._set_network_profile(obj, params)
+                for params in profiles]
+
+    def sync_network_profiles(self, obj, desired, save_config=False):
+        """Make the AP profiles the desired ones.
+
+        The profiles of a changed ssid are overwritten. The keys and
+        ciphers of the profiles are not read back, so a key is set unless
+        it is the key last set by pywifi, and the ciphers are not
+        compared. Return (added, changed, removed, unchanged, failed) as
+        the Linux one.
+        """
+
+        with self._lock:
+            key_digests = dict(self._key_digests)
+        unchanged, changed, added, removed = diff_profiles(
+            self.network_profiles(obj), list(desired),
+            lambda profile, params: key_digests.get(
+                (obj['name'], profile.ssid)) != key_digest(params),
+            False)
+
+        for profile in removed:
+            self.remove_network_profile(obj, profile)
+
+        changed = [params for _, params in changed]
+        failed = [params for params in changed + added
+                  if not self._set_network_profile(obj, params)]
+        failed_ids = set(id(params) for params in failed)
+        changed = [params for params in changed
+                   if id(params) not in failed_ids]
+        added = [params for params in added if id(params) not in failed_ids]
+
+        return added, changed, removed, unchanged, failed
+
+    def _set_network_profile(self, obj, params):
+
         reason_code = DWORD()
 
         params.process_akm()
@@ -343,6 +627,10 @@ class WifiUtil():
             profile_data['encrypt'] = cipher_value_to_str_dict[params.cipher]
 
         profile_data['key'] = params.key
+        if params.key_type == KEY_TYPE_NETWORKKEY:
+            profile_data['key_type'] = 'networkKey'
+        else:
+            profile_data['key_type'] = 'passPhrase'
 
         profile_data['protected'] = 'false'
         profile_data['profile_name'] = params.ssid
@@ -368,7 +656,7 @@ class WifiUtil():
 
         if AKM_TYPE_NONE not in params.akm:
             xml += """<sharedKey>
-                        <keyType>passPhrase</keyType>
+                        <keyType>{key_type}</keyType>
                         <protected>{protected}</protected>
                         <keyMaterial>{key}</keyMaterial>
                     </sharedKey>"""
@@ -389,12 +677,18 @@ class WifiUtil():
                                         True, byref(reason_code))
         if status != ERROR_SUCCESS:
             self._logger.debug("Status %d: Add profile failed", status)
+        with self._lock:
+            if status == ERROR_SUCCESS:
+                self._key_digests[(obj['name'], params.ssid)] =\
+                    key_digest(params)
+            else:
+                self._key_digests.pop((obj['name'], params.ssid), None)
 
         buf_size = DWORD(64)
         buf = create_unicode_buffer(64)
         self._wlan_reason_code_to_str(reason_code, buf_size, buf)
-        
-        return params
+
+        return status == ERROR_SUCCESS
 
     def network_profile_name_list(self, obj):
         """Get AP profile names."""
@@ -456,6 +750,8 @@ class WifiUtil():
         str_buf = create_unicode_buffer(params.ssid)
         ret = self._wlan_delete_profile(self._handle, obj['guid'], str_buf)
         self._logger.debug("delete result %d", ret)
+        with self._lock:
+            self._key_digests.pop((obj['name'], params.ssid), None)
 
     def remove_all_network_profiles(self, obj):
         """Remove all the AP profiles."""
@@ -467,18 +763,165 @@ class WifiUtil():
             str_buf = create_unicode_buffer(profile_name)
             ret = self._wlan_delete_profile(self._handle, obj['guid'], str_buf)
             self._logger.debug("delete result %d", ret)
+            with self._lock:
+                self._key_digests.pop((obj['name'], profile_name), None)
 
     def status(self, obj):
         """Get the wifi interface status."""
 
+        return self._set_status(obj, status_dict[self._iface_state(obj)])
+
+    def status_info(self, obj):
+        """Get the fields of the status like the STATUS of wpa_s.
+
+        The fields of the connection (ssid, bssid, key_mgmt and
+        pairwise_cipher) are only given while the iface is connected.
+        """
+
         data_size = DWORD()
         data = PDWORD()
         opcode_value_type = DWORD()
-        self._wlan_query_interface(self._handle, obj['guid'], 6,
+        ret = self._wlan_query_interface(self._handle, obj['guid'],
+                                         WLAN_INTF_OPCODE_CURRENT_CONNECTION,
+                                         byref(data_size), byref(data),
+                                         byref(opcode_value_type))
+        if ret != ERROR_SUCCESS:
+            # Not connected, so only the state is known.
+            state = self._iface_state(obj)
+            self._set_status(obj, status_dict[state])
+            return {'wpa_state': wpa_state_list[state]}
+
+        attrs = cast(data, POINTER(WLAN_CONNECTION_ATTRIBUTES)).contents
+        assoc = attrs.wlanAssociationAttributes
+        security = attrs.wlanSecurityAttributes
+        fields = {
+            'wpa_state': wpa_state_list[attrs.isState],
+            'ssid': assoc.dot11Ssid.ucSSID[
+                :assoc.dot11Ssid.uSSIDLength].decode('utf-8', 'replace'),
+            'bssid': ':'.join('{:02x}'.format(byte)
+                              for byte in assoc.dot11Bssid),
+            'key_mgmt': key_mgmt_dict.get(security.dot11AuthAlgorithm,
+                                          'UNKNOWN'),
+            'pairwise_cipher': cipher_name_dict.get(
+                security.dot11CipherAlgorithm, 'UNKNOWN'),
+        }
+        state = attrs.isState
+        self._wlan_free_memory(data)
+        self._set_status(obj, status_dict[state])
+
+        return fields
+
+    def add_status_callback(self, obj, callback):
+        """Call callback(old, new) when the status changes.
+
+        Windows reports no state changes to pywifi, so the changes are
+        found by status() and status_info().
+        """
+
+        with self._lock:
+            self._status_callbacks.setdefault(obj['name'], []).append(
+                callback)
+
+    def remove_status_callback(self, obj, callback):
+        """Stop calling callback when the status changes."""
+
+        with self._lock:
+            self._status_callbacks.get(obj['name'], []).remove(callback)
+
+    def _iface_state(self, obj):
+        """Get the WLAN_INTERFACE_STATE of the iface."""
+
+        data_size = DWORD()
+        data = PDWORD()
+        opcode_value_type = DWORD()
+        self._wlan_query_interface(self._handle, obj['guid'],
+                                   WLAN_INTF_OPCODE_INTERFACE_STATE,
                                    byref(data_size), byref(data),
                                    byref(opcode_value_type))
+        state = data.contents.value
+        self._wlan_free_memory(data)
+
+        return state
+
+    def _set_status(self, obj, status):
+
+        with self._lock:
+            last = self._statuses.get(obj['name'])
+            self._statuses[obj['name']] = status
+            callbacks = list(self._status_callbacks.get(obj['name'], []))
+
+        if last is not None and last != status:
+            for callback in callbacks:
+                try:
+                    callback(last, status)
+                except Exception:
+                    self._logger.exception(
+                        "Status callback of iface '%s' failed", obj['name'])
+
+        return status
+
+    def _register_notifications(self):
+        """Register for the ACM notifications once, return whether done."""
+
+        with self._lock:
+            if WifiUtil._notification_callback is None:
+                callback = WLAN_NOTIFICATION_CALLBACK(self._on_notification)
+                ret = self._wlan_register_notification(
+                    self._handle, WLAN_NOTIFICATION_SOURCE_ACM, callback)
+                if ret != ERROR_SUCCESS:
+                    self._logger.error(
+                        "Register notifications failed: %d", ret)
+                    return False
+                WifiUtil._notification_callback = callback
 
-        return status_dict[data.contents.value]
+        return True
+
+    def _wait_for(self, obj, codes):
+        """Start collecting the notifications of codes on the iface."""
+
+        waiter = _NotificationWaiter(str(obj['guid']), codes)
+        with self._lock:
+            self._notification_waiters.append(waiter)
+
+        return waiter
+
+    def _stop_waiting(self, waiter):
+
+        with self._lock:
+            self._notification_waiters.remove(waiter)
+
+    def _on_notification(self, data, context):
+        """Pass an ACM notification to the waiters of its iface.
+
+        It is called by a thread of the WLAN service.
+        """
+
+        try:
+            data = data.contents
+            if data.NotificationSource != WLAN_NOTIFICATION_SOURCE_ACM:
+                return
+
+            code = data.NotificationCode
+            reason = None
+            name = None
+            if data.pData and code in [
+                    WLAN_NOTIFICATION_ACM_CONNECTION_COMPLETE,
+                    WLAN_NOTIFICATION_ACM_CONNECTION_ATTEMPT_FAIL]:
+                connection = cast(data.pData, POINTER(
+                    WLAN_CONNECTION_NOTIFICATION_DATA)).contents
+                reason = connection.wlanReasonCode
+                name = connection.strProfileName
+            elif data.pData and code == WLAN_NOTIFICATION_ACM_SCAN_FAIL:
+                reason = cast(data.pData, PDWORD).contents.value
+
+            guid = str(data.InterfaceGuid)
+            with self._lock:
+                waiters = [waiter for waiter in self._notification_waiters
+                           if waiter.guid == guid and code in waiter.codes]
+            for waiter in waiters:
+                waiter.put((code, reason, name))
+        except Exception:
+            self._logger.exception("Handle WLAN notification failed")
 
     def interfaces(self):
         """Get the wifi interface lists."""
@@ -553,6 +996,14 @@ class WifiUtil():
         func.restypes = [DWORD]
         return func(handle, iface_guid, None, None, None)
 
+    def _wlan_register_notification(self, handle, source, callback):
+
+        func = native_wifi.WlanRegisterNotification
+        func.argtypes = [HANDLE, DWORD, BOOL, WLAN_NOTIFICATION_CALLBACK,
+                         c_void_p, c_void_p, PDWORD]
+        func.restypes = [DWORD]
+        return func(handle, source, True, callback, None, None, None)
+
     def _wlan_connect(self, handle, iface_guid, params):
 
         func = native_wifi.WlanConnect
@@ -607,6 +1058,12 @@ class WifiUtil():
         func.restypes = [DWORD]
         return func(handle, iface_guid, opcode, None, data_size, data, opcode_value_type)
 
+    def _wlan_free_memory(self, memory):
+
+        func = native_wifi.WlanFreeMemory
+        func.argtypes = [c_void_p]
+        func(memory)
+
     def _wlan_disconnect(self, handle, iface_guid):
 
         func = native_wifi.WlanDisconnect
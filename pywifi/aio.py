@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+aio - asyncio client for the wpa_supplicant control interface.
+
+PyWiFi and AsyncInterface mirror the blocking API of pywifi on Linux, but
+every operation is a coroutine, so many interfaces can be managed from a
+single event loop without a thread per interface.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import socket
+import stat
+import time
+
+from . import _wifiutil_linux as wifiutil
+from .scan import SCAN_RETRY_DELAY, diff_scan_results
+
+
+REQUEST_TIMEOUT = 10
+
+_sock_ids = itertools.count()
+
+
+class _CtrlProtocol(asyncio.DatagramProtocol):
+    """Route the datagrams from wpa_supplicant to replies and events."""
+
+    def __init__(self):
+
+        self.replies = asyncio.Queue()
+        self.event_waiters = []
+
+    def datagram_received(self, data, addr):
+
+        if data.startswith(b'<'):
+            event = data.decode('utf-8')
+            event = event[event.find('>') + 1:]
+            for prefixes, future in self.event_waiters:
+                if not future.done() and event.startswith(prefixes):
+                    future.set_result(event)
+        else:
+            self.replies.put_nowait(data)
+
+    def error_received(self, exc):
+
+        self.replies.put_nowait(exc)
+
+    def wait_for_event(self, prefixes):
+        """Get a future resolved by the next event matching prefixes."""
+
+        future = asyncio.get_event_loop().create_future()
+        waiter = (prefixes, future)
+        self.event_waiters.append(waiter)
+        future.add_done_callback(
+            lambda _: self.event_waiters.remove(waiter))
+
+        return future
+
+
+class _ScanStream:
+    """Async iterator of the ScanBatches of AsyncInterface.scan_stream()."""
+
+    def __init__(self, iface, interval, timeout):
+
+        self._iface = iface
+        self._interval = interval or 0
+        self._timeout = timeout
+        self._state = {}
+        self._next_scan = 0
+
+    def __aiter__(self):
+
+        return self
+
+    async def __anext__(self):
+
+        loop = asyncio.get_event_loop()
+        while True:
+            delay = self._next_scan - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_scan = loop.time() + self._interval
+
+            if not await self._iface.scan(wait=True, timeout=self._timeout):
+                # Do not retry a scan which fails at once in a busy loop.
+                self._iface._logger.warning("Scan failed, retrying")
+                self._next_scan = max(self._next_scan,
+                                      loop.time() + SCAN_RETRY_DELAY)
+                continue
+            batch = diff_scan_results(
+                self._state, await self._iface.scan_results())
+            if batch.new or batch.changed or batch.gone:
+                return batch
+
+
+class AsyncInterface:
+    """AsyncInterface provides coroutines for manipulating a wifi device."""
+
+    def __init__(self, name, ctrl_iface_dir=None):
+
+        self._name = name
+        self._ctrl_iface_dir = ctrl_iface_dir or wifiutil.CTRL_IFACE_DIR
+        self._transport = None
+        self._protocol = None
+        self._sock_file = None
+        self._attached = False
+        # Created by open(), as a lock is bound to the loop of its creator
+        # before Python 3.10.
+        self._lock = None
+        self._logger = logging.getLogger('pywifi')
+
+    def name(self):
+        """"Get the name of the wifi interfacce."""
+
+        return self._name
+
+    async def open(self):
+        """Connect to the control socket of wpa_supplicant."""
+
+        self._lock = asyncio.Lock()
+        await self._open_socket()
+
+        reply = await self._request('PING')
+        if not reply.startswith('PONG'):
+            self._logger.error("Connection to '%s' is broken!",
+                               self._ctrl_iface_dir + '/' + self._name)
+
+    async def _open_socket(self):
+
+        ctrl_iface = '/'.join([self._ctrl_iface_dir, self._name])
+        self._sock_file = '{}/{}_{}_{}_{}'.format(
+            '/tmp', 'pywifi_aio', self._name, os.getpid(), next(_sock_ids))
+        if os.path.exists(self._sock_file):
+            os.remove(self._sock_file)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self._sock_file)
+        sock.connect(ctrl_iface)
+        sock.setblocking(False)
+
+        loop = asyncio.get_event_loop()
+        self._transport, self._protocol = await loop.create_datagram_endpoint(
+            _CtrlProtocol, sock=sock)
+
+    async def close(self):
+        """Close the connection to wpa_supplicant."""
+
+        if self._transport is None:
+            return
+
+        if self._attached:
+            await self._request('DETACH')
+            self._attached = False
+
+        self._close_socket()
+
+    def _close_socket(self):
+
+        self._transport.close()
+        self._transport = None
+        if os.path.exists(self._sock_file):
+            os.remove(self._sock_file)
+
+    async def _reopen(self):
+        """Reopen the socket, keeping the waited events and the ATTACH."""
+
+        waiters = self._protocol.event_waiters
+        self._close_socket()
+        await self._open_socket()
+        self._protocol.event_waiters = waiters
+
+        if self._attached:
+            self._transport.sendto(b'ATTACH')
+            try:
+                reply = await asyncio.wait_for(self._protocol.replies.get(),
+                                               REQUEST_TIMEOUT)
+            except asyncio.TimeoutError:
+                reply = None
+            self._attached = isinstance(reply, bytes) and\
+                reply.startswith(b'OK')
+
+    async def _request(self, cmd, timeout=REQUEST_TIMEOUT):
+
+        return (await self._requests([cmd], timeout))[0]
+
+    async def _requests(self, cmds, timeout=REQUEST_TIMEOUT):
+        """Send cmds in a pipeline and return their replies in order."""
+
+        replies = []
+        sent = 0
+        observer = wifiutil._observer
+        # The send times of the cmds, if observed.
+        starts = []
+        async with self._lock:
+            while len(replies) < len(cmds):
+                while sent < len(cmds) and\
+                        sent - len(replies) < wifiutil.PIPELINE_DEPTH:
+                    cmd = cmds[sent]
+                    if 'psk' not in cmd:
+                        self._logger.info("Send cmd '%s' to wpa_s", cmd)
+                    if observer is not None:
+                        starts.append(time.time())
+                    self._transport.sendto(cmd.encode('utf-8'))
+                    sent += 1
+
+                cmd = cmds[len(replies)]
+                try:
+                    reply = await asyncio.wait_for(
+                        self._protocol.replies.get(), timeout)
+                except (asyncio.TimeoutError, asyncio.CancelledError) as err:
+                    if isinstance(err, asyncio.TimeoutError):
+                        if observer is not None:
+                            wifiutil._observe_request(
+                                observer, self._name, cmd,
+                                starts[len(replies)], error=socket.timeout())
+                        self._logger.error("Reply from iface '%s' timed out",
+                                           self._name)
+                    # The late reply would be taken as the reply of the
+                    # next cmd, so the socket is reopened as the blocking
+                    # client does.
+                    await self._reopen()
+                    raise
+
+                if isinstance(reply, Exception):
+                    if observer is not None:
+                        wifiutil._observe_request(
+                            observer, self._name, cmd, starts[len(replies)],
+                            error=reply)
+                    raise reply
+
+                if observer is not None:
+                    wifiutil._observe_request(observer, self._name, cmd,
+                                              starts[len(replies)], reply)
+                replies.append(reply.decode('utf-8'))
+
+        return replies
+
+    async def _send_cmd(self, cmd):
+
+        reply = await self._request(cmd)
+        if reply != 'OK\n':
+            self._logger.error(
+                "Unexpected resp '%s' for Command '%s'", reply, cmd)
+
+        return reply
+
+    async def scan(self, wait=False, timeout=wifiutil.SCAN_TIMEOUT):
+        """Trigger the wifi interface to scan.
+
+        If wait is True, wait for the end of the scan and return whether
+        the scan results are ready.
+        """
+
+        if not wait:
+            await self._send_cmd('SCAN')
+            return None
+
+        if not self._attached:
+            self._attached = (await self._request('ATTACH')).startswith('OK')
+
+        done = self._protocol.wait_for_event(
+            ('CTRL-EVENT-SCAN-RESULTS', 'CTRL-EVENT-SCAN-FAILED'))
+        try:
+            reply = await self._request('SCAN')
+            if reply.startswith('FAIL') and reply.strip() != 'FAIL-BUSY':
+                return False
+
+            try:
+                event = await asyncio.wait_for(done, timeout)
+            except asyncio.TimeoutError:
+                self._logger.error("Scan on iface '%s' timed out",
+                                   self._name)
+                return False
+        finally:
+            # Drop the waiter if the scan failed.
+            done.cancel()
+
+        return event.startswith('CTRL-EVENT-SCAN-RESULTS')
+
+    async def scan_results(self):
+        """Return the scan result."""
+
+        return wifiutil.parse_scan_results(await self._request('SCAN_RESULTS'))
+
+    def scan_stream(self, interval=None, timeout=wifiutil.SCAN_TIMEOUT):
+        """Get an async iterator of the changes found by repeated scans.
+
+        It works as Interface.scan_stream(), but has to be iterated with
+        async for.
+        """
+
+        return _ScanStream(self, interval, timeout)
+
+    async def add_network_profile(self, params):
+        """Add the info of the AP for connecting afterward.
+
+        Return params, or None if wpa_supplicant fails to add a network.
+        """
+
+        params.process_akm()
+        wifiutil.check_network_key(params)
+
+        network_id = (await self._request('ADD_NETWORK')).strip()
+
+        if not network_id.isdigit():
+            self._logger.error("Add profile '%s' failed: '%s'",
+                               params.ssid, network_id)
+            return None
+
+        for cmd in wifiutil.network_profile_cmds(network_id, params):
+            await self._send_cmd(cmd)
+
+        return params
+
+    async def remove_network_profile(self, params):
+        """Remove the specified AP settings.
+
+        As the blocking API, only the last of the matched profiles is
+        removed.
+        """
+
+        network_id = None
+        for profile in await self.network_profiles():
+            if profile == params:
+                network_id = profile.id
+
+        if network_id is not None:
+            await self._send_cmd('REMOVE_NETWORK {}'.format(network_id))
+
+    async def remove_all_network_profiles(self):
+        """Remove all the AP settings."""
+
+        await self._send_cmd('REMOVE_NETWORK all')
+
+    async def network_profiles(self):
+        """Get all the AP profiles.
+
+        The GET_NETWORK cmds of all the networks are pipelined.
+        """
+
+        network_ids = [network_id for network_id, _ in
+                       wifiutil.parse_network_list(
+                           await self._request('LIST_NETWORKS'))]
+
+        cmds = []
+        for network_id in network_ids:
+            for field in ('ssid', 'key_mgmt', 'pairwise'):
+                cmds.append('GET_NETWORK {} {}'.format(network_id, field))
+        replies = await self._requests(cmds)
+
+        # proto is only needed to tell WPA from WPA2.
+        proto_ids = [network_id for i, network_id in enumerate(network_ids)
+                     if replies[i * 3 + 1].upper() in ['WPA-PSK', 'WPA-EAP']]
+        protos = dict(zip(proto_ids, await self._requests(
+            ['GET_NETWORK {} proto'.format(i) for i in proto_ids])))
+
+        networks = []
+        for i, network_id in enumerate(network_ids):
+            ssid, key_mgmt, pairwise = replies[i * 3:i * 3 + 3]
+            network = wifiutil.network_to_profile(
+                network_id, ssid, key_mgmt, protos.get(network_id, ''),
+                pairwise)
+            if network:
+                networks.append(network)
+
+        return networks
+
+    async def connect(self, params):
+        """Connect to the specified AP."""
+
+        self._logger.info("iface '%s' connects to AP: '%s'",
+                          self._name, params.ssid)
+
+        network_list = wifiutil.parse_network_list(
+            await self._request('LIST_NETWORKS'))
+        for network_id, ssid in network_list:
+            if ssid == params.ssid:
+                await self._send_cmd('SELECT_NETWORK {}'.format(network_id))
+
+    async def disconnect(self):
+        """Disconnect from the specified AP."""
+
+        self._logger.info("iface '%s' disconnects", self._name)
+
+        await self._send_cmd('DISCONNECT')
+
+    async def status(self):
+        """Get the status of the wifi interface."""
+
+        return wifiutil.parse_status(await self._request('STATUS'))
+
+
+class PyWiFi:
+    """PyWiFi provides coroutines to manipulate wifi devices."""
+
+    def __init__(self, ctrl_iface_dir=None):
+
+        self._ctrl_iface_dir = ctrl_iface_dir or wifiutil.CTRL_IFACE_DIR
+        self._ifaces = []
+        self._logger = logging.getLogger('pywifi')
+
+    async def interfaces(self):
+        """Collect and connect to the available wlan interfaces."""
+
+        await self.close()
+
+        for f in sorted(os.listdir(self._ctrl_iface_dir)):
+            sock_file = '/'.join([self._ctrl_iface_dir, f])
+            if stat.S_ISSOCK(os.stat(sock_file).st_mode):
+                iface = AsyncInterface(f, self._ctrl_iface_dir)
+                await iface.open()
+                self._ifaces.append(iface)
+                self._logger.info("Get interface: %s", iface.name())
+
+        if not self._ifaces:
+            self._logger.error("Can't get wifi interface")
+
+        return self._ifaces
+
+    async def close(self):
+        """Close the connections of the collected interfaces."""
+
+        for iface in self._ifaces:
+            await iface.close()
+        self._ifaces = []
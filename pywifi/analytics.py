@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+analytics - vectorised analysis of scan history with NumPy.
+
+ScanFrame keeps the results of repeated scans as columns of NumPy arrays,
+so channel and roaming analysis over hundreds of BSSes does not loop over
+ScanResult objects in Python. The functions take a ScanFrame and an
+optional window, which limits the analysis to the last window seconds of
+the frame.
+
+NumPy is an optional dependency: pip install pywifi[analytics].
+"""
+
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("pywifi.analytics requires numpy, "
+                      "install it with 'pip install pywifi[analytics]'")
+
+
+# The width of a channel in MHz. Channels whose center frequencies are
+# closer than this overlap.
+CHANNEL_WIDTH = 20
+
+
+def freq_to_channel(freq):
+    """Convert frequencies in MHz to channel numbers (0 if unknown).
+
+    The channel numbers of 5 GHz and 6 GHz overlap, so the functions of
+    this module report frequencies rather than channels.
+    """
+
+    freq = np.asarray(freq)
+
+    return np.select(
+        [freq == 2484,
+         (freq >= 2412) & (freq < 2484),
+         (freq >= 5150) & (freq <= 5925),
+         (freq >= 5955) & (freq <= 7115)],
+        [14, (freq - 2407) // 5, (freq - 5000) // 5, (freq - 5950) // 5],
+        0)
+
+
+class ScanFrame(object):
+    """ScanFrame keeps scan results as columns of NumPy arrays.
+
+    Each row is a BSS seen by a scan: bss (the index of its bssid in
+    bssids), freq, signal and timestamp. The columns are concatenated
+    lazily, so appending a scan does not copy the history.
+    """
+
+    def __init__(self):
+
+        self.bssids = []
+        self.ssids = []
+        self._index = {}
+        self._chunks = []
+        self._size = 0
+
+    def __len__(self):
+
+        return self._size
+
+    def append(self, bsses, timestamp=None):
+        """Add the ScanResults of a scan taken at timestamp.
+
+        The scans have to be appended in time order.
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        index = self._index
+        ids = []
+        for bss in bsses:
+            i = index.get(bss.bssid)
+            if i is None:
+                i = index[bss.bssid] = len(self.bssids)
+                self.bssids.append(bss.bssid)
+                self.ssids.append(bss.ssid)
+            else:
+                self.ssids[i] = bss.ssid
+            ids.append(i)
+
+        self._chunks.append((
+            np.array(ids, dtype=np.int32),
+            np.array([bss.freq for bss in bsses], dtype=np.int32),
+            np.array([bss.signal for bss in bsses], dtype=np.float64),
+            np.full(len(ids), timestamp, dtype=np.float64)))
+        self._size += len(ids)
+
+    def columns(self):
+        """Return the (bss, freq, signal, timestamp) arrays."""
+
+        if len(self._chunks) != 1:
+            if self._chunks:
+                self._chunks = [tuple(np.concatenate(column) for column in
+                                      zip(*self._chunks))]
+            else:
+                return tuple(np.empty(0, dtype=dtype) for dtype in
+                             (np.int32, np.int32, np.float64, np.float64))
+
+        return self._chunks[0]
+
+    def latest(self, window=None):
+        """Summarize each BSS seen in the last window seconds.
+
+        Return the (bss, freq, signal) arrays of the seen BSSes, where
+        freq is the last frequency and signal the mean signal of a BSS.
+        """
+
+        bss, freq, signal, timestamp = self.columns()
+        if window is not None and len(timestamp):
+            # The scans are appended in time order.
+            start = np.searchsorted(timestamp, timestamp[-1] - window)
+            bss, freq, signal = bss[start:], freq[start:], signal[start:]
+
+        # The rows are in time order, so the first row of each BSS in the
+        # reversed columns is its last one.
+        ids, last = np.unique(bss[::-1], return_index=True)
+        last = len(bss) - 1 - last
+        counts = np.bincount(bss, minlength=len(self.bssids))[ids]
+        sums = np.bincount(bss, weights=signal,
+                           minlength=len(self.bssids))[ids]
+
+        return ids, freq[last], sums / np.maximum(counts, 1)
+
+
+def channel_histogram(frame, window=None):
+    """Count the BSSes on each frequency.
+
+    Return the (freqs, counts) arrays sorted by frequency.
+    """
+
+    freq = frame.latest(window)[1]
+
+    return np.unique(freq, return_counts=True)
+
+
+def best_signal(frame, window=None):
+    """Get the strongest mean signal of the BSSes on each frequency.
+
+    Return the (freqs, signals) arrays sorted by frequency.
+    """
+
+    _, freq, signal = frame.latest(window)
+    freqs, inverse = np.unique(freq, return_inverse=True)
+    best = np.full(len(freqs), -np.inf)
+    np.maximum.at(best, inverse, signal)
+
+    return freqs, best
+
+
+def interference_scores(frame, freqs=None, window=None):
+    """Estimate the interference power on each frequency in dBm.
+
+    The power of every BSS is weighted by how much its channel overlaps
+    each frequency (linearly from 1 on the same frequency to 0 at
+    CHANNEL_WIDTH MHz apart), so overlapping 2.4 GHz channels count
+    partially. freqs defaults to the frequencies of the seen BSSes, and
+    -inf is returned for a frequency without interference.
+    """
+
+    _, freq, signal = frame.latest(window)
+    if freqs is None:
+        freqs = np.unique(freq)
+    freqs = np.asarray(freqs)
+
+    overlap = np.clip(
+        1 - np.abs(freqs[:, np.newaxis] - freq[np.newaxis, :]) /
+        float(CHANNEL_WIDTH), 0, None)
+    power = overlap.dot(10 ** (signal / 10))
+    with np.errstate(divide='ignore'):
+        scores = 10 * np.log10(power)
+
+    return freqs, scores
+
+
+def roaming_candidates(frame, ssid, current=None, window=None,
+                       hysteresis=5, min_signal=-80):
+    """Rank the BSSes of ssid worth roaming to by their mean signal.
+
+    If current is the bssid the interface is connected to, only the BSSes
+    stronger than it by hysteresis dB are returned. Return a list of
+    (bssid, signal) from the strongest.
+    """
+
+    ids, _, signal = frame.latest(window)
+    ssids = np.array(frame.ssids, dtype=object)[ids]
+    mask = (ssids == ssid) & (signal >= min_signal)
+
+    current_id = frame._index.get(current)
+    if current_id is not None:
+        mask &= ids != current_id
+        current_signal = signal[ids == current_id]
+        if len(current_signal):
+            mask &= signal >= current_signal[0] + hysteresis
+
+    ids, signal = ids[mask], signal[mask]
+    order = np.argsort(-signal, kind='mergesort')
+
+    return [(frame.bssids[i], float(s))
+            for i, s in zip(ids[order], signal[order])]
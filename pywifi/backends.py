@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+backends - the registry of the OS dependent wifi implementations.
+
+A backend is a module (or any object) providing WifiUtil, which makes
+the objects implementing the wifi functions for Interface. The backends
+are registered by the import path of their module and are imported when
+they are first used, so importing pywifi does not load ctypes or the
+wpa_supplicant client.
+"""
+
+import importlib
+import sys
+import threading
+
+
+_registry = {
+    'linux': 'pywifi._wifiutil_linux',
+    'windows': 'pywifi._wifiutil_win',
+    'sim': 'pywifi.sim',
+}
+_loaded = {}
+_lock = threading.Lock()
+
+
+def default_backend():
+    """Get the name of the backend of the running OS."""
+
+    # sys.platform is used as platform.system() may run a process.
+    if sys.platform.startswith('linux'):
+        return 'linux'
+    elif sys.platform == 'win32':
+        return 'windows'
+
+    raise NotImplementedError(
+        'pywifi does not support {}'.format(sys.platform))
+
+
+def register_backend(name, module):
+    """Register module, or the import path of a module, as name."""
+
+    with _lock:
+        _registry[name] = module
+        _loaded.pop(name, None)
+
+
+def get_backend(name=None):
+    """Get the backend module of name, importing it on the first use.
+
+    name defaults to the backend of the running OS. A backend object
+    given as name is returned as it is.
+    """
+
+    if name is None:
+        name = default_backend()
+    elif hasattr(name, 'WifiUtil'):
+        return name
+
+    backend = _loaded.get(name)
+    if backend is None:
+        with _lock:
+            if name not in _registry:
+                raise ValueError("Unknown backend '{}'".format(name))
+
+            backend = _registry[name]
+            if isinstance(backend, str):
+                backend = importlib.import_module(backend)
+            _loaded[name] = backend
+
+    return backend
@@ -10,6 +10,11 @@ IFACE_INACTIVE = 2
 IFACE_CONNECTING = 3
 IFACE_CONNECTED = 4
 
+# Define the outcomes of connecting.
+CONNECT_SUCCEEDED = 0
+CONNECT_FAILED = 1
+CONNECT_TIMED_OUT = 2
+
 # Define auth algorithms.
 AUTH_ALG_OPEN = 0
 AUTH_ALG_SHARED = 1
@@ -3,16 +3,17 @@
 
 """Implement Interface for manipulating wifi devies."""
 
-import platform
 import logging
+import time
+from collections import namedtuple
 
+from .backends import get_backend
+from .scan import SCAN_RETRY_DELAY, diff_scan_results
 
-if platform.system().lower() == 'windows':
-    from . import _wifiutil_win as wifiutil
-elif platform.system().lower() == 'linux':
-    from . import _wifiutil_linux as wifiutil
-else:
-    raise NotImplementedError
+
+ConnectResult = namedtuple('ConnectResult', ['status', 'reason', 'elapsed'])
+SyncResult = namedtuple('SyncResult',
+                        ['added', 'changed', 'removed', 'unchanged', 'failed'])
 
 
 class Interface:
@@ -27,10 +28,10 @@ class Interface:
     _wifi_ctrl = {}
     _logger = None
 
-    def __init__(self, raw_obj):
+    def __init__(self, raw_obj, backend=None):
 
         self._raw_obj = raw_obj
-        self._wifi_ctrl = wifiutil.WifiUtil()
+        self._wifi_ctrl = get_backend(backend).WifiUtil()
         self._logger = logging.getLogger('pywifi')
 
     def name(self):
@@ -38,12 +39,17 @@ class Interface:
 
         return self._raw_obj['name']
 
-    def scan(self):
-        """Trigger the wifi interface to scan."""
+    def scan(self, wait=False, timeout=10):
+        """Trigger the wifi interface to scan.
+
+        If wait is True, block until the scan is done (or timeout seconds
+        elapsed) and return whether the scan results are ready, or None
+        if the backend cannot tell.
+        """
 
         self._logger.info("iface '%s' scans", self.name())
 
-        self._wifi_ctrl.scan(self._raw_obj)
+        return self._wifi_ctrl.scan(self._raw_obj, wait, timeout)
 
     def scan_results(self):
         """Return the scan result."""
@@ -62,11 +68,86 @@ class Interface:
 
         return bsses
 
+    def scan_stream(self, interval=None, timeout=10):
+        """Scan repeatedly and yield the changes of the BSSes.
+
+        Each yielded ScanBatch holds the new, changed and gone BSSes since
+        the previous batch; scans without changes yield nothing. The next
+        scan is triggered only when the next batch is requested, and not
+        earlier than interval seconds after the previous scan started.
+        A failed scan is retried after at least SCAN_RETRY_DELAY seconds.
+        """
+
+        state = {}
+        next_scan = 0
+        while True:
+            delay = next_scan - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            next_scan = time.time() + (interval or 0)
+
+            if self.scan(wait=True, timeout=timeout) is False:
+                # Do not retry a scan which fails at once in a busy loop.
+                self._logger.warning("Scan failed, retrying")
+                next_scan = max(next_scan, time.time() + SCAN_RETRY_DELAY)
+                continue
+            batch = diff_scan_results(state, self.scan_results())
+            if batch.new or batch.changed or batch.gone:
+                yield batch
+
+    def bss_results(self, new_only=False):
+        """Return the BSSes known by the wifi interface.
+
+        Besides the fields of scan_results(), each BSS has its id, noise,
+        age (in seconds), ie (hex string) and flags. If new_only is True,
+        only the BSSes found since the last call are returned. The
+        Windows backend has no BSS ids, so it does not provide this.
+        """
+
+        return self._wifi_ctrl.bss_results(self._raw_obj, new_only)
+
     def add_network_profile(self, params):
         """Add the info of the AP for connecting afterward."""
 
         return self._wifi_ctrl.add_network_profile(self._raw_obj, params)
 
+    def add_network_profiles(self, profiles, save_config=False):
+        """Add the info of many APs and return whether each is added.
+
+        If save_config is True, the profiles are saved to the
+        configuration of the system once all of them are added.
+        """
+
+        added = self._wifi_ctrl.add_network_profiles(
+            self._raw_obj, profiles, save_config)
+
+        self._logger.info("iface '%s' adds %d of %d profiles",
+                          self.name(), sum(added), len(added))
+
+        return added
+
+    def sync_network_profiles(self, desired, save_config=False):
+        """Make the AP profiles the desired ones with the least changes.
+
+        Only the profiles which differ are added, updated or removed, so
+        the untouched ones (e.g. the connected one) are kept. Return a
+        SyncResult of the added, changed, unchanged and failed desired
+        profiles and the removed profiles (the stored profiles which fail
+        to be removed are failed too). The keys of the stored profiles
+        cannot be read, so the key of a desired WPA-PSK profile is set
+        unless it is the key last set by pywifi.
+        """
+
+        result = SyncResult(*self._wifi_ctrl.sync_network_profiles(
+            self._raw_obj, desired, save_config))
+
+        self._logger.info("iface '%s' syncs profiles: %d added, %d changed, "
+                          "%d removed, %d failed", self.name(),
+                          len(result.added), len(result.changed),
+                          len(result.removed), len(result.failed))
+
+        return result
+
     def remove_network_profile(self, params):
         """Remove the specified AP settings."""
 
@@ -92,13 +173,23 @@ class Interface:
 
         return profiles
 
-    def connect(self, params):
-        """Connect to the specified AP."""
+    def connect(self, params, wait=False, timeout=30):
+        """Connect to the specified AP.
+
+        If wait is True, block until the outcome is known (or timeout
+        seconds elapsed) and return a ConnectResult of the status
+        (const.CONNECT_*), the reason of a failure and the elapsed time.
+        """
 
         self._logger.info("iface '%s' connects to AP: '%s'",
                           self.name(), params.ssid)
 
-        self._wifi_ctrl.connect(self._raw_obj, params)
+        if not wait:
+            self._wifi_ctrl.connect(self._raw_obj, params)
+            return None
+
+        return ConnectResult(*self._wifi_ctrl.connect(
+            self._raw_obj, params, True, timeout))
 
     def disconnect(self):
         """Disconnect from the specified AP."""
@@ -111,3 +202,18 @@ class Interface:
         """Get the status of the wifi interface."""
 
         return self._wifi_ctrl.status(self._raw_obj)
+
+    def status_info(self):
+        """Get the details of the status (e.g. bssid, ssid and freq)."""
+
+        return self._wifi_ctrl.status_info(self._raw_obj)
+
+    def add_status_callback(self, callback):
+        """Call callback(old, new) when the status changes."""
+
+        self._wifi_ctrl.add_status_callback(self._raw_obj, callback)
+
+    def remove_status_callback(self, callback):
+        """Stop calling callback when the status changes."""
+
+        self._wifi_ctrl.remove_status_callback(self._raw_obj, callback)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+metrics - instrument the round trips of the wpa_supplicant control iface.
+
+A Metrics object is an observer of the cmds sent by a backend, see
+PyWiFi.enable_metrics(). It keeps for each iface and cmd name a latency
+histogram, the bytes sent and received and the counts of the results,
+and exports them as JSON or in the Prometheus text format.
+
+Any object with an observe() method like Metrics.observe() can be used
+as an observer instead, e.g. to forward the round trips to another
+metrics library.
+"""
+
+import bisect
+import json
+import threading
+
+
+RESULT_OK = 'ok'
+# wpa_s replied FAIL (or FAIL-BUSY etc.) to the cmd.
+RESULT_FAIL = 'fail'
+RESULT_TIMEOUT = 'timeout'
+# The socket failed while sending the cmd or receiving its reply.
+RESULT_ERROR = 'error'
+RESULTS = (RESULT_OK, RESULT_FAIL, RESULT_TIMEOUT, RESULT_ERROR)
+
+# The upper bounds of the latency buckets in seconds.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class _CmdStats(object):
+
+    __slots__ = ('counts', 'sum', 'sent', 'received', 'results')
+
+    def __init__(self, buckets):
+
+        # The last count is of the latencies above all the buckets.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.sent = 0
+        self.received = 0
+        self.results = dict((result, 0) for result in RESULTS)
+
+
+def _escape(value):
+
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+class Metrics(object):
+    """Metrics records the round trips of the cmds of each iface.
+
+    A round trip lasts from sending a cmd to receiving its reply, so the
+    latencies of pipelined cmds include the time they wait for the
+    replies of the cmds sent before them. Metrics can be shared by
+    threads.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+
+        self.buckets = tuple(sorted(buckets))
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def observe(self, iface, cmd, seconds, sent, received, result):
+        """Record a round trip of cmd (a cmd name, e.g. 'GET_NETWORK').
+
+        sent and received are the bytes of the cmd and its reply, and
+        result is one of RESULTS.
+        """
+
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            stats = self._stats.get((iface, cmd))
+            if stats is None:
+                stats = self._stats[(iface, cmd)] = _CmdStats(self.buckets)
+
+            stats.counts[index] += 1
+            stats.sum += seconds
+            stats.sent += sent
+            stats.received += received
+            stats.results[result] += 1
+
+    def reset(self):
+        """Drop the recorded round trips."""
+
+        with self._lock:
+            self._stats.clear()
+
+    def busiest(self, count=None):
+        """Get the cmds which took the most time, most first.
+
+        Each item is (iface, cmd, seconds, number of round trips).
+        """
+
+        with self._lock:
+            items = [(iface, cmd, stats.sum, sum(stats.counts))
+                     for (iface, cmd), stats in self._stats.items()]
+
+        items.sort(key=lambda item: item[2], reverse=True)
+
+        return items[:count] if count is not None else items
+
+    def to_dict(self):
+        """Get the metrics as a dict of ifaces of dicts of cmd names.
+
+        The buckets of each cmd are [upper bound, count] pairs, where
+        the count is of the round trips up to the bound.
+        """
+
+        ifaces = {}
+        with self._lock:
+            for (iface, cmd), stats in self._stats.items():
+                cumulative = 0
+                buckets = []
+                for bound, count in zip(self.buckets, stats.counts):
+                    cumulative += count
+                    buckets.append([bound, cumulative])
+
+                ifaces.setdefault(iface, {})[cmd] = {
+                    'count': cumulative + stats.counts[-1],
+                    'seconds': stats.sum,
+                    'buckets': buckets,
+                    'sent_bytes': stats.sent,
+                    'received_bytes': stats.received,
+                    'results': dict(stats.results),
+                }
+
+        return ifaces
+
+    def to_json(self, **kwargs):
+        """Export the metrics of to_dict() as JSON."""
+
+        return json.dumps(self.to_dict(), sort_keys=True, **kwargs)
+
+    def to_prometheus(self, prefix='pywifi_ctrl'):
+        """Export the metrics in the Prometheus text format."""
+
+        ifaces = self.to_dict()
+        rows = sorted((iface, cmd, stats)
+                      for iface, cmds in ifaces.items()
+                      for cmd, stats in cmds.items())
+
+        histogram = prefix + '_request_seconds'
+        lines = [
+            '# HELP {} Round trip time of the cmds sent to '
+            'wpa_supplicant.'.format(histogram),
+            '# TYPE {} histogram'.format(histogram),
+        ]
+        for iface, cmd, stats in rows:
+            labels = 'iface="{}",cmd="{}"'.format(_escape(iface),
+                                                  _escape(cmd))
+            for bound, count in stats['buckets']:
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                    histogram, labels, bound, count))
+            lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(
+                histogram, labels, stats['count']))
+            lines.append('{}_sum{{{}}} {!r}'.format(
+                histogram, labels, stats['seconds']))
+            lines.append('{}_count{{{}}} {}'.format(
+                histogram, labels, stats['count']))
+
+        for name, help_text in [
+                ('sent_bytes', 'Bytes of the cmds sent'),
+                ('received_bytes', 'Bytes of the replies received')]:
+            lines.append('# HELP {}_{}_total {}.'.format(prefix, name,
+                                                         help_text))
+            lines.append('# TYPE {}_{}_total counter'.format(prefix, name))
+            for iface, cmd, stats in rows:
+                lines.append('{}_{}_total{{iface="{}",cmd="{}"}} {}'.format(
+                    prefix, name, _escape(iface), _escape(cmd), stats[name]))
+
+        lines.append('# HELP {}_results_total Round trips by result (ok, '
+                     'fail, timeout or error).'.format(prefix))
+        lines.append('# TYPE {}_results_total counter'.format(prefix))
+        for iface, cmd, stats in rows:
+            for result in RESULTS:
+                lines.append(
+                    '{}_results_total{{iface="{}",cmd="{}",result="{}"}} '
+                    '{}'.format(prefix, _escape(iface), _escape(cmd), result,
+                                stats['results'][result]))
+
+        return '\n'.join(lines) + '\n'
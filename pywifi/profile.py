@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 # vim: set fileencoding=utf-8
 
-"""Define WiFi Profile."""
+"""Define WiFi Profile and ScanResult."""
+
+import copy
+import hashlib
 
 from .const import *
 
@@ -17,6 +20,7 @@ class Profile():
         self.ssid = None
         self.bssid = None
         self.key = None
+        self.key_type = KEY_TYPE_PASSPHRASE
 
     def process_akm(self):
 
@@ -25,24 +29,384 @@ class Profile():
 
     def __eq__(self, profile):
 
-        if profile.ssid:
-            if profile.ssid != self.ssid:
-                return False
+        return match(self, profile)
+
+
+def match(obj, profile):
+    """Check if obj has the fields which are set in profile."""
+
+    if profile.ssid:
+        if profile.ssid != obj.ssid:
+            return False
+
+    if profile.bssid:
+        if profile.bssid != obj.bssid:
+            return False
+
+    if profile.auth:
+        if profile.auth!= obj.auth:
+            return False
+
+    if profile.cipher:
+        if profile.cipher != obj.cipher:
+            return False
+
+    mask = get_akm_mask(profile)
+    if mask and not mask & get_akm_mask(obj):
+        return False
+
+    return True
+
+
+def get_akm_mask(obj):
+    """Get the akm bitmask of a Profile or a ScanResult."""
+
+    if isinstance(obj, ScanResult):
+        return obj.akm_mask
+
+    return akm_to_mask(obj.akm)
+
+
+def akm_to_mask(akm):
+    """Get the bitmask of an akm list."""
+
+    mask = 0
+    for akm_type in akm:
+        mask |= 1 << akm_type
+
+    return mask
+
+
+def mask_to_akm(mask):
+    """Get the akm list of a bitmask."""
+
+    return [akm_type for akm_type in range(AKM_TYPE_UNKNOWN + 1)
+            if mask & (1 << akm_type)]
+
+
+class _AkmList(list):
+    """The akm list of a ScanResult, whose changes are kept in its mask."""
+
+    def __init__(self, owner, akm):
+
+        list.__init__(self, akm)
+        self._owner = owner
+
+    def _update(self):
+
+        self._owner.akm_mask = akm_to_mask(self)
+
+
+def _update_akm_mask(name):
+
+    method = getattr(list, name)
+
+    def update(self, *args):
+
+        result = method(self, *args)
+        self._update()
+
+        return result
+
+    update.__name__ = name
+
+    return update
+
+
+for _name in ['append', 'extend', 'insert', 'remove', 'pop', 'sort',
+              'reverse', 'clear', '__setitem__', '__delitem__', '__iadd__',
+              '__imul__', '__setslice__', '__delslice__']:
+    if hasattr(list, _name):
+        setattr(_AkmList, _name, _update_akm_mask(_name))
+
+
+class ScanResult(object):
+    """ScanResult is a BSS found by scanning.
+
+    It has the attributes and process_akm() of Profile, but takes no
+    __dict__ and keeps akm as a bitmask, so a long scan history stays
+    small. akm reads as a list of the akm types in ascending order, whose
+    changes are written back to the bitmask. ScanResults are equal if all
+    their fields are equal, and are hashable so they can be kept in sets
+    and dicts (do not modify them then). A ScanResult equals a Profile if
+    it has the fields set in the Profile.
+    """
+
+    # key and key_type are rarely set on a scan record, so they share the
+    # _key slot, which is None or a (key, key_type) tuple.
+    __slots__ = ('bssid', 'ssid', 'freq', 'signal', 'akm_mask', 'cipher',
+                 'auth', '_key')
+    _FIELDS = ('bssid', 'ssid', 'freq', 'signal', 'akm_mask', 'cipher',
+               'auth', 'key', 'key_type')
+
+    def __init__(self, bssid=None, ssid=None, freq=0, signal=0, akm_mask=0,
+                 cipher=CIPHER_TYPE_NONE, auth=AUTH_ALG_OPEN, key=None,
+                 key_type=KEY_TYPE_PASSPHRASE):
+
+        self.bssid = bssid
+        self.ssid = ssid
+        self.freq = freq
+        self.signal = signal
+        self.akm_mask = akm_mask
+        self.cipher = cipher
+        self.auth = auth
+        self._key = None
+        if key is not None or key_type != KEY_TYPE_PASSPHRASE:
+            self._key = (key, key_type)
+
+    @property
+    def key(self):
+
+        return self._key[0] if self._key else None
+
+    @key.setter
+    def key(self, key):
+
+        self._key = (key, self.key_type)
+
+    @property
+    def key_type(self):
+
+        return self._key[1] if self._key else KEY_TYPE_PASSPHRASE
+
+    @key_type.setter
+    def key_type(self, key_type):
+
+        self._key = (self.key, key_type)
+
+    @property
+    def akm(self):
+
+        return _AkmList(self, mask_to_akm(self.akm_mask))
+
+    @akm.setter
+    def akm(self, akm):
+
+        self.akm_mask = akm_to_mask(akm)
+
+    def process_akm(self):
+
+        # The order of the akm types is not kept, so the highest one is
+        # kept as the last one of a Profile.
+        if self.akm_mask:
+            self.akm_mask = 1 << (self.akm_mask.bit_length() - 1)
+
+    def _fields(self):
+
+        return tuple(getattr(self, name) for name in self._FIELDS)
+
+    def __eq__(self, other):
+
+        if isinstance(other, Profile):
+            return match(self, other)
+        if not isinstance(other, ScanResult):
+            return NotImplemented
+
+        return self._fields() == other._fields()
+
+    def __ne__(self, other):
+
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+
+        return not result
+
+    def __hash__(self):
+
+        return hash((self.bssid, self.ssid, self.freq, self.signal))
+
+    def __repr__(self):
+
+        return '{}(bssid={!r}, ssid={!r}, freq={!r}, signal={!r}, '\
+            'akm={!r}, cipher={!r})'.format(
+                type(self).__name__, self.bssid, self.ssid, self.freq,
+                self.signal, self.akm, self.cipher)
+
+
+class BssResult(ScanResult):
+    """BssResult is a BSS known by wpa_supplicant with its BSS fields.
+
+    Besides the fields of ScanResult, it has the id, noise, age, ie and
+    flags of the BSS, which are only read by bss_results(), so the
+    records of plain scans do not carry them.
+    """
+
+    __slots__ = ('id', 'noise', 'age', 'ie', 'flags')
+    _FIELDS = ScanResult._FIELDS + __slots__
+
+    def __init__(self, bssid=None, ssid=None, freq=0, signal=0, akm_mask=0,
+                 cipher=CIPHER_TYPE_NONE, auth=AUTH_ALG_OPEN, id=0,
+                 noise=None, age=None, ie=None, flags=None):
+
+        ScanResult.__init__(self, bssid, ssid, freq, signal, akm_mask,
+                            cipher, auth)
+        self.id = id
+        self.noise = noise
+        self.age = age
+        self.ie = ie
+        self.flags = flags
+
+
+class ProfileIndex(object):
+    """ProfileIndex finds the matched profiles without comparing to all.
+
+    The profiles are indexed by ssid and bssid with their akm bitmask,
+    auth and cipher, and the matches follow the rules of Profile.__eq__.
+    find(pattern) returns the indexed profiles which equal pattern (e.g.
+    the stored network to remove), and find_patterns(obj) returns the
+    indexed profiles which obj equals (e.g. the allow-list entries a scan
+    result is in). A profile should not be modified while it is indexed.
+    """
+
+    def __init__(self, profiles=()):
+
+        self._entries = {}
+        self._count = 0
+        self._by_ssid = {}
+        self._by_bssid = {}
+        # The profiles which match any ssid.
+        self._any_ssid = []
+
+        for profile in profiles:
+            self.add(profile)
+
+    def __len__(self):
+
+        return len(self._entries)
+
+    def __iter__(self):
+
+        return iter([entry[0] for entry in self._entries.values()])
+
+    def add(self, profile):
+        """Index profile."""
+
+        entry = (profile, get_akm_mask(profile), self._count)
+        self._count += 1
+        self._entries[id(profile)] = entry
+        self._by_ssid.setdefault(profile.ssid, []).append(entry)
+        self._by_bssid.setdefault(profile.bssid, []).append(entry)
+        if not profile.ssid:
+            self._any_ssid.append(entry)
+
+    def remove(self, profile):
+        """Remove profile from the index."""
+
+        entry = self._entries.pop(id(profile))
+        buckets = [(self._by_ssid, profile.ssid),
+                   (self._by_bssid, profile.bssid)]
+        for bucket, key in buckets:
+            bucket[key].remove(entry)
+            if not bucket[key]:
+                del bucket[key]
+        if not profile.ssid:
+            self._any_ssid.remove(entry)
+
+    def find(self, pattern):
+        """Get the indexed profiles which equal pattern."""
+
+        if pattern.ssid:
+            entries = self._by_ssid.get(pattern.ssid, [])
+        elif pattern.bssid:
+            entries = self._by_bssid.get(pattern.bssid, [])
+        else:
+            entries = self._entries.values()
+
+        mask = get_akm_mask(pattern)
+        return [profile for profile, akm_mask, _ in entries
+                if (not pattern.bssid or pattern.bssid == profile.bssid)
+                and (not pattern.auth or pattern.auth == profile.auth)
+                and (not pattern.cipher or pattern.cipher == profile.cipher)
+                and (not mask or mask & akm_mask)]
+
+    def find_patterns(self, obj):
+        """Get the indexed profiles which obj equals."""
+
+        entries = self._by_ssid.get(obj.ssid, []) if obj.ssid else []
+        if entries and self._any_ssid:
+            # Keep the order in which the profiles are added.
+            entries = sorted(entries + self._any_ssid,
+                             key=lambda entry: entry[2])
+        else:
+            entries = entries or self._any_ssid
+
+        mask = get_akm_mask(obj)
+        return [profile for profile, akm_mask, _ in entries
+                if (not profile.bssid or profile.bssid == obj.bssid)
+                and (not profile.auth or profile.auth == obj.auth)
+                and (not profile.cipher or profile.cipher == obj.cipher)
+                and (not akm_mask or akm_mask & mask)]
+
+
+def _has_psk(profile):
+
+    return bool(profile.key) and bool(profile.akm) and\
+        profile.akm[-1] in [AKM_TYPE_WPAPSK, AKM_TYPE_WPA2PSK]
+
+
+def key_digest(profile):
+    """Get a digest of the WPA-PSK key of profile, or None if it has none.
+
+    The digest tells whether a key has been set without keeping the key.
+    """
+
+    if not _has_psk(profile):
+        return None
+
+    key = '{}:{}'.format(profile.key_type, profile.key)
+
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def diff_profiles(stored, desired, key_changed=None, match_cipher=True):
+    """Match the desired profiles against the stored ones.
+
+    Return (unchanged, changed, added, removed): the desired profiles
+    which equal a stored one, the (stored, desired) pairs of the same ssid
+    but other settings, the desired profiles of a new ssid and the stored
+    profiles which are not desired.
 
-        if profile.bssid:
-            if profile.bssid != self.bssid:
-                return False
+    The stored keys cannot be read, so key_changed(stored, desired) tells
+    whether the key of a desired WPA-PSK profile with a key differs from
+    the one of the stored profile it equals. Without key_changed, such a
+    profile is always paired as changed. If match_cipher is False, the
+    ciphers are not compared, e.g. for a backend which does not configure
+    them.
+    """
 
-        if profile.auth:
-            if profile.auth!= self.auth:
-                return False
+    index = ProfileIndex(stored)
+    unchanged = []
+    changed = []
+    added = []
+    for profile in desired:
+        # Only the last akm is configured.
+        profile.process_akm()
+        pattern = profile
+        if not match_cipher:
+            pattern = copy.copy(profile)
+            pattern.cipher = CIPHER_TYPE_NONE
+        matches = index.find(pattern)
+        if matches:
+            index.remove(matches[0])
+            if _has_psk(profile) and (
+                    key_changed is None or key_changed(matches[0], profile)):
+                changed.append((matches[0], profile))
+            else:
+                unchanged.append(profile)
+            continue
 
-        if profile.cipher:
-            if profile.cipher != self.cipher:
-                return False
+        pattern = Profile()
+        pattern.ssid = profile.ssid
+        pattern.akm = []
+        matches = index.find(pattern) if profile.ssid else []
+        if matches:
+            index.remove(matches[0])
+            changed.append((matches[0], profile))
+        else:
+            added.append(profile)
 
-        if profile.akm:
-            if set(profile.akm).isdisjoint(set(self.akm)):
-                return False
+    remaining = set(id(profile) for profile in index)
+    removed = [profile for profile in stored if id(profile) in remaining]
 
-        return True
+    return unchanged, changed, added, removed
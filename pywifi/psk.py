@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+psk - derive the PSKs of WPA passphrases.
+
+wpa_supplicant derives the 256-bit PSK of a passphrase with 4096
+iterations of PBKDF2-HMAC-SHA1 whenever the network is configured, which
+is slow on small devices. The PSK can be derived once here instead and
+set to a Profile as the key with KEY_TYPE_NETWORKKEY.
+"""
+
+import binascii
+import hashlib
+import multiprocessing
+
+from .const import *
+
+
+PSK_ITERATIONS = 4096
+PSK_CACHE_SIZE = 1024
+# Fewer derivations than this are not worth starting processes for.
+PARALLEL_MIN = 16
+
+_psk_cache = {}
+
+
+def _to_bytes(value):
+
+    if isinstance(value, bytes):
+        return value
+
+    return value.encode('utf-8')
+
+
+def _derive(ssid_passphrase):
+
+    ssid, passphrase = ssid_passphrase
+    psk = hashlib.pbkdf2_hmac('sha1', _to_bytes(passphrase), _to_bytes(ssid),
+                              PSK_ITERATIONS, 32)
+
+    return binascii.hexlify(psk).decode('ascii')
+
+
+def _check_passphrase(passphrase):
+
+    if not 8 <= len(passphrase) <= 63:
+        raise ValueError('A passphrase has 8 to 63 characters, '
+                         'got {}'.format(len(passphrase)))
+
+
+def derive_psk(ssid, passphrase):
+    """Derive the PSK of passphrase for ssid as 64 hex digits.
+
+    The PSKs are cached by (ssid, passphrase).
+    """
+
+    key = (ssid, passphrase)
+    psk = _psk_cache.get(key)
+    if psk is None:
+        _check_passphrase(passphrase)
+        psk = _derive(key)
+        if len(_psk_cache) >= PSK_CACHE_SIZE:
+            _psk_cache.clear()
+        _psk_cache[key] = psk
+
+    return psk
+
+
+def derive_psks(pairs, processes=None):
+    """Derive the PSKs of many (ssid, passphrase) pairs.
+
+    The PSKs which are not cached are derived by a pool of processes
+    (processes defaults to the number of CPUs). On Windows, the caller
+    has to be guarded by if __name__ == '__main__'.
+    """
+
+    pairs = list(pairs)
+    # The hits are copied, as other threads may evict them meanwhile.
+    hits = {}
+    misses = []
+    for key in set(pairs):
+        psk = _psk_cache.get(key)
+        if psk is not None:
+            hits[key] = psk
+        else:
+            _check_passphrase(key[1])
+            misses.append(key)
+
+    if len(misses) < PARALLEL_MIN or processes == 1:
+        psks = [_derive(key) for key in misses]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            psks = pool.map(_derive, misses)
+        finally:
+            pool.close()
+            pool.join()
+
+    hits.update(zip(misses, psks))
+    # Cache at most PSK_CACHE_SIZE of the derived PSKs.
+    derived = list(zip(misses, psks))[-PSK_CACHE_SIZE:]
+    if len(_psk_cache) + len(derived) > PSK_CACHE_SIZE:
+        _psk_cache.clear()
+    _psk_cache.update(derived)
+
+    return [hits[key] for key in pairs]
+    return psks
+
+
+def precompute_psks(profiles, processes=None):
+    """Replace the passphrases of WPA-PSK profiles with their PSKs.
+
+    The key of each profile of AKM_TYPE_WPAPSK or AKM_TYPE_WPA2PSK with
+    KEY_TYPE_PASSPHRASE is replaced with its PSK and the key_type is set
+    to KEY_TYPE_NETWORKKEY. The profiles are returned.
+    """
+
+    targets = [profile for profile in profiles
+               if profile.key and profile.key_type == KEY_TYPE_PASSPHRASE and
+               profile.akm and
+               profile.akm[-1] in [AKM_TYPE_WPAPSK, AKM_TYPE_WPA2PSK]]
+
+    psks = derive_psks([(profile.ssid, profile.key) for profile in targets],
+                       processes)
+    for profile, psk in zip(targets, psks):
+        profile.key = psk
+        profile.key_type = KEY_TYPE_NETWORKKEY
+
+    return profiles
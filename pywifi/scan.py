@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""Track the changes of the BSSes found by repeated scans."""
+
+import time
+from collections import OrderedDict, namedtuple
+
+from .profile import mask_to_akm
+
+
+# Seconds a scan stream waits before scanning again after a failed scan.
+SCAN_RETRY_DELAY = 1
+
+ScanBatch = namedtuple('ScanBatch', ['new', 'changed', 'gone'])
+
+
+def diff_scan_results(state, bsses):
+    """Update state with the results of a scan and return a ScanBatch.
+
+    state maps the bssid of each BSS to its last ScanResult. The BSSes
+    which are not in state are new, the ones which differ from their last
+    result are changed, and the ones missing from bsses are gone and
+    removed from state.
+    """
+
+    new = []
+    changed = []
+    seen = set()
+    for bss in bsses:
+        seen.add(bss.bssid)
+        last = state.get(bss.bssid)
+        if last is None:
+            new.append(bss)
+        elif last != bss:
+            changed.append(bss)
+        state[bss.bssid] = bss
+
+    gone = [state.pop(bssid) for bssid in
+            [bssid for bssid in state if bssid not in seen]]
+
+    return ScanBatch(new, changed, gone)
+
+
+class ScanEntry(object):
+    """ScanEntry is a BSS kept by ScanTable with its signal statistics."""
+
+    __slots__ = ('bssid', 'ssid', 'freq', 'akm_mask', 'cipher', 'signal',
+                 'min_signal', 'max_signal', 'ewma_signal', 'first_seen',
+                 'last_seen', 'count', 'reported_signal')
+
+    def __init__(self, bss, now):
+
+        self.bssid = bss.bssid
+        self.ssid = bss.ssid
+        self.freq = bss.freq
+        self.akm_mask = bss.akm_mask
+        self.cipher = bss.cipher
+        self.signal = bss.signal
+        self.min_signal = bss.signal
+        self.max_signal = bss.signal
+        self.ewma_signal = float(bss.signal)
+        self.first_seen = now
+        self.last_seen = now
+        self.count = 1
+        # The signal when the entry was last returned as new or changed.
+        self.reported_signal = bss.signal
+
+    @property
+    def akm(self):
+
+        return mask_to_akm(self.akm_mask)
+
+    def update(self, bss, now, alpha, signal_delta):
+        """Update the entry with bss and return whether it changed.
+
+        A change of the ssid, freq or security is always a change, while
+        the signal has to move by signal_delta dBm since it was reported.
+        """
+
+        changed = (bss.ssid != self.ssid or bss.freq != self.freq or
+                   bss.akm_mask != self.akm_mask or
+                   bss.cipher != self.cipher or
+                   abs(bss.signal - self.reported_signal) >= signal_delta)
+
+        self.ssid = bss.ssid
+        self.freq = bss.freq
+        self.akm_mask = bss.akm_mask
+        self.cipher = bss.cipher
+        self.signal = bss.signal
+        self.min_signal = min(self.min_signal, bss.signal)
+        self.max_signal = max(self.max_signal, bss.signal)
+        self.ewma_signal += alpha * (bss.signal - self.ewma_signal)
+        self.last_seen = now
+        self.count += 1
+        if changed:
+            self.reported_signal = bss.signal
+
+        return changed
+
+    def __repr__(self):
+
+        return 'ScanEntry(bssid={!r}, ssid={!r}, freq={}, signal={})'.format(
+            self.bssid, self.ssid, self.freq, self.signal)
+
+
+class ScanTable(object):
+    """ScanTable keeps every BSS found by scans until it ages out.
+
+    ingest() takes the ScanResults of a scan and returns a ScanBatch of the
+    new, changed and evicted ScanEntries. An entry is evicted when it has
+    not been seen for max_age seconds, or when it is the least recently
+    seen one while the table holds more than capacity entries. The work
+    of an ingest is proportional to the BSSes ingested and evicted, not to
+    the size of the table.
+    """
+
+    def __init__(self, max_age=None, capacity=None, alpha=0.25,
+                 signal_delta=5):
+
+        self.max_age = max_age
+        self.capacity = capacity
+        self.alpha = alpha
+        self.signal_delta = signal_delta
+        # The entries ordered from the least recently seen one.
+        self._entries = OrderedDict()
+
+    def __len__(self):
+
+        return len(self._entries)
+
+    def __iter__(self):
+
+        return iter(self._entries.values())
+
+    def __contains__(self, bssid):
+
+        return bssid in self._entries
+
+    def __getitem__(self, bssid):
+
+        return self._entries[bssid]
+
+    def get(self, bssid, default=None):
+
+        return self._entries.get(bssid, default)
+
+    def ingest(self, bsses, now=None):
+        """Add the results of a scan and return the changes of the table."""
+
+        if now is None:
+            now = time.time()
+
+        entries = self._entries
+        new = []
+        changed = []
+        for bss in bsses:
+            entry = entries.pop(bss.bssid, None)
+            if entry is None:
+                entry = ScanEntry(bss, now)
+                new.append(entry)
+            elif entry.update(bss, now, self.alpha, self.signal_delta):
+                changed.append(entry)
+            entries[bss.bssid] = entry
+
+        return ScanBatch(new, changed, self.expire(now))
+
+    def expire(self, now=None):
+        """Evict the entries which are too old or over the capacity."""
+
+        if now is None:
+            now = time.time()
+
+        entries = self._entries
+        gone = []
+        while entries:
+            bssid = next(iter(entries))
+            entry = entries[bssid]
+            if (self.capacity is None or len(entries) <= self.capacity) and\
+                    (self.max_age is None or
+                     now - entry.last_seen <= self.max_age):
+                break
+
+            del entries[bssid]
+            gone.append(entry)
+
+        return gone
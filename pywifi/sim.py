@@ -0,0 +1,559 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+sim - a simulated wifi backend kept in memory.
+
+Simulation models wifi interfaces, the BSSes around them, the time which
+scans and connections take and the state of each interface, without a
+wifi device, wpa_supplicant or any I/O. A Simulation is a backend itself,
+so code built on pywifi can be load-tested with many interfaces and
+thousands of BSSes:
+
+    simulation = Simulation(ifaces=4, bsses=5000, scan_time=1)
+    wifi = pywifi.PyWiFi(backend=simulation)
+
+PyWiFi(backend='sim') uses the default Simulation of this module. The
+simulated time passes with the real time, and nothing runs in the
+background: the scans and connections are completed when an interface is
+used after they are due.
+"""
+
+import copy
+import logging
+import random
+import string
+import threading
+import time
+from collections import OrderedDict
+
+from .const import *
+from .profile import BssResult, ScanResult, akm_to_mask, diff_profiles,\
+    key_digest
+
+
+SCAN_TIMEOUT = 10
+CONNECT_TIMEOUT = 30
+# The standard deviation in dB of the signal between scans.
+SIGNAL_JITTER = 2
+NOISE = -95
+# The BSSes of the same ssid, like the APs of an office.
+BSSES_PER_SSID = 3
+
+FREQS = [2412 + 5 * i for i in range(13)] +\
+    [5180 + 20 * i for i in range(8)] +\
+    [5500 + 20 * i for i in range(12)] +\
+    [5745 + 20 * i for i in range(5)]
+
+# The akm types of the generated BSSes and their flags.
+BSS_SECURITY = [
+    (AKM_TYPE_NONE, CIPHER_TYPE_NONE, '[ESS]'),
+    (AKM_TYPE_WPAPSK, CIPHER_TYPE_TKIP, '[WPA-PSK-TKIP][ESS]'),
+    (AKM_TYPE_WPA2PSK, CIPHER_TYPE_CCMP, '[WPA2-PSK-CCMP][ESS]'),
+    (AKM_TYPE_WPA2PSK, CIPHER_TYPE_CCMP, '[WPA2-PSK-CCMP][WPS][ESS]'),
+    (AKM_TYPE_WPA2, CIPHER_TYPE_CCMP, '[WPA2-EAP-CCMP][ESS]'),
+]
+
+status_dict = {
+    'COMPLETED': IFACE_CONNECTED,
+    'ASSOCIATING': IFACE_CONNECTING,
+    'SCANNING': IFACE_SCANNING,
+    'INACTIVE': IFACE_INACTIVE,
+    'DISCONNECTED': IFACE_DISCONNECTED,
+}
+
+_default = None
+_default_lock = threading.Lock()
+
+
+class _SimIface(object):
+    """The state of a simulated interface."""
+
+    def __init__(self, name, seed):
+
+        self.name = name
+        self.rng = random.Random(seed)
+        # The stored profiles by network id.
+        self.profiles = OrderedDict()
+        self.next_network_id = 0
+        self.results = []
+        self.last_bss_id = -1
+        # The time the running scan is done at.
+        self.scan_done = None
+        # The network id and the BSS connected to.
+        self.network_id = None
+        self.bss = None
+        # The running connection as (done, network_id, bss, reason).
+        self.connecting = None
+        self.wpa_state = 'INACTIVE'
+        self.callbacks = []
+        self.changes = []
+
+
+class Simulation(object):
+    """Simulation holds the BSSes and the interfaces of a simulated world.
+
+    ifaces interfaces named sim0, sim1, ... see bsses generated BSSes,
+    which are spread over the 2.4 and 5 GHz channels in groups of
+    BSSES_PER_SSID of the same ssid. A scan takes scan_time seconds and
+    a connection connect_time seconds. seed makes the BSSes and the
+    signals of the scans reproducible.
+    """
+
+    def __init__(self, ifaces=1, bsses=100, scan_time=0, connect_time=0,
+                 seed=None):
+
+        self.scan_time = scan_time
+        self.connect_time = connect_time
+        self.lock = threading.RLock()
+        self.bsses = []
+        # The passphrases of the ssids which check the keys.
+        self.keys = {}
+        self._security = {}
+        self._rng = random.Random(seed)
+        for _ in range(bsses):
+            self.add_bss()
+        self.ifaces = OrderedDict()
+        for i in range(ifaces):
+            name = 'sim{}'.format(i)
+            self.ifaces[name] = _SimIface(name, self._rng.random())
+
+    def add_bss(self, ssid=None, bssid=None, freq=None, signal=None,
+                akm=None):
+        """Add a BSS and return its BssResult.
+
+        The fields which are not given are generated. signal is the mean
+        signal, which the scans vary by SIGNAL_JITTER.
+        """
+
+        with self.lock:
+            bss_id = len(self.bsses)
+            ssid = ssid or 'simap{}'.format(bss_id // BSSES_PER_SSID)
+            if akm is not None:
+                security = next(security for security in BSS_SECURITY
+                                if security[0] == akm)
+            else:
+                # The BSSes of an ssid share its security.
+                security = self._security.get(ssid) or\
+                    self._rng.choice(BSS_SECURITY)
+            self._security.setdefault(ssid, security)
+            akm_type, cipher, flags = security
+
+            bss = BssResult(
+                bssid or '02:00:{:02x}:{:02x}:{:02x}:{:02x}'.format(
+                    *bytearray((bss_id >> shift) & 0xff
+                               for shift in (24, 16, 8, 0))),
+                ssid, freq or self._rng.choice(FREQS),
+                signal if signal is not None else
+                self._rng.randint(-90, -30),
+                akm_to_mask([akm_type]), cipher, id=bss_id, noise=NOISE,
+                age=0, ie='', flags=flags)
+            self.bsses.append(bss)
+
+        return bss
+
+    def set_key(self, ssid, key):
+        """Make the connections to ssid fail unless the key is key."""
+
+        with self.lock:
+            self.keys[ssid] = key
+
+    def WifiUtil(self):
+        """Make a WifiUtil of the simulation, as the backends do."""
+
+        return WifiUtil(self)
+
+
+def default_simulation():
+    """Get the Simulation used by PyWiFi(backend='sim')."""
+
+    global _default
+
+    with _default_lock:
+        if _default is None:
+            _default = Simulation()
+
+    return _default
+
+
+def _check_key(params):
+
+    if params.akm[-1] not in [AKM_TYPE_WPAPSK, AKM_TYPE_WPA2PSK]:
+        return True
+    if params.key_type == KEY_TYPE_NETWORKKEY:
+        return len(params.key or '') == 64 and\
+            all(c in string.hexdigits for c in params.key)
+
+    return 8 <= len(params.key or '') <= 63
+
+
+class WifiUtil():
+    """WifiUtil implements the wifi functions on a Simulation."""
+
+    def __init__(self, simulation=None):
+
+        self._sim = simulation or default_simulation()
+        self._logger = logging.getLogger('pywifi')
+
+    def scan(self, obj, wait=False, timeout=SCAN_TIMEOUT):
+        """Trigger the wifi interface to scan.
+
+        If wait is True, block until the scan is done (or timeout seconds
+        elapsed) and return whether the scan results are ready.
+        """
+
+        iface = self._sim.ifaces[obj['name']]
+        with self._sim.lock:
+            self._update(iface)
+            if iface.scan_done is None:
+                iface.scan_done = time.time() + self._sim.scan_time
+                self._update(iface)
+            done = iface.scan_done
+        self._notify(iface)
+
+        if not wait:
+            return None
+
+        if done is not None:
+            time.sleep(max(0, min(done - time.time(), timeout)))
+
+        with self._sim.lock:
+            self._update(iface)
+            scanned = iface.scan_done is None
+        self._notify(iface)
+
+        return scanned
+
+    def scan_results(self, obj):
+        """Get the BSSes found by the last scan."""
+
+        iface = self._sim.ifaces[obj['name']]
+        with self._sim.lock:
+            self._update(iface)
+            # The BSS fields are only returned by bss_results().
+            results = [ScanResult(bss.bssid, bss.ssid, bss.freq, bss.signal,
+                                  bss.akm_mask, bss.cipher, bss.auth)
+                       for bss in iface.results]
+        self._notify(iface)
+
+        return results
+
+    def bss_results(self, obj, new_only=False):
+        """Get the BSSes found by the last scan with their ids.
+
+        If new_only is True, only the BSSes not returned before are
+        returned.
+        """
+
+        iface = self._sim.ifaces[obj['name']]
+        with self._sim.lock:
+            self._update(iface)
+            bsses = [bss for bss in iface.results
+                     if not new_only or bss.id > iface.last_bss_id]
+            if bsses:
+                iface.last_bss_id = max(iface.last_bss_id,
+                                        max(bss.id for bss in bsses))
+        self._notify(iface)
+
+        return bsses
+
+    def connect(self, obj, params, wait=False, timeout=CONNECT_TIMEOUT):
+        """Connect to the strongest BSS of the ssid of params.
+
+        If wait is True, block until the outcome is known (or timeout
+        seconds elapsed) and return (status, reason, elapsed).
+        """
+
+        start = time.time()
+        iface = self._sim.ifaces[obj['name']]
+        with self._sim.lock:
+            self._update(iface)
+            outcome = self._start_connecting(iface, params, start)
+            connecting = iface.connecting
+        self._notify(iface)
+
+        if not wait:
+            return None
+        if outcome is not None:
+            return outcome + (time.time() - start,)
+
+        done, network_id, bss, reason = connecting
+        if done - start > timeout:
+            time.sleep(max(0, start + timeout - time.time()))
+            return CONNECT_TIMED_OUT, None, time.time() - start
+
+        time.sleep(max(0, done - time.time()))
+        with self._sim.lock:
+            self._update(iface)
+        self._notify(iface)
+        if reason is not None:
+            return CONNECT_FAILED, reason, time.time() - start
+
+        return CONNECT_SUCCEEDED, None, time.time() - start
+
+    def _start_connecting(self, iface, params, now):
+        """Start connecting, or return the outcome if it is known now."""
+
+        selected = [network_id for network_id, profile in
+                    iface.profiles.items() if profile.ssid == params.ssid]
+        if not selected:
+            return CONNECT_FAILED, None
+
+        network_id = selected[-1]
+        if iface.wpa_state == 'COMPLETED' and iface.network_id == network_id:
+            return CONNECT_SUCCEEDED, None
+
+        profile = iface.profiles[network_id]
+        candidates = [bss for bss in self._sim.bsses if bss == profile]
+        reason = None
+        bss = None
+        if not candidates:
+            reason = 'CONN_FAILED'
+        else:
+            bss = max(candidates, key=lambda bss: bss.signal)
+            key = self._sim.keys.get(profile.ssid)
+            if key is not None and bss.akm_mask & akm_to_mask(
+                    [AKM_TYPE_WPAPSK, AKM_TYPE_WPA2PSK]):
+                if profile.key_type == KEY_TYPE_NETWORKKEY:
+                    from .psk import derive_psk
+                    key = derive_psk(profile.ssid, key)
+                if profile.key != key:
+                    reason = 'WRONG_KEY'
+
+        iface.network_id = None
+        iface.bss = None
+        iface.connecting = (now + self._sim.connect_time, network_id, bss,
+                            reason)
+        self._update(iface)
+
+        return None
+
+    def disconnect(self, obj):
+        """Disconnect from the AP."""
+
+        iface = self._sim.ifaces[obj['name']]
+        with self._sim.lock:
+            self._disconnect(iface)
+        self._notify(iface)
+
+    def _disconnect(self, iface):
+
+        iface.connecting = None
+        iface.network_id = None
+        iface.bss = None
+        self._update(iface)
+
+    def add_network_profile(self, obj, params):
+        """Add an AP profile for connecting to afterward."""
+
+        self.add_network_profiles(obj, [params])
+
+        return params
+
+    def add_network_profiles(self, obj, profiles, save_config=False):
+        """Add AP profiles and return whether each is added.
+
+        A simulation keeps no configuration, so save_config is ignored.
+        """
+
+        iface = self._sim.ifaces[obj['name']]
+        added = []
+        with self._sim.lock:
+            for params in profiles:
+                params.process_akm()
+                added.append(_check_key(params))
+                if added[-1]:
+                    self._store(iface, iface.next_network_id, params)
+                    iface.next_network_id += 1
+
+        return added
+
+    def _store(self, iface, network_id, params):
+
+        profile = copy.copy(params)
+        profile.akm = list(params.akm)
+        profile.id = network_id
+        iface.profiles[network_id] = profile
+
+    def sync_network_profiles(self, obj, desired, save_config=False):
+        """Make the AP profiles the desired ones.
+
+        Return (added, changed, removed, unchanged, failed) as the Linux
+        one.
+        """
+
+        iface = self._sim.ifaces[obj['name']]
+        with self._sim.lock:
+            # The simulated networks keep their keys.
+            unchanged, changed, added, removed = diff_profiles(
+                self.network_profiles(obj), list(desired),
+                lambda profile, params: key_digest(
+                    iface.profiles[profile.id]) != key_digest(params))
+
+            for profile in removed:
+                self._remove(iface, profile.id)
+
+            failed = []
+            for profile, params in changed:
+                if _check_key(params):
+                    self._store(iface, profile.id, params)
+                else:
+                    failed.append(params)
+            failed_ids = set(id(params) for params in failed)
+            changed = [params for _, params in changed
+                       if id(params) not in failed_ids]
+            results = self.add_network_profiles(obj, added)
+            failed.extend(params for params, ok in zip(added, results)
+                          if not ok)
+            added = [params for params, ok in zip(added, results) if ok]
+        self._notify(iface)
+
+        return added, changed, removed, unchanged, failed
+
+    def network_profiles(self, obj):
+        """Get the AP profiles without their keys."""
+
+        iface = self._sim.ifaces[obj['name']]
+        profiles = []
+        with self._sim.lock:
+            for stored in iface.profiles.values():
+                profile = copy.copy(stored)
+                profile.akm = list(stored.akm)
+                profile.key = None
+                profile.key_type = KEY_TYPE_PASSPHRASE
+                profiles.append(profile)
+
+        return profiles
+
+    def remove_network_profile(self, obj, params):
+        """Remove the specified AP profile."""
+
+        iface = self._sim.ifaces[obj['name']]
+        with self._sim.lock:
+            matched = [network_id for network_id, profile in
+                       iface.profiles.items() if profile == params]
+            if matched:
+                self._remove(iface, matched[-1])
+        self._notify(iface)
+
+    def remove_all_network_profiles(self, obj):
+        """Remove all the AP profiles."""
+
+        iface = self._sim.ifaces[obj['name']]
+        with self._sim.lock:
+            for network_id in list(iface.profiles):
+                self._remove(iface, network_id)
+        self._notify(iface)
+
+    def _remove(self, iface, network_id):
+
+        del iface.profiles[network_id]
+        connecting = iface.connecting and iface.connecting[1] == network_id
+        if connecting or iface.network_id == network_id:
+            self._disconnect(iface)
+
+    def status(self, obj):
+        """Get the wifi interface status."""
+
+        iface = self._sim.ifaces[obj['name']]
+        with self._sim.lock:
+            self._update(iface)
+            status = status_dict[iface.wpa_state]
+        self._notify(iface)
+
+        return status
+
+    def status_info(self, obj):
+        """Get the fields of the status like the STATUS of wpa_s."""
+
+        iface = self._sim.ifaces[obj['name']]
+        with self._sim.lock:
+            self._update(iface)
+            fields = {'wpa_state': iface.wpa_state}
+            if iface.bss is not None:
+                fields.update(
+                    bssid=iface.bss.bssid, ssid=iface.bss.ssid,
+                    freq=str(iface.bss.freq), id=str(iface.network_id),
+                    key_mgmt={AKM_TYPE_NONE: 'NONE',
+                              AKM_TYPE_WPAPSK: 'WPA-PSK',
+                              AKM_TYPE_WPA2PSK: 'WPA2-PSK'}.get(
+                                  iface.bss.akm[-1], 'WPA2/IEEE 802.1X/EAP'))
+        self._notify(iface)
+
+        return fields
+
+    def add_status_callback(self, obj, callback):
+        """Call callback(old, new) when the status of the iface changes."""
+
+        with self._sim.lock:
+            self._sim.ifaces[obj['name']].callbacks.append(callback)
+
+    def remove_status_callback(self, obj, callback):
+
+        with self._sim.lock:
+            self._sim.ifaces[obj['name']].callbacks.remove(callback)
+
+    def interfaces(self):
+        """Get the simulated interfaces."""
+
+        return [{'name': name} for name in self._sim.ifaces]
+
+    def _update(self, iface):
+        """Complete the due scan and connection and update the state."""
+
+        now = time.time()
+        if iface.scan_done is not None and now >= iface.scan_done:
+            iface.scan_done = None
+            iface.results = self._scan(iface)
+
+        if iface.connecting is not None and now >= iface.connecting[0]:
+            _, network_id, bss, reason = iface.connecting
+            iface.connecting = None
+            if reason is None:
+                iface.network_id = network_id
+                iface.bss = bss
+
+        if iface.bss is not None:
+            wpa_state = 'COMPLETED'
+        elif iface.connecting is not None:
+            wpa_state = 'ASSOCIATING'
+        elif iface.scan_done is not None:
+            wpa_state = 'SCANNING'
+        elif not iface.profiles:
+            wpa_state = 'INACTIVE'
+        else:
+            wpa_state = 'DISCONNECTED'
+
+        old = status_dict[iface.wpa_state]
+        iface.wpa_state = wpa_state
+        if status_dict[wpa_state] != old:
+            iface.changes.append((old, status_dict[wpa_state]))
+
+    def _scan(self, iface):
+
+        gauss = iface.rng.gauss
+        results = []
+        for bss in self._sim.bsses:
+            results.append(BssResult(
+                bss.bssid, bss.ssid, bss.freq,
+                int(round(bss.signal + gauss(0, SIGNAL_JITTER))),
+                bss.akm_mask, bss.cipher, id=bss.id, noise=bss.noise, age=0,
+                ie=bss.ie, flags=bss.flags))
+
+        return results
+
+    def _notify(self, iface):
+        """Call the callbacks of the status changes out of the lock."""
+
+        with self._sim.lock:
+            changes = iface.changes
+            iface.changes = []
+            callbacks = list(iface.callbacks)
+
+        for old, new in changes:
+            for callback in callbacks:
+                try:
+                    callback(old, new)
+                except Exception:
+                    self._logger.exception("Status callback of iface '%s' "
+                                           "failed", iface.name)
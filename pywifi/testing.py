@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+testing - helpers for testing code built on pywifi.
+
+FakeWpaSupplicant serves a wpa_supplicant control interface on a local
+AF_UNIX datagram socket, so the Linux backend can be exercised without
+a wifi device.
+"""
+
+import copy
+import errno
+import heapq
+import itertools
+import os
+import select
+import shutil
+import socket
+import string
+import tempfile
+import threading
+import time
+
+
+DEFAULT_BSSES = [
+    {'bssid': '14:4d:67:14:1e:44', 'freq': 2412, 'level': -67,
+     'flags': '[WPA2-PSK-CCMP][WPS][ESS]', 'ssid': 'TOTOLINK N302RE'},
+    {'bssid': 'ac:9e:17:31:85:fc', 'freq': 2437, 'level': -63,
+     'flags': '[WPA2-PSK-CCMP][WPS][ESS]', 'ssid': 'Evan'},
+    {'bssid': '0c:80:63:2b:0d:a8', 'freq': 2417, 'level': -79,
+     'flags': '[WPA2-PSK-CCMP][WPS][ESS]', 'ssid': 'Kevin_H2'},
+    {'bssid': '78:32:1b:63:96:05', 'freq': 2422, 'level': -91,
+     'flags': '[WPA-PSK-CCMP][WPA2-PSK-CCMP][ESS]', 'ssid': 'joyfulness'},
+]
+
+BSS_FIELDS = [
+    (1 << 0, 'id'), (1 << 1, 'bssid'), (1 << 2, 'freq'),
+    (1 << 3, 'beacon_int'), (1 << 4, 'capabilities'), (1 << 5, 'qual'),
+    (1 << 6, 'noise'), (1 << 7, 'level'), (1 << 8, 'tsf'), (1 << 9, 'age'),
+    (1 << 10, 'ie'), (1 << 11, 'flags'), (1 << 12, 'ssid'),
+]
+BSS_MASK_ALL = 0xfffdffff
+BSS_MASK_DELIM = 1 << 17
+BSS_DEFAULTS = {
+    'beacon_int': 100, 'capabilities': '0x0411', 'qual': 0, 'noise': -95,
+    'tsf': '0000000000000000', 'age': 0, 'ie': '',
+}
+
+# The reply buffer size of wpa_supplicant.
+REPLY_SIZE = 4096
+
+NETWORK_DEFAULTS = {
+    'key_mgmt': 'WPA-PSK WPA-EAP',
+    'proto': 'WPA RSN',
+    'pairwise': 'CCMP TKIP',
+}
+
+
+class FakeWpaSupplicant:
+    """FakeWpaSupplicant answers the control commands of wpa_supplicant.
+
+    The server runs in a daemon thread. Its control socket is created as
+    '<ctrl_iface_dir>/<iface>', so the Linux backend can be pointed to it
+    by setting _wifiutil_linux.CTRL_IFACE_DIR to ctrl_iface_dir.
+
+    latency delays the reply of each command by seconds: a number for all
+    the commands or a dict of the delays by command name (e.g.
+    {'SCAN_RESULTS': 0.01}). Like wpa_supplicant, the server handles one
+    command at a time, so each command is delayed by its latency after
+    the reply of the previous one and pipelined commands wait for the
+    sum of their latencies. A scan reports its results scan_time seconds
+    after its reply.
+    """
+
+    def __init__(self, iface='wlan0', ctrl_iface_dir=None, bsses=None,
+                 latency=0, scan_time=0):
+
+        self.iface = iface
+        self._own_dir = ctrl_iface_dir is None
+        self.ctrl_iface_dir = ctrl_iface_dir or tempfile.mkdtemp(
+            prefix='pywifi_')
+        self.ctrl_iface = '/'.join([self.ctrl_iface_dir, iface])
+        self.bsses = []
+        self._next_bss_id = 0
+        for bss in DEFAULT_BSSES if bsses is None else bsses:
+            self.add_bss(**bss)
+        self.networks = {}
+        # The networks at the last SAVE_CONFIG.
+        self.saved_networks = None
+        self.wpa_state = 'DISCONNECTED'
+        self.current_network = None
+        self.cmds = []
+        self.latency = latency
+        self.scan_time = scan_time
+        self._next_network_id = 0
+        # The replies and events to send as (due, seq, data, addr).
+        self._pending = []
+        self._seq = itertools.count()
+        self._last_due = 0
+        self._attached = set()
+        self._sock = None
+        self._thread = None
+        self._running = False
+
+    def __enter__(self):
+
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+
+        self.stop()
+
+    def start(self):
+        """Create the control socket and start serving."""
+
+        if not os.path.isdir(self.ctrl_iface_dir):
+            os.makedirs(self.ctrl_iface_dir)
+        if os.path.exists(self.ctrl_iface):
+            os.remove(self.ctrl_iface)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.ctrl_iface)
+        self._pending = []
+        self._running = True
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving and remove the control socket."""
+
+        self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        if os.path.exists(self.ctrl_iface):
+            os.remove(self.ctrl_iface)
+        if self._own_dir:
+            shutil.rmtree(self.ctrl_iface_dir, ignore_errors=True)
+
+    def add_bss(self, **fields):
+        """Add a BSS found by scans and return its id."""
+
+        bss = dict(BSS_DEFAULTS, id=self._next_bss_id)
+        bss.update(fields)
+        self._next_bss_id = bss['id'] + 1
+        self.bsses.append(bss)
+
+        return bss['id']
+
+    def add_network(self, ssid, **fields):
+        """Add a configured network and return its id."""
+
+        network_id = self._next_network_id
+        self._next_network_id += 1
+        self.networks[network_id] = dict(fields, ssid='"{}"'.format(ssid))
+
+        return network_id
+
+    def send_event(self, event, level=2):
+        """Send an unsolicited event to the attached clients."""
+
+        data = '<{}>{}'.format(level, event).encode('utf-8')
+        for addr in list(self._attached):
+            try:
+                # Like wpa_supplicant, drop the events which the queue of
+                # a client has no room for rather than block.
+                self._sock.sendto(data, socket.MSG_DONTWAIT, addr)
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self._attached.discard(addr)
+
+    def _serve(self):
+
+        while self._running:
+            timeout = 0.05
+            if self._pending:
+                timeout = min(timeout,
+                              max(0, self._pending[0][0] - time.time()))
+            readable, _, _ = select.select([self._sock], [], [], timeout)
+            if readable:
+                data, addr = self._sock.recvfrom(4096)
+                self._receive(data.decode('utf-8'), addr)
+
+            self._send_due()
+
+    def _receive(self, cmd, addr):
+
+        self.cmds.append(cmd)
+        reply, events = self._handle(cmd, addr)
+
+        name = cmd.partition(' ')[0]
+        latency = self.latency
+        if isinstance(latency, dict):
+            latency = latency.get(name, 0)
+        # The commands are handled one at a time, in order.
+        due = max(time.time(), self._last_due) + latency
+        self._last_due = due
+
+        self._schedule(due, reply, addr)
+        for event in events:
+            delay = 0
+            if isinstance(event, tuple):
+                delay, event = event
+            self._schedule(due + delay, event, None)
+
+    def _schedule(self, due, data, addr):
+
+        heapq.heappush(self._pending, (due, next(self._seq), data, addr))
+
+    def _send_due(self):
+
+        now = time.time()
+        while self._pending and self._pending[0][0] <= now:
+            _, _, data, addr = heapq.heappop(self._pending)
+            if addr is None:
+                self.send_event(data)
+                continue
+
+            try:
+                self._sock.sendto(data.encode('utf-8'), socket.MSG_DONTWAIT,
+                                  addr)
+            except socket.error:
+                pass
+
+    def _handle(self, cmd, addr):
+        """Return the reply of cmd and the events caused by it.
+
+        An event can be (delay, event) to send it delay seconds after the
+        reply.
+        """
+
+        name, _, args = cmd.partition(' ')
+        handler = getattr(self, '_cmd_' + name.lower().replace('-', '_'),
+                          None)
+        if handler is None:
+            return 'UNKNOWN COMMAND\n', []
+
+        result = handler(args, addr)
+        if isinstance(result, tuple):
+            return result
+
+        return result, []
+
+    def _cmd_ping(self, args, addr):
+
+        return 'PONG\n'
+
+    def _cmd_attach(self, args, addr):
+
+        self._attached.add(addr)
+        return 'OK\n'
+
+    def _cmd_detach(self, args, addr):
+
+        self._attached.discard(addr)
+        return 'OK\n'
+
+    def _cmd_scan(self, args, addr):
+
+        return 'OK\n', ['CTRL-EVENT-SCAN-STARTED ',
+                        (self.scan_time, 'CTRL-EVENT-SCAN-RESULTS ')]
+
+    def _cmd_scan_results(self, args, addr):
+
+        reply = 'bssid / frequency / signal level / flags / ssid\n'
+        for bss in self.bsses:
+            reply += '{bssid}\t{freq}\t{level}\t{flags}\t{ssid}\n'.format(
+                **bss)
+
+        return reply
+
+    def _cmd_bss(self, args, addr):
+
+        mask = BSS_MASK_ALL
+        for arg in args.split(' '):
+            if arg.startswith('MASK='):
+                mask = int(arg[5:], 16) or BSS_MASK_ALL
+
+        target = args.split(' ')[0]
+        bsses = self.bsses
+        if target.startswith('RANGE='):
+            if target[6:] != 'ALL':
+                first, _, last = target[6:].partition('-')
+                first = int(first or 0)
+                last = int(last) if last else float('inf')
+                bsses = [bss for bss in bsses if first <= bss['id'] <= last]
+        elif target == 'FIRST':
+            bsses = bsses[:1]
+        elif target == 'LAST':
+            bsses = bsses[-1:]
+        elif target.startswith('NEXT-'):
+            bsses = [bss for bss in bsses if bss['id'] > int(target[5:])][:1]
+        else:
+            bsses = [bss for bss in bsses
+                     if str(bss['id']) == target or bss['bssid'] == target]
+
+        reply = ''
+        for bss in bsses:
+            entry = ''.join('{}={}\n'.format(name, bss[name])
+                            for bit, name in BSS_FIELDS if mask & bit)
+            if mask & BSS_MASK_DELIM:
+                last = bss is self.bsses[-1]
+                entry += '####\n' if last else '====\n'
+            if len(reply) + len(entry) >= REPLY_SIZE:
+                break
+            reply += entry
+
+        return reply
+
+    def _cmd_list_networks(self, args, addr):
+
+        reply = 'network id / ssid / bssid / flags\n'
+        for network_id in sorted(self.networks):
+            network = self.networks[network_id]
+            flags = '[CURRENT]' if network_id == self.current_network else ''
+            reply += '{}\t{}\tany\t{}\n'.format(
+                network_id, network.get('ssid', '""')[1:-1], flags)
+
+        return reply
+
+    def _cmd_add_network(self, args, addr):
+
+        network_id = self.add_network('')
+        self.networks[network_id] = {}
+
+        return '{}\n'.format(network_id), [
+            'CTRL-EVENT-NETWORK-ADDED {}'.format(network_id)]
+
+    def _cmd_remove_network(self, args, addr):
+
+        if args == 'all':
+            network_ids = sorted(self.networks)
+        elif args.isdigit() and int(args) in self.networks:
+            network_ids = [int(args)]
+        else:
+            return 'FAIL\n'
+
+        events = []
+        for network_id in network_ids:
+            del self.networks[network_id]
+            events.append('CTRL-EVENT-NETWORK-REMOVED {}'.format(network_id))
+            if network_id == self.current_network:
+                self.current_network = None
+                self.wpa_state = 'DISCONNECTED'
+
+        return 'OK\n', events
+
+    def _cmd_set_network(self, args, addr):
+
+        values = args.split(' ', 2)
+        if len(values) != 3 or not values[0].isdigit() or\
+                int(values[0]) not in self.networks:
+            return 'FAIL\n'
+
+        # wpa_supplicant takes passphrases of 8 to 63 characters, or PSKs
+        # of 64 hex digits.
+        if values[1] == 'psk':
+            if values[2].startswith('"'):
+                valid = 8 <= len(values[2]) - 2 <= 63
+            else:
+                valid = len(values[2]) == 64 and\
+                    all(c in string.hexdigits for c in values[2])
+            if not valid:
+                return 'FAIL\n'
+
+        self.networks[int(values[0])][values[1]] = values[2]
+        return 'OK\n'
+
+    def _cmd_get_network(self, args, addr):
+
+        values = args.split(' ')
+        if len(values) != 2 or not values[0].isdigit() or\
+                int(values[0]) not in self.networks:
+            return 'FAIL\n'
+
+        network = self.networks[int(values[0])]
+        value = network.get(values[1], NETWORK_DEFAULTS.get(values[1]))
+        if value is None:
+            return 'FAIL\n'
+        if values[1] == 'psk':
+            return '*'
+
+        return value
+
+    def _cmd_save_config(self, args, addr):
+
+        self.saved_networks = copy.deepcopy(self.networks)
+        return 'OK\n'
+
+    def _cmd_select_network(self, args, addr):
+
+        if not args.isdigit() or int(args) not in self.networks:
+            return 'FAIL\n'
+
+        events = []
+        if self.wpa_state == 'COMPLETED' and\
+                self.current_network != int(args):
+            events.append('CTRL-EVENT-DISCONNECTED bssid=00:00:00:00:00:00 '
+                          'reason=3 locally_generated=1')
+        self.current_network = int(args)
+        self.wpa_state = 'COMPLETED'
+        ssid = self.networks[self.current_network].get('ssid', '""')
+        bssid = '00:00:00:00:00:00'
+        for bss in self.bsses:
+            if '"{}"'.format(bss['ssid']) == ssid:
+                bssid = bss['bssid']
+                break
+
+        events.append('CTRL-EVENT-CONNECTED - Connection to {} completed '
+                      '[id={} id_str=]'.format(bssid, self.current_network))
+
+        return 'OK\n', events
+
+    def _cmd_disconnect(self, args, addr):
+
+        events = []
+        if self.wpa_state == 'COMPLETED':
+            events.append('CTRL-EVENT-DISCONNECTED bssid=00:00:00:00:00:00 '
+                          'reason=3 locally_generated=1')
+        self.wpa_state = 'DISCONNECTED'
+
+        return 'OK\n', events
+
+    def _cmd_status(self, args, addr):
+
+        reply = ''
+        if self.wpa_state == 'COMPLETED':
+            network = self.networks[self.current_network]
+            reply += 'id={}\nssid={}\n'.format(
+                self.current_network, network.get('ssid', '""')[1:-1])
+        reply += 'wpa_state={}\n'.format(self.wpa_state)
+
+        return reply
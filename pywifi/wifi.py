@@ -9,38 +9,40 @@ folder (e.g. linux, win, and osx). So, PyWiFi class is just the
 entry point to manipulate wifi devices.
 """
 
-import platform
 import logging
+import threading
 
+from .backends import default_backend, get_backend
 from .iface import Interface
 
 
-if platform.system().lower() == 'windows':
-    from . import _wifiutil_win as wifiutil
-elif platform.system().lower() == 'linux':
-    from . import _wifiutil_linux as wifiutil
-else:
-    raise NotImplementedError
-
-
 class PyWiFi:
     """PyWiFi provides operations to manipulate wifi devices."""
 
     _ifaces = []
     _logger = None
+    _backend = None
+
+    def __init__(self, backend=None):
+        """Use backend, or the backend of the OS if it is None.
+
+        backend is the name of a registered backend (e.g. 'sim') or a
+        backend object (e.g. a pywifi.sim.Simulation).
+        """
 
-    def __init__(self):
-        
         self._logger = logging.getLogger('pywifi')
+        self._backend = backend if backend is not None else default_backend()
+        # The backend is imported here rather than with pywifi.
+        get_backend(self._backend)
 
     def interfaces(self):
         """Collect the available wlan interfaces."""
 
         self._ifaces = []
-        wifi_ctrl = wifiutil.WifiUtil()
+        wifi_ctrl = get_backend(self._backend).WifiUtil()
 
         for interface in wifi_ctrl.interfaces():
-            iface = Interface(interface)
+            iface = Interface(interface, self._backend)
             self._ifaces.append(iface)
             self._logger.info("Get interface: %s", iface.name())
 
@@ -48,3 +50,81 @@ class PyWiFi:
             self._logger.error("Can't get wifi interface")
 
         return self._ifaces
+
+    def enable_metrics(self, metrics=None):
+        """Record the round trips of the cmds sent by the backend.
+
+        metrics defaults to a new pywifi.metrics.Metrics, but any object
+        with its observe() method can be given. The cmds of all the
+        PyWiFi objects of the backend are recorded, until
+        disable_metrics(). metrics is returned.
+        """
+
+        if metrics is None:
+            # Imported here, as most programs do not record metrics.
+            from .metrics import Metrics
+            metrics = Metrics()
+
+        self._set_observer(metrics)
+
+        return metrics
+
+    def disable_metrics(self):
+        """Stop recording the round trips of the cmds."""
+
+        self._set_observer(None)
+
+    def _set_observer(self, observer):
+
+        wifi_ctrl = get_backend(self._backend).WifiUtil()
+        if not hasattr(wifi_ctrl, 'set_observer'):
+            raise NotImplementedError(
+                "Backend '{}' has no cmds to observe".format(self._backend))
+
+        wifi_ctrl.set_observer(observer)
+
+    def scan_all(self, timeout=10):
+        """Scan with all the interfaces at the same time.
+
+        Each interface scans in its own thread and waits for the end of
+        its scan (at most timeout seconds). The results are merged into a
+        dict which maps each bssid to (bss, signals), where bss is the
+        ScanResult with the strongest signal and signals maps the name of
+        each interface which found the bss to the signal it measured.
+        """
+
+        if not self._ifaces:
+            self.interfaces()
+
+        results = {}
+
+        def scan(iface):
+
+            try:
+                if iface.scan(wait=True, timeout=timeout):
+                    results[iface.name()] = iface.scan_results()
+                else:
+                    self._logger.error("Scan on iface '%s' failed",
+                                       iface.name())
+            except Exception:
+                self._logger.exception("Scan on iface '%s' failed",
+                                       iface.name())
+
+        threads = [threading.Thread(target=scan, args=(iface,))
+                   for iface in self._ifaces]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        bsses = {}
+        for iface in self._ifaces:
+            for bss in results.get(iface.name(), []):
+                if bss.bssid not in bsses:
+                    bsses[bss.bssid] = (bss, {})
+                elif bss.signal > bsses[bss.bssid][0].signal:
+                    bsses[bss.bssid] = (bss, bsses[bss.bssid][1])
+                bsses[bss.bssid][1][iface.name()] = bss.signal
+
+        return bsses
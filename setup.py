@@ -38,6 +38,7 @@ setup(
     long_description_content_type="text/markdown",
     packages=find_packages(),
     install_requires=requires,
+    extras_require={'analytics': ['numpy']},
     python_requires=">=2.7, !=3.0.*, !=3.1.*, !=3.2.*, !=3.3.*",
     url='https://github.com/awkman/pywifi', 
     license='MIT',
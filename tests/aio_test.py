@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+Test cases for the asyncio client of pywifi.
+"""
+
+import asyncio
+import platform
+import time
+
+import pytest
+
+import pywifi
+from pywifi import const
+from pywifi.testing import FakeWpaSupplicant
+
+pytestmark = pytest.mark.skipif(platform.system().lower() != 'linux',
+                                reason='wpa_supplicant is only on Linux')
+
+aio = pytest.importorskip('pywifi.aio')
+
+
+def run(coro):
+
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+def test_aio_scan():
+
+    async def scan(ctrl_iface_dir):
+        wifi = aio.PyWiFi(ctrl_iface_dir)
+        iface = (await wifi.interfaces())[0]
+        assert iface.name() == 'wlan0'
+        assert await iface.scan(wait=True, timeout=5)
+        bsses = await iface.scan_results()
+        await wifi.close()
+        return bsses
+
+    with FakeWpaSupplicant() as wpas:
+        bsses = run(scan(wpas.ctrl_iface_dir))
+
+    assert len(bsses) == 4
+    assert bsses[1].ssid == 'Evan'
+    assert const.AKM_TYPE_WPA2PSK in bsses[1].akm
+
+
+def test_aio_profiles_and_connect():
+
+    async def manage(wpas):
+        wifi = aio.PyWiFi(wpas.ctrl_iface_dir)
+        iface = (await wifi.interfaces())[0]
+
+        await iface.remove_all_network_profiles()
+        assert await iface.network_profiles() == []
+
+        for ssid in ['testap', 'testap2']:
+            profile = pywifi.Profile()
+            profile.ssid = ssid
+            profile.akm.append(const.AKM_TYPE_WPA2PSK)
+            profile.cipher = const.CIPHER_TYPE_CCMP
+            profile.key = '12345678'
+            await iface.add_network_profile(profile)
+
+        profiles = await iface.network_profiles()
+        assert [p.ssid for p in profiles] == ['testap', 'testap2']
+        assert const.AKM_TYPE_WPA2PSK in profiles[0].akm
+
+        await iface.remove_network_profile(profile)
+        assert len(await iface.network_profiles()) == 1
+
+        # Only one of the matched profiles is removed, as by the blocking
+        # API.
+        await iface.add_network_profile(profile)
+        await iface.add_network_profile(profile)
+        await iface.remove_network_profile(profile)
+        assert [p.ssid for p in await iface.network_profiles()] ==\
+            ['testap', 'testap2']
+        await iface.remove_network_profile(profile)
+
+        # A network which fails to be added is not configured.
+        wpas._cmd_add_network = lambda args, addr: 'FAIL\n'
+        del wpas.cmds[:]
+        assert await iface.add_network_profile(profile) is None
+        assert wpas.cmds == ['ADD_NETWORK']
+        del wpas._cmd_add_network
+
+        # A failed scan does not leave its waiter behind.
+        wpas._cmd_scan = lambda args, addr: 'FAIL\n'
+        assert not await iface.scan(wait=True, timeout=5)
+        # The done callbacks of the future run in the next iteration.
+        await asyncio.sleep(0)
+        assert iface._protocol.event_waiters == []
+        del wpas._cmd_scan
+
+        await iface.connect(profiles[0])
+        assert await iface.status() == const.IFACE_CONNECTED
+        await iface.disconnect()
+        assert await iface.status() == const.IFACE_DISCONNECTED
+
+        await wifi.close()
+
+    with FakeWpaSupplicant() as wpas:
+        run(manage(wpas))
+
+
+def test_aio_concurrent_interfaces():
+
+    async def scan_all(ctrl_iface_dir):
+        wifi = aio.PyWiFi(ctrl_iface_dir)
+        ifaces = await wifi.interfaces()
+        done = await asyncio.gather(*[
+            iface.scan(wait=True, timeout=5) for iface in ifaces])
+        results = await asyncio.gather(*[
+            iface.scan_results() for iface in ifaces])
+        await wifi.close()
+        return done, results
+
+    with FakeWpaSupplicant('wlan0') as wpas,\
+            FakeWpaSupplicant('wlan1', wpas.ctrl_iface_dir, bsses=[]):
+        done, results = run(scan_all(wpas.ctrl_iface_dir))
+
+    assert done == [True, True]
+    assert [len(bsses) for bsses in results] == [4, 0]
+
+
+def test_aio_scan_stream():
+
+    async def stream(wpas):
+        wifi = aio.PyWiFi(wpas.ctrl_iface_dir)
+        iface = (await wifi.interfaces())[0]
+        batches = []
+        async for batch in iface.scan_stream():
+            batches.append(batch)
+            if len(batches) == 2:
+                break
+            wpas.bsses.pop()
+        await wifi.close()
+        return batches
+
+    with FakeWpaSupplicant() as wpas:
+        batches = run(stream(wpas))
+
+    assert len(batches[0].new) == 4
+    assert [bss.ssid for bss in batches[1].gone] == ['joyfulness']
+    assert not batches[1].new and not batches[1].changed
+
+
+def test_aio_scan_stream_failed_scan(monkeypatch):
+
+    monkeypatch.setattr(aio, 'SCAN_RETRY_DELAY', 0.2)
+
+    async def stream(wpas):
+        wifi = aio.PyWiFi(wpas.ctrl_iface_dir)
+        iface = (await wifi.interfaces())[0]
+        start = time.time()
+        batch = await iface.scan_stream().__anext__()
+        elapsed = time.time() - start
+        await wifi.close()
+        return batch, elapsed
+
+    with FakeWpaSupplicant() as wpas:
+        fails = [2]
+        def cmd_scan(args, addr):
+            if fails[0]:
+                fails[0] -= 1
+                return 'FAIL\n'
+            return FakeWpaSupplicant._cmd_scan(wpas, args, addr)
+        wpas._cmd_scan = cmd_scan
+        batch, elapsed = run(stream(wpas))
+
+    assert len(batch.new) == 4
+    assert elapsed >= 0.4
+    assert wpas.cmds.count('SCAN') == 3
+
+
+def test_aio_request_timeout():
+
+    async def request(wpas):
+        wifi = aio.PyWiFi(wpas.ctrl_iface_dir)
+        iface = (await wifi.interfaces())[0]
+        assert await iface.scan(wait=True, timeout=5)
+
+        wpas.latency = {'STATUS': 0.2}
+        with pytest.raises(asyncio.TimeoutError):
+            await iface._request('STATUS', timeout=0.05)
+        await asyncio.sleep(0.3)
+        # The late STATUS reply is not taken as the reply of PING.
+        assert await iface._request('PING') == 'PONG\n'
+        # The new socket still receives the events.
+        assert await iface.scan(wait=True, timeout=5)
+
+        # A scan cancelled while waiting for the reply of SCAN leaves
+        # neither its waiter nor the late reply behind.
+        wpas.latency = {'SCAN': 0.2}
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(iface.scan(wait=True, timeout=5), 0.05)
+        await asyncio.sleep(0.3)
+        assert iface._protocol.event_waiters == []
+        assert await iface._request('PING') == 'PONG\n'
+        await wifi.close()
+
+    with FakeWpaSupplicant() as wpas:
+        run(request(wpas))
+
+
+def test_aio_metrics():
+
+    from pywifi import _wifiutil_linux
+    from pywifi.metrics import Metrics
+
+    async def request(ctrl_iface_dir):
+        wifi = aio.PyWiFi(ctrl_iface_dir)
+        iface = (await wifi.interfaces())[0]
+        await iface.status()
+        await iface._request('GET_NETWORK 99 ssid')
+        await wifi.close()
+
+    metrics = Metrics()
+    _wifiutil_linux.WifiUtil().set_observer(metrics)
+    try:
+        with FakeWpaSupplicant() as wpas:
+            run(request(wpas.ctrl_iface_dir))
+    finally:
+        _wifiutil_linux.WifiUtil().set_observer(None)
+
+    stats = metrics.to_dict()['wlan0']
+    assert stats['STATUS']['results']['ok'] == 1
+    assert stats['GET_NETWORK']['results']['fail'] == 1
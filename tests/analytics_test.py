@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+"""
+Test cases for the NumPy based analytics of pywifi.
+"""
+
+import pytest
+
+import pywifi
+
+np = pytest.importorskip('numpy')
+analytics = pytest.importorskip('pywifi.analytics')
+
+
+def make_frame():
+
+    def bss(bssid, ssid, freq, signal):
+        return pywifi.ScanResult(bssid, ssid, freq, signal)
+
+    frame = analytics.ScanFrame()
+    frame.append([bss('a', 'office', 2412, -50), bss('b', 'office', 2437, -70),
+                  bss('c', 'guest', 2412, -80)], timestamp=0)
+    frame.append([bss('a', 'office', 2412, -60), bss('b', 'office', 2437, -60),
+                  bss('d', 'office', 5180, -55)], timestamp=10)
+
+    return frame
+
+
+def test_freq_to_channel():
+
+    assert analytics.freq_to_channel(
+        [2412, 2437, 2484, 5180, 5825, 5955, 100]).tolist() ==\
+        [1, 6, 14, 36, 165, 1, 0]
+
+
+def test_scan_frame():
+
+    frame = make_frame()
+    assert len(frame) == 6
+    assert frame.bssids == ['a', 'b', 'c', 'd']
+    bss, freq, signal, timestamp = frame.columns()
+    assert bss.tolist() == [0, 1, 2, 0, 1, 3]
+    assert timestamp.tolist() == [0, 0, 0, 10, 10, 10]
+
+    ids, freq, signal = frame.latest()
+    assert ids.tolist() == [0, 1, 2, 3]
+    assert freq.tolist() == [2412, 2437, 2412, 5180]
+    assert signal.tolist() == [-55, -65, -80, -55]
+
+    ids, freq, signal = frame.latest(window=5)
+    assert ids.tolist() == [0, 1, 3]
+    assert signal.tolist() == [-60, -60, -55]
+
+    assert analytics.ScanFrame().latest()[0].tolist() == []
+
+
+def test_channel_analysis():
+
+    frame = make_frame()
+    freqs, counts = analytics.channel_histogram(frame)
+    assert freqs.tolist() == [2412, 2437, 5180]
+    assert counts.tolist() == [2, 1, 1]
+
+    freqs, best = analytics.best_signal(frame)
+    assert best.tolist() == [-55, -65, -55]
+
+    freqs, scores = analytics.interference_scores(
+        frame, freqs=[2412, 2432, 2462, 5200])
+    # 2437 MHz is too far from 2412 MHz to overlap it.
+    assert scores[0] == pytest.approx(
+        10 * np.log10(10 ** -5.5 + 10 ** -8.0))
+    # 2432 MHz overlaps 2437 MHz by 3/4, but not 2412 MHz.
+    assert scores[1] == pytest.approx(10 * np.log10(0.75 * 10 ** -6.5))
+    assert scores[2] == -np.inf
+    assert scores[3] == -np.inf
+
+
+def test_roaming_candidates():
+
+    frame = make_frame()
+    assert analytics.roaming_candidates(frame, 'office') ==\
+        [('a', -55), ('d', -55), ('b', -65)]
+    assert analytics.roaming_candidates(frame, 'office', current='b') ==\
+        [('a', -55), ('d', -55)]
+    assert analytics.roaming_candidates(frame, 'office', current='a') == []
+    assert analytics.roaming_candidates(frame, 'office', current='a',
+                                        window=5, hysteresis=3) ==\
+        [('d', -55)]
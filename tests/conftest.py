@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8
+
+import sys
+
+collect_ignore = []
+
+# The asyncio client needs the async syntax of Python 3.5.
+if sys.version_info < (3, 5):
+    collect_ignore.append('aio_test.py')
@@ -5,6 +5,7 @@
 Test cases for pywifi.
 """
 
+import copy
 import pytest
 import sys
 import time
@@ -18,6 +19,7 @@ import socket
 
 import pywifi
 from pywifi import const
+from pywifi.testing import FakeWpaSupplicant
 
 pywifi.set_loglevel(logging.INFO)
 
@@ -31,10 +33,16 @@ class SockMock:
         "0c:80:63:2b:0d:a8\t2417\t-79\t[WPA2-PSK-CCMP][WPS][ESS]\tKevin_H2\n"\
         "78:32:1b:63:96:05\t2422\t-91\t[WPA-PSK-CCMP][WPA2-PSK-CCMP][ESS]\tjoyfulness\n"
 
+    # Mocks attached by ATTACH cmd which receive the events.
+    attached = []
+
     def __init__(self):
         self._last_cmd = None
         self._last_state = None
         self._network_profiles = []
+        self._cmds = []
+        self._events = []
+        self._peeked = None
 
     def bind(self, *args, **kwargs):
         pass
@@ -42,11 +50,53 @@ class SockMock:
     def connect(self, *args, **kwargs):
         pass
 
+    def settimeout(self, *args, **kwargs):
+        pass
+
+    def close(self, *args, **kwargs):
+        pass
+
+    def _send_event(self, event):
+
+        for sock in SockMock.attached:
+            sock._events.append(bytearray(event, 'utf-8'))
+
+    def recv_into(self, buf, nbytes=0, flags=0):
+
+        if self._peeked is None:
+            self._peeked = bytes(self.recv())
+
+        data = self._peeked
+        if not flags & socket.MSG_PEEK:
+            self._peeked = None
+
+        size = min(len(data), nbytes or len(buf))
+        buf[:size] = data[:size]
+
+        return len(data) if flags & socket.MSG_TRUNC else size
+
     def recv(self, *args, **kwargs):
 
-        if 'SCAN' == self._last_cmd:
+        if self._cmds:
+            self._last_cmd = self._cmds.pop(0)
+        elif self in SockMock.attached:
+            if not self._events:
+                # Wait a bit like a socket with a timeout.
+                time.sleep(0.01)
+                raise socket.timeout()
+            return self._events.pop(0)
+
+        if 'ATTACH' == self._last_cmd:
+
+            SockMock.attached.append(self)
+
+            return b'OK\n'
+        elif 'SCAN' == self._last_cmd:
             #print('mock sock get scan cmd')
 
+            self._send_event('<2>CTRL-EVENT-SCAN-STARTED ')
+            self._send_event('<2>CTRL-EVENT-SCAN-RESULTS ')
+
             return b'OK\n'
         elif 'PING' == self._last_cmd:
             #print('mock sock get ping  cmd')
@@ -60,12 +110,17 @@ class SockMock:
             #print('mock sock get scan_result cmd')
 
             self._last_state = 0
+            self._send_event('<3>CTRL-EVENT-DISCONNECTED '
+                             'bssid=00:00:00:00:00:00 reason=3 '
+                             'locally_generated=1')
 
             return b'OK\n'
         elif 'SELECT_NETWORK' == self._last_cmd[0:len('SELECT_NETWORK')]:
             #print('mock sock get scan_result cmd')
 
             self._last_state = 1
+            self._send_event('<3>CTRL-EVENT-CONNECTED - Connection to '
+                             '00:00:00:00:00:00 completed [id=0 id_str=]')
 
             return b'OK\n'
         elif 'STATUS' == self._last_cmd:
@@ -153,7 +208,7 @@ class SockMock:
 
     def send(self, *args, **kwargs):
 
-        self._last_cmd = args[0].decode('utf-8')
+        self._cmds.append(args[0].decode('utf-8'))
 
 
 class Mock:
@@ -171,16 +226,123 @@ class Mock:
 def pywifi_test_patch(test_func):
 
     def core_patch(*args, **kwargs):
-        os.stat = lambda *args: Mock()
+        origins = (os.stat, os.listdir, stat.S_ISSOCK, socket.socket,
+                   os.remove)
+        os.stat = lambda *args, **kwargs: Mock()
         os.listdir = lambda *args: ['wlx000c433243ce']
         stat.S_ISSOCK = lambda *args: True
         socket.socket = lambda *args: SockMock()
         os.remove = lambda *args: True
 
-        test_func(*args, **kwargs)
+        try:
+            test_func(*args, **kwargs)
+        finally:
+            (os.stat, os.listdir, stat.S_ISSOCK, socket.socket,
+             os.remove) = origins
+            SockMock.attached = []
+            if platform.system().lower() == 'linux':
+                from pywifi import _wifiutil_linux
+                _wifiutil_linux._close_connections()
 
     return core_patch
 
+@pytest.fixture
+def wpas(monkeypatch):
+    """Serve a FakeWpaSupplicant as the only wpa_supplicant iface."""
+
+    if platform.system().lower() != 'linux':
+        pytest.skip('wpa_supplicant is only on Linux')
+
+    from pywifi import _wifiutil_linux
+
+    with FakeWpaSupplicant() as server:
+        monkeypatch.setattr(_wifiutil_linux, 'CTRL_IFACE_DIR',
+                            server.ctrl_iface_dir)
+        yield server
+
+    for conns in [_wifiutil_linux.WifiUtil._connections,
+                  _wifiutil_linux.WifiUtil._monitors]:
+        for conn in conns.values():
+            conn.close()
+        conns.clear()
+
+def test_import_time():
+
+    import subprocess
+
+    # Importing pywifi configures no logging and loads no backend, which
+    # keeps it cheap without measuring the time of a noisy machine.
+    code = '\n'.join([
+        'import logging, sys',
+        'import pywifi',
+        'assert not logging.getLogger().handlers',
+        'assert not [name for name in sys.modules if name in',
+        '            ["ctypes", "comtypes", "socket"] or',
+        '            name.startswith("pywifi._wifiutil")]'])
+    proc = subprocess.Popen(
+        [sys.executable, '-c', code],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(pywifi.__file__))),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    assert proc.returncode == 0, err.decode('utf-8')
+
+def test_sim_backend():
+
+    from pywifi.sim import Simulation
+
+    with pytest.raises(ValueError):
+        pywifi.PyWiFi(backend='nowhere')
+    assert pywifi.PyWiFi(backend='sim').interfaces()[0].name() == 'sim0'
+
+    sim = Simulation(ifaces=2, bsses=2000, scan_time=0.05,
+                     connect_time=0.05, seed=1)
+    wifi = pywifi.PyWiFi(backend=sim)
+    ifaces = wifi.interfaces()
+    assert [iface.name() for iface in ifaces] == ['sim0', 'sim1']
+    iface = ifaces[0]
+    changes = []
+    # A failing callback does not keep the others from being called.
+    def fail(old, new):
+        raise RuntimeError('callback failed')
+    iface.add_status_callback(fail)
+    iface.add_status_callback(lambda old, new: changes.append(new))
+
+    assert iface.scan_results() == []
+    iface.scan()
+    assert iface.status() == const.IFACE_SCANNING
+    assert iface.scan(wait=True)
+    bsses = iface.scan_results()
+    assert len(bsses) == 2000
+    assert len(wifi.scan_all()) == 2000
+    # The scans of each iface vary the signals.
+    assert [bss.signal for bss in bsses] !=\
+        [bss.signal for bss in ifaces[1].scan_results()]
+
+    bss = sim.add_bss(ssid='office', akm=const.AKM_TYPE_WPA2PSK)
+    sim.set_key('office', '12345678')
+    profile = pywifi.Profile()
+    profile.ssid = 'office'
+    profile.akm.append(const.AKM_TYPE_WPA2PSK)
+    profile.key = '87654321'
+    iface.add_network_profile(profile)
+    result = iface.connect(profile, wait=True)
+    assert result.status == const.CONNECT_FAILED
+    assert result.reason == 'WRONG_KEY'
+
+    iface.remove_network_profile(profile)
+    profile.key = '12345678'
+    iface.add_network_profile(profile)
+    iface.connect(profile)
+    assert iface.status() == const.IFACE_CONNECTING
+    result = iface.connect(profile, wait=True)
+    assert result.status == const.CONNECT_SUCCEEDED
+    assert iface.status_info()['bssid'] == bss.bssid
+    assert changes[-2:] == [const.IFACE_CONNECTING, const.IFACE_CONNECTED]
+
+    iface.remove_all_network_profiles()
+    assert iface.status() == const.IFACE_INACTIVE
+    assert iface.network_profiles() == []
+
 @pywifi_test_patch
 def test_interfaces():
 
@@ -200,10 +362,11 @@ def test_scan():
     wifi = pywifi.PyWiFi()
 
     iface = wifi.interfaces()[0]
-    iface.scan()
-    time.sleep(5)
+    start = time.time()
+    assert iface.scan(wait=True, timeout=5)
+    assert time.time() - start < 1
     bsses = iface.scan_results()
-    assert bsses
+    assert len(bsses) == 4
 
 def test_profile_comparison():
 
@@ -321,7 +484,6 @@ def test_connect():
     iface = wifi.interfaces()[0]
 
     iface.disconnect()
-    time.sleep(1)
     assert iface.status() in\
         [const.IFACE_DISCONNECTED, const.IFACE_INACTIVE]
 
@@ -335,12 +497,12 @@ def test_connect():
     iface.remove_all_network_profiles()
     tmp_profile = iface.add_network_profile(profile)
 
-    iface.connect(tmp_profile)
-    time.sleep(5)
+    result = iface.connect(tmp_profile, wait=True, timeout=5)
+    assert result.status == const.CONNECT_SUCCEEDED
+    assert result.elapsed < 1
     assert iface.status() == const.IFACE_CONNECTED
 
     iface.disconnect()
-    time.sleep(1)
     assert iface.status() in\
         [const.IFACE_DISCONNECTED, const.IFACE_INACTIVE]
 
@@ -352,7 +514,6 @@ def test_connect_open():
     iface = wifi.interfaces()[0]
 
     iface.disconnect()
-    time.sleep(1)
     assert iface.status() in\
         [const.IFACE_DISCONNECTED, const.IFACE_INACTIVE]
 
@@ -364,12 +525,12 @@ def test_connect_open():
     iface.remove_all_network_profiles()
     tmp_profile = iface.add_network_profile(profile)
 
-    iface.connect(tmp_profile)
-    time.sleep(5)
+    result = iface.connect(tmp_profile, wait=True, timeout=5)
+    assert result.status == const.CONNECT_SUCCEEDED
+    assert result.elapsed < 1
     assert iface.status() == const.IFACE_CONNECTED
 
     iface.disconnect()
-    time.sleep(1)
     assert iface.status() in\
         [const.IFACE_DISCONNECTED, const.IFACE_INACTIVE]
 
@@ -383,3 +544,881 @@ def test_disconnect():
 
     assert iface.status() in\
         [const.IFACE_DISCONNECTED, const.IFACE_INACTIVE]
+
+def test_network_profiles_pipeline(wpas):
+
+    wifi = pywifi.PyWiFi()
+
+    iface = wifi.interfaces()[0]
+
+    for i in range(20):
+        profile = pywifi.Profile()
+        profile.ssid = 'testap{}'.format(i)
+        profile.akm.append([const.AKM_TYPE_NONE, const.AKM_TYPE_WPAPSK,
+                            const.AKM_TYPE_WPA2PSK, const.AKM_TYPE_WPA2][i % 4])
+        profile.key = '12345678'
+        iface.add_network_profile(profile)
+
+    del wpas.cmds[:]
+    profiles = iface.network_profiles()
+
+    assert [p.ssid for p in profiles] ==\
+        ['testap{}'.format(i) for i in range(20)]
+    assert [p.akm for p in profiles[:4]] ==\
+        [[const.AKM_TYPE_NONE], [const.AKM_TYPE_WPAPSK],
+         [const.AKM_TYPE_WPA2PSK], [const.AKM_TYPE_WPA2]]
+    assert profiles[0].cipher == const.CIPHER_TYPE_CCMP
+    # proto is only queried for the WPA networks.
+    assert len([cmd for cmd in wpas.cmds if cmd.startswith('GET_NETWORK')])\
+        == 20 * 3 + 15
+
+def test_add_network_profiles(wpas):
+
+    wifi = pywifi.PyWiFi()
+    iface = wifi.interfaces()[0]
+    # Cache the profiles before adding.
+    assert iface.network_profiles() == []
+
+    profiles = []
+    for i, key in enumerate(['12345678', 'short', '87654321']):
+        profile = pywifi.Profile()
+        profile.ssid = 'testap{}'.format(i)
+        profile.akm.append(const.AKM_TYPE_WPA2PSK)
+        profile.key = key
+        profiles.append(profile)
+
+    del wpas.cmds[:]
+    # Any iterable of profiles can be added.
+    assert iface.add_network_profiles(
+        (profile for profile in profiles), save_config=True) ==\
+        [True, False, True]
+    assert wpas.cmds[-1] == 'SAVE_CONFIG'
+    assert wpas.cmds.count('ADD_NETWORK') == 3
+
+    # The network with the rejected key is removed again.
+    ssids = sorted(network['ssid'] for network in wpas.saved_networks.values())
+    assert ssids == ['"testap0"', '"testap2"']
+    assert [profile.ssid for profile in iface.network_profiles()] ==\
+        ['testap0', 'testap2']
+    assert iface.network_profiles()[1] == profiles[2]
+
+    # The scan results can be added as profiles.
+    assert iface.scan(wait=True, timeout=5)
+    bss = [bss for bss in iface.scan_results() if bss.ssid == 'Evan'][0]
+    bss.key = '12345678'
+    iface.add_network_profile(bss)
+    assert iface.network_profiles()[-1].ssid == 'Evan'
+    assert iface.network_profiles()[-1].akm == bss.akm[-1:]
+
+    # A failed ADD_NETWORK is neither configured nor cached.
+    wpas._cmd_add_network = lambda args, addr: 'FAIL\n'
+    del wpas.cmds[:]
+    iface.add_network_profile(profiles[1])
+    assert wpas.cmds == ['ADD_NETWORK']
+    assert [profile.ssid for profile in iface.network_profiles()] ==\
+        ['testap0', 'testap2', 'Evan']
+
+def test_psk(wpas, monkeypatch):
+
+    from pywifi import psk
+
+    # The test vector of IEEE 802.11i.
+    assert psk.derive_psk('IEEE', 'password') ==\
+        'f42c6fc52df0ebef9ebb4b90b38a5f902e83fe1b135a70e23aed762e9710a12e'
+    with pytest.raises(ValueError):
+        psk.derive_psk('IEEE', 'short')
+
+    pairs = [('testap{}'.format(i), 'passphrase{}'.format(i % 4))
+             for i in range(20)]
+    monkeypatch.setattr(psk, 'PARALLEL_MIN', 2)
+    psks = psk.derive_psks(pairs + [('IEEE', 'password')], processes=2)
+    assert psks[:20] == [psk._derive(pair) for pair in pairs]
+    assert psks[20] == psk.derive_psk('IEEE', 'password')
+
+    # The cached PSKs are not derived again.
+    monkeypatch.setattr(psk, '_derive', None)
+    assert psk.derive_psks(pairs) == psks[:20]
+
+    profiles = []
+    for akm in [const.AKM_TYPE_WPA2PSK, const.AKM_TYPE_NONE]:
+        profile = pywifi.Profile()
+        profile.ssid = 'IEEE'
+        profile.akm.append(akm)
+        profile.key = 'password'
+        profiles.append(profile)
+    psk.precompute_psks(profiles)
+    assert profiles[0].key_type == const.KEY_TYPE_NETWORKKEY
+    assert profiles[0].key == psks[20]
+    assert profiles[1].key_type == const.KEY_TYPE_PASSPHRASE
+
+    iface = pywifi.PyWiFi().interfaces()[0]
+    assert iface.add_network_profiles(profiles[:1]) == [True]
+    assert 'SET_NETWORK 0 psk {}'.format(psks[20]) in wpas.cmds
+
+    # A network key is sent unquoted, so it has to be 64 hex digits.
+    for key in [psks[20][:63], psks[20][:63] + 'g',
+                psks[20][:60] + '\nPING']:
+        profiles[0].key = key
+        del wpas.cmds[:]
+        with pytest.raises(ValueError):
+            iface.add_network_profile(profiles[0])
+        with pytest.raises(ValueError):
+            iface.add_network_profiles(profiles[:1])
+        assert wpas.cmds == []
+
+    # The cache does not grow past its size on a burst of misses.
+    monkeypatch.setattr(psk, '_derive', lambda pair: pair[1] * 8)
+    monkeypatch.setattr(psk, 'PSK_CACHE_SIZE', 8)
+    pairs = [('ap', 'passphrase{:02}'.format(i)) for i in range(20)]
+    assert psk.derive_psks(pairs, processes=1) ==\
+        [passphrase * 8 for _, passphrase in pairs]
+    assert len(psk._psk_cache) <= 8
+
+def test_sync_network_profiles(wpas):
+
+    wifi = pywifi.PyWiFi()
+    iface = wifi.interfaces()[0]
+
+    def profile(ssid, akm, key=None):
+        profile = pywifi.Profile()
+        profile.ssid = ssid
+        profile.akm.append(akm)
+        profile.key = key
+        return profile
+
+    # The keys set by pywifi are known while the profiles are cached.
+    assert iface.network_profiles() == []
+    iface.add_network_profiles([
+        profile('home', const.AKM_TYPE_WPA2PSK, '12345678'),
+        profile('cafe', const.AKM_TYPE_NONE),
+        profile('old', const.AKM_TYPE_WPAPSK, '12345678')])
+    iface.connect(profile('home', const.AKM_TYPE_WPA2PSK))
+
+    desired = [profile('home', const.AKM_TYPE_WPA2PSK, '12345678'),
+               profile('cafe', const.AKM_TYPE_WPA2PSK, '87654321'),
+               profile('office', const.AKM_TYPE_WPA2PSK, '12345678'),
+               profile('lab', const.AKM_TYPE_WPA2PSK, 'short')]
+    # The ciphers are not configured, so they do not take part.
+    desired[2].cipher = const.CIPHER_TYPE_TKIP
+    del wpas.cmds[:]
+    result = iface.sync_network_profiles(desired, save_config=True)
+    assert [p.ssid for p in result.added] == ['office']
+    assert [p.ssid for p in result.changed] == ['cafe']
+    assert [p.ssid for p in result.removed] == ['old']
+    assert [p.ssid for p in result.unchanged] == ['home']
+    assert [p.ssid for p in result.failed] == ['lab']
+
+    # The connected network is untouched and the changed one is updated
+    # in place.
+    assert wpas.current_network == 0
+    assert wpas.cmds.count('ADD_NETWORK') == 2
+    assert 'REMOVE_NETWORK 2' in wpas.cmds
+    assert not [cmd for cmd in wpas.cmds if cmd.startswith('SET_NETWORK 0')]
+    assert 'SET_NETWORK 1 key_mgmt WPA-PSK' in wpas.cmds
+    assert wpas.cmds[-1] == 'SAVE_CONFIG'
+    assert sorted(p.ssid for p in iface.network_profiles()) ==\
+        ['cafe', 'home', 'office']
+
+    # Syncing again sends nothing.
+    del wpas.cmds[:]
+    result = iface.sync_network_profiles(desired[:3], save_config=True)
+    assert [p.ssid for p in result.unchanged] == ['home', 'cafe', 'office']
+    assert not (result.added or result.changed or result.removed or
+                result.failed)
+    assert wpas.cmds == []
+
+    # A rotated passphrase is set with one cmd.
+    desired[0].key = 'rotated1'
+    result = iface.sync_network_profiles(desired[:3], save_config=True)
+    assert [p.ssid for p in result.changed] == ['home']
+    assert len(result.unchanged) == 2
+    assert wpas.cmds == ['SET_NETWORK 0 psk "rotated1"', 'SAVE_CONFIG']
+    assert wpas.networks[0]['psk'] == '"rotated1"'
+
+    # A network which fails to be removed is reported and kept.
+    wpas._cmd_remove_network = lambda args, addr: 'FAIL\n'
+    del wpas.cmds[:]
+    result = iface.sync_network_profiles(desired[:2])
+    assert result.removed == []
+    assert [p.ssid for p in result.failed] == ['office']
+    assert 'office' in [p.ssid for p in iface.network_profiles()]
+    del wpas._cmd_remove_network
+
+    # The profiles without keys are kept untouched.
+    open_profile = profile('cafe', const.AKM_TYPE_NONE)
+    iface.sync_network_profiles([open_profile])
+    del wpas.cmds[:]
+    result = iface.sync_network_profiles([open_profile], save_config=True)
+    assert result.unchanged == [open_profile]
+    assert not (result.added or result.changed or result.removed or
+                result.failed)
+    assert not [cmd for cmd in wpas.cmds if cmd.split()[0] in
+                ['ADD_NETWORK', 'SET_NETWORK', 'REMOVE_NETWORK',
+                 'SAVE_CONFIG']]
+
+def test_network_profiles_cache(wpas):
+
+    wifi = pywifi.PyWiFi()
+
+    iface = wifi.interfaces()[0]
+
+    profile = pywifi.Profile()
+    profile.ssid = 'testap'
+    profile.akm.append(const.AKM_TYPE_WPA2PSK)
+    profile.key = '12345678'
+    iface.add_network_profile(profile)
+
+    profiles = iface.network_profiles()
+    assert len(profiles) == 1
+
+    # The cache is updated by the profile operations without queries.
+    del wpas.cmds[:]
+    profile2 = pywifi.Profile()
+    profile2.ssid = 'testap2'
+    iface.add_network_profile(profile2)
+    profiles = iface.network_profiles()
+    assert [p.ssid for p in profiles] == ['testap', 'testap2']
+    assert profiles[0].akm == [const.AKM_TYPE_WPA2PSK]
+    assert profiles[1].akm == [const.AKM_TYPE_NONE]
+    iface.remove_network_profile(profile)
+    assert [p.ssid for p in iface.network_profiles()] == ['testap2']
+
+    # The cached profiles are not changed by the callers.
+    profiles = iface.network_profiles()
+    profiles[0].ssid = 'renamed'
+    profiles[0].akm.append(const.AKM_TYPE_WPA2PSK)
+    profiles = iface.network_profiles()
+    assert [p.ssid for p in profiles] == ['testap2']
+    assert profiles[0].akm == [const.AKM_TYPE_NONE]
+    assert not [cmd for cmd in wpas.cmds
+                if cmd.split()[0] in ['LIST_NETWORKS', 'GET_NETWORK']]
+
+    # The networks removed by others are dropped from the cache.
+    wpas.networks.clear()
+    wpas.send_event('CTRL-EVENT-NETWORK-REMOVED 1')
+    time.sleep(0.1)
+    assert iface.network_profiles() == []
+    assert 'LIST_NETWORKS' not in wpas.cmds
+
+    # The networks added by others invalidate the cache.
+    network_id = wpas.add_network('testap3')
+    wpas.send_event('CTRL-EVENT-NETWORK-ADDED {}'.format(network_id))
+    time.sleep(0.1)
+    assert [p.ssid for p in iface.network_profiles()] == ['testap3']
+    assert 'LIST_NETWORKS' in wpas.cmds
+
+def test_monitor(wpas):
+
+    from pywifi import _wifiutil_linux
+
+    wifi = pywifi.PyWiFi()
+    iface = wifi.interfaces()[0]
+    wpas.add_network('testap')
+    wpas.add_network('testap2')
+    assert len(iface.network_profiles()) == 2
+    assert len(wpas._attached) == 1
+
+    # The events are read as they arrive, so none of a burst is dropped
+    # and the cache is kept.
+    for i in range(10):
+        for j in range(100):
+            wpas.send_event('CTRL-EVENT-BSS-ADDED {} 00:11:22:33:44:55'.format(
+                i * 100 + j))
+        time.sleep(0.02)
+    wpas.networks.pop(0)
+    wpas.send_event('CTRL-EVENT-NETWORK-REMOVED 0')
+    time.sleep(0.1)
+    del wpas.cmds[:]
+    assert [p.ssid for p in iface.network_profiles()] == ['testap2']
+    assert wpas.cmds == []
+    assert len(wpas._attached) == 1
+
+    # A closed monitor detaches from wpa_s.
+    _wifiutil_linux._close_connections()
+    time.sleep(0.1)
+    assert not wpas._attached
+
+def test_bss_results(wpas):
+
+    for i in range(40):
+        wpas.add_bss(bssid='00:11:22:33:44:{:02x}'.format(i), freq=5180,
+                     level=-40 - i, flags='[WPA2-EAP-CCMP][ESS]',
+                     ssid='ap{}'.format(i), age=i, ie='dd' * 100)
+
+    wifi = pywifi.PyWiFi()
+
+    iface = wifi.interfaces()[0]
+    bsses = iface.bss_results()
+
+    # The BSSes do not fit in one reply.
+    assert len([cmd for cmd in wpas.cmds if cmd.startswith('BSS')]) > 1
+    assert len(bsses) == 44
+    assert all(isinstance(bss, pywifi.BssResult) for bss in bsses)
+    assert [bss.id for bss in bsses] == list(range(44))
+    assert bsses[1].ssid == 'Evan'
+    assert bsses[1].akm == [const.AKM_TYPE_WPA2PSK]
+    assert bsses[4].bssid == '00:11:22:33:44:00'
+    assert bsses[4].akm == [const.AKM_TYPE_WPA2]
+    assert (bsses[5].freq, bsses[5].signal, bsses[5].noise, bsses[5].age) ==\
+        (5180, -41, -95, 1)
+    assert bsses[5].ie == 'dd' * 100
+
+    assert iface.bss_results(new_only=True) == []
+    wpas.add_bss(bssid='00:11:22:33:55:00', freq=2412, level=-50,
+                 flags='[ESS]', ssid='open')
+    bsses = iface.bss_results(new_only=True)
+    assert [bss.ssid for bss in bsses] == ['open']
+    assert bsses[0].akm == []
+
+def test_long_reply(wpas):
+
+    # Over 64 KiB of SCAN_RESULTS reply.
+    for i in range(1300):
+        wpas.add_bss(bssid='00:11:22:33:{:02x}:{:02x}'.format(i // 256, i % 256),
+                     freq=5180, level=-60, flags='[WPA2-PSK-CCMP][ESS]',
+                     ssid='ap{}'.format(i))
+
+    wifi = pywifi.PyWiFi()
+
+    iface = wifi.interfaces()[0]
+    bsses = iface.scan_results()
+
+    assert len(bsses) == 1304
+    assert bsses[-1].ssid == 'ap1299'
+
+def test_truncated_scan_results():
+
+    from pywifi import _wifiutil_linux
+
+    reply = SockMock.default_scan_results
+    bsses = _wifiutil_linux.parse_scan_results(reply[:-20])
+
+    assert [bss.ssid for bss in bsses] == ['TOTOLINK N302RE', 'Evan', 'Kevin_H2']
+
+    # A line without 5 fields is skipped.
+    lines = reply.split('\n')
+    lines[2] = '00:11:22:33:44:55\t2412\t-50'
+    bsses = _wifiutil_linux.parse_scan_results('\n'.join(lines))
+    assert [bss.ssid for bss in bsses] ==\
+        ['TOTOLINK N302RE', 'Kevin_H2', 'joyfulness']
+    assert [bss.freq for bss in bsses] == [2412, 2417, 2422]
+
+def test_scan_results_flags():
+
+    from pywifi import _wifiutil_linux
+
+    reply = b'bssid / frequency / signal level / flags / ssid\n'\
+        b'00:11:22:33:44:00\t2412\t-50\t[WPA-PSK-CCMP+TKIP][WPA2-PSK-CCMP+TKIP][ESS]\tmixed\n'\
+        b'00:11:22:33:44:01\t2437\t-51\t[WPA-PSK-TKIP][ESS]\ttkip\n'\
+        b'00:11:22:33:44:02\t2462\t-52\t[WPA2-EAP-CCMP][ESS]\teap\n'\
+        b'00:11:22:33:44:03\t5180\t-53\t[WEP][ESS]\twep\n'\
+        b'00:11:22:33:44:04\t5200\t-54\t[ESS]\topen\n'
+    bsses = _wifiutil_linux.parse_scan_results(memoryview(reply))
+
+    assert [bss.akm for bss in bsses] ==\
+        [[const.AKM_TYPE_WPAPSK, const.AKM_TYPE_WPA2PSK],
+         [const.AKM_TYPE_WPAPSK], [const.AKM_TYPE_WPA2], [], []]
+    assert [bss.cipher for bss in bsses] ==\
+        [const.CIPHER_TYPE_CCMP, const.CIPHER_TYPE_TKIP,
+         const.CIPHER_TYPE_CCMP, const.CIPHER_TYPE_WEP,
+         const.CIPHER_TYPE_NONE]
+    assert (bsses[4].bssid, bsses[4].freq, bsses[4].signal) ==\
+        ('00:11:22:33:44:04', 5200, -54)
+
+def test_scan_result():
+
+    bss = pywifi.ScanResult('00:11:22:33:44:00', 'testap', 2412, -50)
+    bss.akm = [const.AKM_TYPE_WPA2PSK, const.AKM_TYPE_WPAPSK]
+    bss.cipher = const.CIPHER_TYPE_CCMP
+
+    assert bss.akm == [const.AKM_TYPE_WPAPSK, const.AKM_TYPE_WPA2PSK]
+    assert bss.auth == const.AUTH_ALG_OPEN
+    assert bss.key is None
+    assert not hasattr(bss, '__dict__')
+
+    # A ScanResult can be used as a Profile.
+    other = pywifi.ScanResult('00:11:22:33:44:01', 'testap')
+    other.akm.append(const.AKM_TYPE_WPAPSK)
+    other.akm += [const.AKM_TYPE_WPA2PSK]
+    assert other.akm == [const.AKM_TYPE_WPAPSK, const.AKM_TYPE_WPA2PSK]
+    other.process_akm()
+    assert other.akm == [const.AKM_TYPE_WPA2PSK]
+    other.key = '12345678'
+    assert other.key_type == const.KEY_TYPE_PASSPHRASE
+    other.key_type = const.KEY_TYPE_NETWORKKEY
+    assert (other.key, other.key_type) ==\
+        ('12345678', const.KEY_TYPE_NETWORKKEY)
+
+    same = pywifi.ScanResult('00:11:22:33:44:00', 'testap', 2412, -50,
+                             bss.akm_mask, const.CIPHER_TYPE_CCMP)
+    assert bss == same
+    assert len({bss, same}) == 1
+    same.signal = -51
+    assert bss != same
+    assert len({bss, same}) == 2
+
+    # A profile matches the scan results like other profiles.
+    profile = pywifi.Profile()
+    profile.ssid = 'testap'
+    profile.akm.append(const.AKM_TYPE_WPA2PSK)
+    profile.cipher = const.CIPHER_TYPE_CCMP
+    assert bss == profile
+    profile.cipher = const.CIPHER_TYPE_TKIP
+    assert bss != profile
+
+    # Only a BssResult carries the BSS fields.
+    assert not hasattr(bss, 'noise')
+    full = pywifi.BssResult('00:11:22:33:44:00', 'testap', 2412, -50,
+                            bss.akm_mask, const.CIPHER_TYPE_CCMP, id=3,
+                            noise=-95)
+    assert not hasattr(full, '__dict__')
+    assert (full.id, full.noise, full.age) == (3, -95, None)
+    assert full != bss
+    assert full == copy.copy(full)
+
+def test_profile_index():
+
+    import random
+
+    rand = random.Random(0)
+    profiles = []
+    for i in range(300):
+        profile = pywifi.Profile()
+        profile.ssid = rand.choice(['ap0', 'ap1', 'ap2', None])
+        profile.bssid = rand.choice(['00:11:22:33:44:00', None])
+        profile.akm = rand.choice([[], [const.AKM_TYPE_NONE],
+                                   [const.AKM_TYPE_WPA2PSK],
+                                   [const.AKM_TYPE_WPAPSK,
+                                    const.AKM_TYPE_WPA2PSK]])
+        profile.cipher = rand.choice([const.CIPHER_TYPE_NONE,
+                                      const.CIPHER_TYPE_CCMP])
+        profile.auth = rand.choice([const.AUTH_ALG_OPEN,
+                                    const.AUTH_ALG_SHARED])
+        profiles.append(profile)
+
+    index = pywifi.ProfileIndex(profiles)
+    for profile in profiles[:100]:
+        index.remove(profile)
+    profiles = profiles[100:]
+    assert len(index) == 200
+
+    # The index matches like the linear comparisons.
+    for pattern in profiles[:50]:
+        assert list(map(id, index.find(pattern))) ==\
+            [id(p) for p in profiles if p == pattern]
+        assert list(map(id, index.find_patterns(pattern))) ==\
+            [id(p) for p in profiles if pattern == p]
+
+    bss = pywifi.ScanResult('00:11:22:33:44:00', 'ap1', 2412, -50)
+    bss.akm = [const.AKM_TYPE_WPA2PSK]
+    bss.cipher = const.CIPHER_TYPE_CCMP
+    assert list(map(id, index.find_patterns(bss))) ==\
+        [id(p) for p in profiles if bss == p]
+
+def test_fake_wpas_latency(wpas):
+
+    from pywifi import _wifiutil_linux
+
+    wifi = pywifi.PyWiFi()
+    iface = wifi.interfaces()[0]
+    util = _wifiutil_linux.WifiUtil()
+    for i in range(4):
+        wpas.add_network('testap{}'.format(i))
+
+    wpas.latency = {'GET_NETWORK': 0.1}
+    start = time.time()
+    replies = util._send_cmds_to_wpas(
+        iface.name(), ['GET_NETWORK {} ssid'.format(i) for i in range(4)] +
+        ['PING'])
+    # The pipelined cmds are handled one at a time, in order.
+    assert 0.4 <= time.time() - start < 0.7
+    assert replies == ['"testap{}"'.format(i) for i in range(4)] +\
+        ['PONG\n']
+
+    wpas.latency = 0
+    wpas.scan_time = 0.2
+    start = time.time()
+    assert iface.scan(wait=True)
+    assert 0.2 <= time.time() - start < 1
+
+def test_reconnect(wpas):
+
+    from pywifi import _wifiutil_linux
+
+    wifi = pywifi.PyWiFi()
+    iface = wifi.interfaces()[0]
+    assert iface.scan(wait=True, timeout=5)
+    network_id = wpas.add_network('testap')
+    assert [p.id for p in iface.network_profiles()] == [str(network_id)]
+
+    conn = _wifiutil_linux.WifiUtil._connections[iface.name()]
+    sock_file = conn.sock_file
+    assert str(os.getpid()) in sock_file
+    mon = _wifiutil_linux.WifiUtil._monitors[iface.name()]
+    assert mon.conn.sock_file != sock_file
+
+    # The connections and the monitor recover from a restart of wpa_s.
+    wpas.stop()
+    wpas.start()
+    wpas.networks.clear()
+    assert iface.status() == const.IFACE_DISCONNECTED
+    assert conn.sock_file != sock_file
+    assert not os.path.exists(sock_file)
+    assert iface.network_profiles() == []
+    assert iface.scan(wait=True, timeout=5)
+
+    # Connections of the pool are reused.
+    wifi.interfaces()
+    assert _wifiutil_linux.WifiUtil._connections[iface.name()] is conn
+
+def test_request_timeout(monkeypatch, tmp_path):
+
+    if platform.system().lower() != 'linux':
+        pytest.skip('wpa_supplicant is only on Linux')
+
+    from pywifi import _wifiutil_linux
+
+    # A wpa_s which never replies.
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    server.bind(str(tmp_path / 'wlan0'))
+    monkeypatch.setattr(_wifiutil_linux, 'CTRL_IFACE_DIR', str(tmp_path))
+    monkeypatch.setattr(_wifiutil_linux, 'CTRL_IFACE_TIMEOUT', 0.1)
+    monkeypatch.setattr(_wifiutil_linux, 'RECONNECT_DELAY', 0.01)
+
+    conn = _wifiutil_linux.CtrlConnection('wlan0')
+    start = time.time()
+    assert not conn.open()
+    with pytest.raises(socket.error):
+        conn.request('PING', timeout=0.1)
+    assert time.time() - start < 5
+    assert conn.sock is None
+    server.close()
+
+def test_concurrent_requests(wpas):
+
+    import threading
+
+    from pywifi import _wifiutil_linux
+
+    for i in range(20):
+        wpas.add_network('testap{}'.format(i), key_mgmt='WPA-PSK',
+                         proto='RSN')
+
+    wifi = pywifi.PyWiFi()
+    iface = wifi.interfaces()[0]
+    util = _wifiutil_linux.WifiUtil()
+    errors = []
+    counts = []
+
+    def worker(n):
+
+        count = 0
+        try:
+            for i in range(100):
+                network_id = (n + i) % 20
+                reply = util._send_cmd_to_wpas(
+                    iface.name(),
+                    'GET_NETWORK {} ssid'.format(network_id), True)
+                assert reply == '"testap{}"'.format(network_id)
+                count += 1
+                if i % 10 == 0:
+                    assert len(iface.network_profiles()) == 20
+                    assert iface.status() == const.IFACE_DISCONNECTED
+                    count += 2
+        except Exception as err:
+            errors.append(err)
+        counts.append(count)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(16)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    assert not errors
+    print('{} requests from {} threads: {:.0f} requests/s'.format(
+        sum(counts), len(threads), sum(counts) / elapsed))
+
+def test_scan_all(wpas, monkeypatch):
+
+    import threading
+
+    def slow_scan(self, args, addr):
+
+        threading.Timer(0.5, self.send_event,
+                        ['CTRL-EVENT-SCAN-RESULTS ']).start()
+        return 'OK\n'
+
+    monkeypatch.setattr(FakeWpaSupplicant, '_cmd_scan', slow_scan)
+    bsses = [{'bssid': '14:4d:67:14:1e:44', 'freq': 2412, 'level': -50,
+              'flags': '[WPA2-PSK-CCMP][ESS]', 'ssid': 'TOTOLINK N302RE'},
+             {'bssid': '00:11:22:33:44:55', 'freq': 5180, 'level': -70,
+              'flags': '[ESS]', 'ssid': 'ap5g'}]
+    with FakeWpaSupplicant('wlan1', wpas.ctrl_iface_dir, bsses):
+        wifi = pywifi.PyWiFi()
+        assert [iface.name() for iface in wifi.interfaces()] ==\
+            ['wlan0', 'wlan1']
+
+        start = time.time()
+        results = wifi.scan_all(timeout=5)
+        assert time.time() - start < 0.9
+
+    assert len(results) == 5
+    bss, signals = results['14:4d:67:14:1e:44']
+    assert bss.signal == -50
+    assert signals == {'wlan0': -67, 'wlan1': -50}
+    bss, signals = results['00:11:22:33:44:55']
+    assert bss.ssid == 'ap5g'
+    assert signals == {'wlan1': -70}
+    assert results['ac:9e:17:31:85:fc'][1] == {'wlan0': -63}
+
+def test_scan_stream(wpas):
+
+    wifi = pywifi.PyWiFi()
+    iface = wifi.interfaces()[0]
+    stream = iface.scan_stream()
+
+    batch = next(stream)
+    assert len(batch.new) == 4
+    assert not batch.changed and not batch.gone
+
+    # Scans without changes are not reported.
+    wpas.bsses[0]['level'] = -40
+    batch = next(stream)
+    assert not batch.new and not batch.gone
+    assert [(bss.bssid, bss.signal) for bss in batch.changed] ==\
+        [('14:4d:67:14:1e:44', -40)]
+
+    gone = wpas.bsses.pop(1)
+    wpas.add_bss(bssid='00:11:22:33:44:55', freq=5180, level=-70,
+                 flags='[ESS]', ssid='ap5g')
+    batch = next(stream)
+    assert [bss.ssid for bss in batch.new] == ['ap5g']
+    assert [bss.bssid for bss in batch.gone] == [gone['bssid']]
+    assert not batch.changed
+
+    start = time.time()
+    stream = iface.scan_stream(interval=0.3)
+    next(stream)
+    wpas.bsses[0]['level'] = -45
+    next(stream)
+    assert time.time() - start >= 0.3
+
+def test_scan_stream_failed_scan(wpas, monkeypatch):
+
+    monkeypatch.setattr(pywifi.iface, 'SCAN_RETRY_DELAY', 0.2)
+    wifi = pywifi.PyWiFi()
+    iface = wifi.interfaces()[0]
+
+    # A failing scan is retried after a delay instead of in a busy loop.
+    fails = [2]
+    def cmd_scan(args, addr):
+        if fails[0]:
+            fails[0] -= 1
+            return 'FAIL\n'
+        return FakeWpaSupplicant._cmd_scan(wpas, args, addr)
+    wpas._cmd_scan = cmd_scan
+
+    start = time.time()
+    batch = next(iface.scan_stream())
+    assert time.time() - start >= 0.4
+    assert len(batch.new) == 4
+    assert wpas.cmds.count('SCAN') == 3
+
+def test_scan_table():
+
+    def bss(bssid, signal, freq=2412, ssid='ap'):
+        return pywifi.ScanResult(bssid, ssid, freq, signal)
+
+    table = pywifi.ScanTable(max_age=60, capacity=3, alpha=0.5,
+                             signal_delta=5)
+    batch = table.ingest([bss('a', -60), bss('b', -70)], now=0)
+    assert [entry.bssid for entry in batch.new] == ['a', 'b']
+    assert not batch.changed and not batch.gone
+
+    # Small signal moves are not changes, but the statistics follow them.
+    batch = table.ingest([bss('a', -63), bss('b', -70, 5180)], now=10)
+    assert not batch.new and not batch.gone
+    assert [entry.bssid for entry in batch.changed] == ['b']
+    batch = table.ingest([bss('a', -66)], now=20)
+    assert [entry.bssid for entry in batch.changed] == ['a']
+    entry = table['a']
+    assert (entry.min_signal, entry.max_signal, entry.signal) ==\
+        (-66, -60, -66)
+    assert entry.ewma_signal == -63.75
+    assert (entry.first_seen, entry.last_seen, entry.count) == (0, 20, 3)
+
+    # The least recently seen entry is evicted over the capacity.
+    batch = table.ingest([bss('c', -50), bss('d', -80)], now=30)
+    assert [entry.bssid for entry in batch.new] == ['c', 'd']
+    assert [entry.bssid for entry in batch.gone] == ['b']
+    assert [entry.bssid for entry in table] == ['a', 'c', 'd']
+
+    # The entries not seen for max_age seconds are evicted.
+    assert [entry.bssid for entry in table.expire(now=85)] == ['a']
+    batch = table.ingest([bss('d', -80)], now=100)
+    assert [entry.bssid for entry in batch.gone] == ['c']
+    assert len(table) == 1 and 'd' in table
+
+def test_connect_wait(wpas, monkeypatch):
+
+    wifi = pywifi.PyWiFi()
+    iface = wifi.interfaces()[0]
+    for ssid in ['Evan', 'Kevin_H2', 'joyfulness']:
+        wpas.add_network(ssid)
+
+    def profile(ssid):
+        profile = pywifi.Profile()
+        profile.ssid = ssid
+        return profile
+
+    result = iface.connect(profile('Evan'), wait=True, timeout=5)
+    assert result.status == const.CONNECT_SUCCEEDED
+    assert result.reason is None and result.elapsed < 1
+
+    # Leaving the current network is not taken as a failure.
+    result = iface.connect(profile('Kevin_H2'), wait=True, timeout=5)
+    assert result.status == const.CONNECT_SUCCEEDED
+    assert iface.connect(profile('Kevin_H2'), wait=True, timeout=5).status ==\
+        const.CONNECT_SUCCEEDED
+
+    assert iface.connect(profile('nowhere'), wait=True, timeout=5).status ==\
+        const.CONNECT_FAILED
+
+    def select_wrong_key(self, args, addr):
+        return 'OK\n', ['CTRL-EVENT-SSID-TEMP-DISABLED id={} ssid="x" '
+                        'auth_failures=1 duration=10 '
+                        'reason=WRONG_KEY'.format(args)]
+
+    monkeypatch.setattr(FakeWpaSupplicant, '_cmd_select_network',
+                        select_wrong_key)
+    result = iface.connect(profile('joyfulness'), wait=True, timeout=5)
+    assert result.status == const.CONNECT_FAILED
+    assert result.reason == 'WRONG_KEY'
+
+    monkeypatch.setattr(FakeWpaSupplicant, '_cmd_select_network',
+                        lambda self, args, addr: 'OK\n')
+    result = iface.connect(profile('joyfulness'), wait=True, timeout=0.3)
+    assert result.status == const.CONNECT_TIMED_OUT
+    assert 0.3 <= result.elapsed < 1
+
+def test_parse_connect_event():
+
+    if platform.system().lower() != 'linux':
+        pytest.skip('wpa_supplicant is only on Linux')
+
+    from pywifi import _wifiutil_linux
+
+    parse = _wifiutil_linux.parse_connect_event
+    assert parse('CTRL-EVENT-CONNECTED - Connection to 00:11:22:33:44:55 '
+                 'completed [id=1 id_str=]', '1') ==\
+        (const.CONNECT_SUCCEEDED, None)
+    assert parse('CTRL-EVENT-CONNECTED - Connection to 00:11:22:33:44:55 '
+                 'completed [id=0 id_str=]', '1') is None
+    assert parse('CTRL-EVENT-DISCONNECTED bssid=00:11:22:33:44:55 '
+                 'reason=15 locally_generated=1', '1') ==\
+        (const.CONNECT_FAILED, 15)
+    assert parse('CTRL-EVENT-DISCONNECTED bssid=00:11:22:33:44:55 '
+                 'reason=3 locally_generated=1', '1') is None
+
+def test_status_cache(wpas, monkeypatch):
+
+    from pywifi import _wifiutil_linux
+
+    wifi = pywifi.PyWiFi()
+    iface = wifi.interfaces()[0]
+    changes = []
+    iface.add_status_callback(lambda old, new: changes.append((old, new)))
+
+    def status_cmds():
+        return len([cmd for cmd in wpas.cmds if cmd == 'STATUS'])
+
+    assert iface.status() == const.IFACE_DISCONNECTED
+    assert iface.status() == const.IFACE_DISCONNECTED
+    assert status_cmds() == 1
+
+    # The states reported by events are read from the cache.
+    wpas.send_event('CTRL-EVENT-STATE-CHANGE id=-1 state=3 '
+                    'BSSID=00:00:00:00:00:00 SSID=')
+    time.sleep(0.1)
+    assert iface.status() == const.IFACE_SCANNING
+    assert status_cmds() == 1
+    assert changes == [(const.IFACE_DISCONNECTED, const.IFACE_SCANNING)]
+
+    # The details are read again only after the state changed.
+    assert iface.status_info()['wpa_state'] == 'DISCONNECTED'
+    assert status_cmds() == 2
+    network_id = wpas.add_network('Evan')
+    profile = pywifi.Profile()
+    profile.ssid = 'Evan'
+    iface.connect(profile)
+    # Let the monitor read the events.
+    time.sleep(0.1)
+    assert iface.status() == const.IFACE_CONNECTED
+    info = iface.status_info()
+    assert (info['id'], info['ssid']) == (str(network_id), 'Evan')
+    assert iface.status_info() == info
+    assert status_cmds() == 3
+    assert changes[-1] == (const.IFACE_DISCONNECTED, const.IFACE_CONNECTED)
+
+    iface.disconnect()
+    assert iface.status() == const.IFACE_DISCONNECTED
+
+    # A stale state is read again.
+    monkeypatch.setattr(_wifiutil_linux, 'STATE_MAX_AGE', 0)
+    count = status_cmds()
+    iface.status()
+    assert status_cmds() == count + 1
+    _wifiutil_linux.WifiUtil._status_callbacks.clear()
+
+def test_metrics(wpas):
+
+    import json
+    from pywifi import _wifiutil_linux, metrics
+
+    wifi = pywifi.PyWiFi()
+    iface = wifi.interfaces()[0]
+    util = _wifiutil_linux.WifiUtil()
+    for i in range(4):
+        wpas.add_network('testap{}'.format(i))
+
+    recorder = wifi.enable_metrics()
+    try:
+        wpas.latency = {'GET_NETWORK': 0.01}
+        assert len(util._list_network_profiles(iface.name())) == 4
+        wpas.latency = 0
+        assert util._send_cmd_to_wpas(
+            iface.name(), 'GET_NETWORK 99 ssid', True).startswith('FAIL')
+
+        wpas.latency = {'PING': 1}
+        with pytest.raises(socket.timeout):
+            util._connections[iface.name()].request('PING', timeout=0.05)
+        wpas.latency = 0
+    finally:
+        wifi.disable_metrics()
+    util._send_cmd_to_wpas(iface.name(), 'PING', True)
+
+    stats = recorder.to_dict()[iface.name()]
+    assert set(stats) == set(['LIST_NETWORKS', 'GET_NETWORK', 'PING'])
+    # 4 networks of 3 fields and the failed cmd.
+    assert stats['GET_NETWORK']['count'] == 13
+    assert stats['GET_NETWORK']['results'] == {
+        'ok': 12, 'fail': 1, 'timeout': 0, 'error': 0}
+    assert stats['GET_NETWORK']['seconds'] >= 0.01
+    assert stats['LIST_NETWORKS']['sent_bytes'] == len('LIST_NETWORKS')
+    assert stats['LIST_NETWORKS']['received_bytes'] > 0
+    assert stats['PING']['results']['timeout'] == 1
+    assert recorder.busiest(1)[0][:2] == (iface.name(), 'GET_NETWORK')
+    assert json.loads(recorder.to_json())[iface.name()]['PING']['count'] == 1
+
+    text = recorder.to_prometheus()
+    assert '# TYPE pywifi_ctrl_request_seconds histogram' in text
+    assert 'pywifi_ctrl_request_seconds_count{{iface="{}",cmd="GET_NETWORK"}}'\
+        ' 13'.format(iface.name()) in text
+    assert 'pywifi_ctrl_results_total{{iface="{}",cmd="PING",'\
+        'result="timeout"}} 1'.format(iface.name()) in text
+
+    with pytest.raises(NotImplementedError):
+        pywifi.PyWiFi(backend='sim').enable_metrics()